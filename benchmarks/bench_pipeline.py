@@ -0,0 +1,314 @@
+"""
+Бенчмарк пайплайна на синтетических данных.
+
+Для каждого сценария (формат x количество строк) генерируется файл и
+замеряются этапы DataPipeline по отдельности (read, detect, filter,
+serialize) и полный process_file с загрузкой в локальную замену S3.
+
+Время - медиана и минимум по --repeat запускам (после --warmup прогревочных),
+пропускная способность - строк/с и МБ/с входного файла по медиане. Для
+process_file замеряется и максимальная задержка цикла событий (loop_lag_max_ms):
+насколько другие задачи (наблюдение за папкой, heartbeat, загрузки) ждут,
+пока обработка файла занимает поток цикла событий. Память
+замеряется отдельным запуском под tracemalloc (аллокации Python и numpy;
+буферы Arrow не учитываются - для них смотрите пиковый RSS процесса).
+
+Примеры:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --rows 1000000 --formats csv parquet --repeat 5
+    python benchmarks/bench_pipeline.py --save-baseline              # обновить benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --fail-on-regression         # сравнение с baseline, код 1 при регрессии
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+benchmarks_dir = Path(__file__).resolve().parent
+for path in (benchmarks_dir.parent, benchmarks_dir.parent / 'src'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from config import config
+from dataset import ENCODINGS, FORMATS, SALARY_DISTRIBUTIONS, generate_employees, write_dataset
+from local_s3 import make_local_storage
+from output_writers import iter_csv_chunks, write_parquet
+from pipeline import DataPipeline
+from stage_metrics import _peak_rss_kb
+
+BASELINE_PATH = benchmarks_dir / 'baseline.json'
+STAGES = ('read', 'detect', 'filter', 'serialize', 'process_file')
+
+
+def bench_config(work_dir: Path, **overrides) -> Dict[str, Any]:
+    """
+    Конфигурация пайплайна из PIPELINE_CONFIG с папками во временном каталоге.
+    Состояние между файлами (журнал, индекс дубликатов, микропакеты, кэш Excel)
+    отключено: каждый запуск обрабатывает файл с нуля.
+    """
+    bench = dict(config.PIPELINE_CONFIG)
+    bench.update({
+        'watch_folder': str(work_dir / "incoming"),
+        'processed_folder': str(work_dir / "processed"),
+        'temp_folder': str(work_dir / "temp"),
+        'log_folder': str(work_dir / "logs"),
+        'ledger_path': None,
+        'cross_file_dedup': False,
+        'micro_batch': False,
+        'stream_checkpoints': False,
+        'excel_cache_folder': None,
+        'profile_sample_every': 0,
+        'profile_patterns': [],
+    })
+    bench.update(overrides)
+    return bench
+
+
+async def watch_loop_lag(lags: List[float], interval: float = 0.001) -> None:
+    """Задержки пробуждения задачи, спящей interval секунд (сколько цикл событий был занят)."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def measure(action: Callable[[], Awaitable[Any]], repeat: int, warmup: int,
+                  prepare: Optional[Callable[[], None]] = None, loop_lag: bool = False) -> Dict[str, Any]:
+    """
+    Время выполнения action (prepare выполняется перед каждым запуском вне замера),
+    пик памяти tracemalloc и, если loop_lag, максимальная задержка цикла
+    событий - в отдельных запусках (наблюдатель задержки конкурирует с
+    потоками обработки за GIL и исказил бы время).
+    """
+    timings = []
+    for run in range(warmup + repeat):
+        if prepare is not None:
+            prepare()
+        started = time.perf_counter()
+        await action()
+        if run >= warmup:
+            timings.append(time.perf_counter() - started)
+
+    lags = []
+    if loop_lag:
+        if prepare is not None:
+            prepare()
+        watcher = asyncio.create_task(watch_loop_lag(lags))
+        await asyncio.sleep(0)  # Наблюдатель запускается до первого блокирующего вызова action
+        try:
+            await action()
+        finally:
+            watcher.cancel()
+
+    if prepare is not None:
+        prepare()
+    tracemalloc.start()
+    try:
+        await action()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    report = {
+        'median_s': round(statistics.median(timings), 6),
+        'min_s': round(min(timings), 6),
+        'runs': len(timings),
+        'tracemalloc_peak_mb': round(peak / 1024 / 1024, 3),
+    }
+    if loop_lag:
+        report['loop_lag_max_ms'] = round(max(lags, default=0.0) * 1000, 3)
+    return report
+
+
+async def bench_scenario(work_dir: Path, fmt: str, rows: int, args) -> Dict[str, Any]:
+    """Замер этапов и process_file для одного формата и размера."""
+    df = generate_employees(rows, args.extra_columns, args.distribution, args.duplicates, args.nulls, args.seed)
+    source = write_dataset(df, work_dir / "datasets" / f"employees_{rows}.{fmt}", encoding=args.encoding)
+    size_mb = source.stat().st_size / 1024 / 1024
+    del df
+
+    storage = make_local_storage(latency_ms=args.latency_ms, bandwidth_mbps=args.bandwidth_mbps)
+    pipeline = DataPipeline(storage, bench_config(work_dir / f"pipeline_{fmt}_{rows}"))
+    state: Dict[str, Any] = {}
+
+    async def read():
+        state['frame'] = await pipeline._load_frame(source)
+
+    async def detect():
+        pipeline._salary_columns_cache.clear()  # Холодное определение, без кэша по заголовку
+        state['salary_columns'] = pipeline._find_salary_columns(state['frame'])
+
+    async def filter_rows():
+        state['processed'], state['stats'] = pipeline.backend.filter(
+            state['frame'], state['salary_columns'], pipeline.filter, pipeline.filter_rules)
+
+    async def serialize():
+        processed = state['processed']
+        result = {'records_processed': rows, 'filtered_by_salary': state['stats'].get('filtered_count', 0)}
+        if pipeline.output_format == 'parquet':
+            sink = io.BytesIO()
+            write_parquet(processed, sink, pipeline._output_metadata(len(processed), source, result),
+                          compression=pipeline.parquet_compression,
+                          row_group_size=pipeline.parquet_row_group_size)
+            state['bytes_out'] = sink.tell()
+        else:
+            header = pipeline._csv_header(len(processed), source, result)
+            state['bytes_out'] = sum(len(chunk) for chunk in
+                                     iter_csv_chunks(processed, header, pipeline.csv_chunk_rows))
+
+    target = pipeline.watch_folder / source.name
+
+    def copy_source():
+        shutil.copyfile(source, target)
+
+    async def process_file():
+        result = await pipeline.process_file(target)
+        if not result['success']:
+            raise RuntimeError(f"process_file завершился с ошибкой: {result['error']}")
+        state['records_filtered'] = result['records_filtered']
+
+    report = {'file_bytes': source.stat().st_size, 'rows': rows, 'stages': {}}
+    for name, action, prepare in (('read', read, None), ('detect', detect, None),
+                                  ('filter', filter_rows, None), ('serialize', serialize, None),
+                                  ('process_file', process_file, copy_source)):
+        stage_report = await measure(action, args.repeat, args.warmup, prepare, loop_lag=name == 'process_file')
+        stage_report['rows_per_s'] = round(rows / stage_report['median_s']) if stage_report['median_s'] else None
+        stage_report['mb_per_s'] = round(size_mb / stage_report['median_s'], 2) if stage_report['median_s'] else None
+        report['stages'][name] = stage_report
+
+    report['bytes_out'] = state['bytes_out']
+    report['records_filtered'] = state['records_filtered']
+    report['s3_requests'] = storage.local.requests
+    await pipeline.close()
+    return report
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Сравнение медиан с baseline. Returns: список регрессий (медиана выросла больше чем на tolerance).
+    """
+    regressions = []
+    print(f"\n📊 Сравнение с baseline ({baseline.get('created_at', '?')}), допуск {tolerance:.0%}:")
+    print(f"   {'сценарий':<22}{'этап':<14}{'baseline, с':>14}{'сейчас, с':>14}{'изменение':>12}")
+    for scenario, report in results['scenarios'].items():
+        base_scenario = baseline.get('scenarios', {}).get(scenario)
+        if base_scenario is None:
+            print(f"   {scenario:<22}нет в baseline")
+            continue
+        for name, stage_report in report['stages'].items():
+            base = base_scenario['stages'].get(name)
+            if not base or not base['median_s']:
+                continue
+            ratio = stage_report['median_s'] / base['median_s']
+            mark = ''
+            if ratio > 1 + tolerance:
+                mark = ' ⚠️'
+                regressions.append(f"{scenario}/{name}: x{ratio:.2f}")
+            elif ratio < 1 - tolerance:
+                mark = ' 🚀'
+            print(f"   {scenario:<22}{name:<14}{base['median_s']:>14.4f}{stage_report['median_s']:>14.4f}"
+                  f"{ratio - 1:>+12.1%}{mark}")
+    return regressions
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"\n⏱️  Результаты ({results['meta']['repeat']} запусков, медиана):")
+    print(f"   {'сценарий':<22}{'этап':<14}{'время, с':>10}{'строк/с':>12}{'МБ/с':>10}{'пик, МБ':>10}")
+    for scenario, report in results['scenarios'].items():
+        for name, stage_report in report['stages'].items():
+            print(f"   {scenario:<22}{name:<14}{stage_report['median_s']:>10.4f}"
+                  f"{stage_report['rows_per_s'] or 0:>12,}{stage_report['mb_per_s'] or 0:>10.2f}"
+                  f"{stage_report['tracemalloc_peak_mb']:>10.2f}")
+        if 'loop_lag_max_ms' in report['stages'].get('process_file', {}):
+            print(f"   {scenario:<22}{'loop lag':<14}{report['stages']['process_file']['loop_lag_max_ms']:>10.1f} мс (макс.)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов DataPipeline на синтетических данных")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['csv', 'parquet', 'jsonl'])
+    parser.add_argument('--extra-columns', type=int, default=4)
+    parser.add_argument('--distribution', choices=SALARY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--duplicates', type=float, default=0.02, help="Доля дубликатов строк")
+    parser.add_argument('--nulls', type=float, default=0.01, help="Доля пропусков зарплаты")
+    parser.add_argument('--encoding', choices=ENCODINGS, default='utf-8')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Задержка локального S3 на запрос")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0, help="Пропускная способность локального S3")
+    parser.add_argument('--output', type=Path, help="Файл результатов JSON (по умолчанию benchmarks/results/)")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="Сохранить результаты как baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Допустимый рост медианы")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help="Логи пайплайна")
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'meta': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'compute_backend': config.PIPELINE_CONFIG.get('compute_backend', 'pandas'),
+            'output_format': config.PIPELINE_CONFIG.get('output_format', 'csv'),
+            **{key: value for key, value in vars(args).items()
+               if key not in ('output', 'baseline', 'save_baseline', 'fail_on_regression', 'verbose')},
+        },
+        'scenarios': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='pipeline_bench_') as work:
+        for fmt in args.formats:
+            for rows in args.rows:
+                scenario = f"{fmt}-{rows}"
+                print(f"🏃 {scenario}")
+                results['scenarios'][scenario] = await bench_scenario(Path(work), fmt, rows, args)
+    results['meta']['peak_rss_mb'] = round((_peak_rss_kb() or 0) / 1024, 1)
+    print_results(results)
+
+    output = args.output or benchmarks_dir / 'results' / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"\n💾 Результаты: {output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"💾 Baseline обновлен: {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️  Регрессии: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,242 @@
+"""
+Микробенчмарки операций AsyncObjectStorage.
+
+Операции upload, download, download_version, list_files, list_versions,
+file_exists и delete_file выполняются при разной конкурентности и размерах
+объектов. Для каждой комбинации: ops/s, задержка p50/p99 (мс) и МБ/с.
+
+По умолчанию используется локальная замена S3 (local_s3.LocalS3) с
+имитацией задержки сети и пропускной способности одного соединения. Запросы
+проходят через executor и boto3, но не через пул соединений urllib3 - для
+подбора max_pool_connections запускайте против moto server или MinIO:
+
+    python benchmarks/bench_s3.py
+    python benchmarks/bench_s3.py --concurrency 1 8 32 64 --executor-workers 64
+    python benchmarks/bench_s3.py --endpoint http://localhost:9000 --bucket bench --create-bucket --latency-ms 20
+
+Ключи для --endpoint берутся из S3_ACCESS_KEY / S3_SECRET_KEY (.env).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+
+benchmarks_dir = Path(__file__).resolve().parent
+for path in (benchmarks_dir.parent, benchmarks_dir.parent / 'src'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from async_s3_client import AsyncObjectStorage
+from config import config
+from local_s3 import inject_latency, make_local_storage
+
+# Порядок важен: delete_file удаляет объекты, созданные для остальных операций
+OPERATIONS = ('upload', 'download', 'download_version', 'list_files', 'list_versions', 'file_exists', 'delete_file')
+
+SIZE_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 * 1024}
+
+
+def parse_size(value: str) -> int:
+    """'4kb', '1mb', '512' -> байты."""
+    value = value.strip().lower()
+    for unit in ('kb', 'mb', 'b'):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(value)
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int, bytes_moved: int) -> Dict[str, Any]:
+    values = np.array(latencies) * 1000
+    return {
+        'ops': len(latencies),
+        'errors': errors,
+        'ops_per_s': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(float(np.percentile(values, 50)), 2) if len(values) else None,
+        'p99_ms': round(float(np.percentile(values, 99)), 2) if len(values) else None,
+        'mean_ms': round(float(values.mean()), 2) if len(values) else None,
+        'mb_per_s': round(bytes_moved / 1024 / 1024 / elapsed, 2) if elapsed and bytes_moved else None,
+    }
+
+
+def format_line(operation: str, size: int, concurrency: int, summary: Dict[str, Any]) -> str:
+    line = (f"   {operation:<18}{size:>10} б  c={concurrency:<4}{summary['ops_per_s'] or 0:>10.1f} ops/s"
+            f"  p50 {summary['p50_ms'] or 0:>8.2f} мс  p99 {summary['p99_ms'] or 0:>8.2f} мс")
+    if summary['mb_per_s'] is not None:
+        line += f"  {summary['mb_per_s']:>8.2f} МБ/с"
+    if summary['errors']:
+        line += f"  ошибок: {summary['errors']}"
+    return line
+
+
+async def run_batch(call: Callable[[int], Awaitable[bool]], ops: int, concurrency: int,
+                    bytes_per_op: int = 0) -> Dict[str, Any]:
+    """ops вызовов call(i), не больше concurrency одновременно; ошибкой считается False."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await call(i)
+            latencies.append(time.perf_counter() - started)
+            if ok is False or ok is None:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(ops)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, errors, bytes_per_op * (ops - errors))
+
+
+async def bench_size(storage: AsyncObjectStorage, size: int, concurrency: int, args,
+                     work_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """Все операции для одного размера объекта и уровня конкурентности."""
+    prefix = f"{args.prefix}/{size}b_c{concurrency}"
+    keys = [f"{prefix}/object-{i:05d}.bin" for i in range(args.keys)]
+    source = work_dir / f"source_{size}.bin"
+    if not source.exists():
+        source.write_bytes(os.urandom(size))
+
+    # Подготовка (без замера): первая версия каждого объекта
+    first_versions = {}
+    for key in keys:
+        first_versions[key] = await storage.upload_with_versioning(str(source), key)
+
+    def key_for(i: int) -> str:
+        return keys[i % len(keys)]
+
+    def target(i: int) -> str:
+        return str(work_dir / "downloads" / f"{i % (concurrency * 2)}.bin")
+
+    calls = {
+        'upload': (lambda i: storage.upload(str(source), key_for(i)), size),
+        'download': (lambda i: storage.download(key_for(i), target(i)), size),
+        'download_version': (lambda i: storage.download_version(key_for(i), target(i),
+                                                                first_versions[key_for(i)]), size),
+        'list_files': (lambda i: _not_empty(storage.list_files(prefix)), 0),
+        'list_versions': (lambda i: _not_empty(storage.list_versions(key_for(i))), 0),
+        'file_exists': (lambda i: storage.file_exists(key_for(i)), 0),
+        'delete_file': (lambda i: storage.delete_file(key_for(i)), 0),
+    }
+
+    report = {}
+    for operation in args.operations:
+        call, bytes_per_op = calls[operation]
+        ops = len(keys) if operation == 'delete_file' else args.ops
+        report[operation] = await run_batch(call, ops, concurrency, bytes_per_op)
+        print(format_line(operation, size, concurrency, report[operation]))
+
+    if 'delete_file' not in args.operations:
+        await storage.delete_files(keys)
+    return report
+
+
+async def _not_empty(result: Awaitable[list]) -> bool:
+    return bool(await result)
+
+
+def make_storage(args) -> AsyncObjectStorage:
+    if args.endpoint is None:
+        return make_local_storage(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                  bandwidth_mbps=args.bandwidth_mbps)
+    storage = AsyncObjectStorage(
+        key_id=config.S3_CONFIG['access_key'],
+        secret=config.S3_CONFIG['secret_key'],
+        endpoint=args.endpoint,
+        container=args.bucket,
+        region=config.S3_CONFIG.get('region', 'ru-1'),
+        verify_ssl=config.S3_CONFIG.get('verify_ssl', False)
+    )
+    if args.latency_ms or args.jitter_ms:
+        inject_latency(storage.s3_client, args.latency_ms, args.jitter_ms)
+    return storage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Микробенчмарки операций AsyncObjectStorage")
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[4 * 1024, 1024 * 1024, 8 * 1024 * 1024],
+                        help="Размеры объектов: 4kb 1mb 16mb")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--ops', type=int, default=64, help="Операций на комбинацию")
+    parser.add_argument('--keys', type=int, default=16, help="Разных объектов на комбинацию")
+    parser.add_argument('--executor-workers', type=int,
+                        help="Потоков в executor цикла событий (по умолчанию как в asyncio)")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Задержка на запрос")
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help="Случайная добавка к задержке")
+    parser.add_argument('--bandwidth-mbps', type=float, default=50.0,
+                        help="Пропускная способность одного соединения (только локальная замена S3), 0 - без ограничения")
+    parser.add_argument('--endpoint', help="S3 endpoint (moto server, MinIO) вместо локальной замены")
+    parser.add_argument('--bucket', default=config.S3_CONFIG['bucket'])
+    parser.add_argument('--create-bucket', action='store_true', help="Создать бакет и включить версионирование")
+    parser.add_argument('--prefix', default='benchmark')
+    parser.add_argument('--output', type=Path, help="Файл результатов JSON (по умолчанию benchmarks/results/)")
+    parser.add_argument('--verbose', action='store_true', help="Логи клиента")
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    loop = asyncio.get_running_loop()
+    if args.executor_workers:
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=args.executor_workers))
+    default_workers = min(32, (os.cpu_count() or 1) + 4)
+
+    storage = make_storage(args)
+    if args.create_bucket:
+        try:
+            await storage._run_in_executor(storage.s3_client.create_bucket, Bucket=args.bucket)
+        except Exception as e:
+            print(f"⚠️ Бакет не создан: {e}")
+        await storage.enable_versioning()
+
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'executor_workers': args.executor_workers or default_workers,
+            'max_pool_connections': storage.s3_client.meta.config.max_pool_connections,
+            'storage': args.endpoint or 'local_s3',
+            **{key: value for key, value in vars(args).items() if key not in ('output', 'verbose')},
+        },
+        'results': {},
+    }
+    print(f"🏃 Хранилище: {results['meta']['storage']}, потоков executor: {results['meta']['executor_workers']}, "
+          f"соединений boto3: {results['meta']['max_pool_connections']}")
+
+    with tempfile.TemporaryDirectory(prefix='s3_bench_') as work:
+        work_dir = Path(work)
+        (work_dir / "downloads").mkdir()
+        for size in args.sizes:
+            for concurrency in args.concurrency:
+                report = await bench_size(storage, size, concurrency, args, work_dir)
+                for operation, summary in report.items():
+                    results['results'].setdefault(operation, {}).setdefault(str(size), {})[str(concurrency)] = summary
+
+    output = args.output or benchmarks_dir / 'results' / f"s3_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"\n💾 Результаты: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,144 @@
+"""
+Генератор синтетических наборов данных сотрудников для бенчмарков.
+
+Результат воспроизводим: одинаковые параметры и seed дают одинаковый файл.
+
+    df = generate_employees(100_000, extra_columns=5, duplicate_ratio=0.05)
+    write_dataset(df, Path('employees.csv'), encoding='cp1251')
+
+Запуск из командной строки:
+    python benchmarks/dataset.py data/incoming/employees_1m.csv --rows 1000000
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = ['Иван', 'Петр', 'Мария', 'Анна', 'Елена', 'Алексей', 'Ольга', 'Дмитрий',
+               'Наталья', 'Сергей', 'Татьяна', 'Андрей', 'Ирина', 'Михаил', 'Светлана']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+              'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Лебедев']
+DEPARTMENTS = ['IT', 'HR', 'Финансы', 'Продажи', 'Маркетинг', 'Логистика', 'Юристы', 'Производство']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Самара']
+
+SALARY_DISTRIBUTIONS = ('lognormal', 'normal', 'uniform', 'bimodal')
+FORMATS = ('csv', 'jsonl', 'json', 'parquet', 'feather', 'xlsx')
+ENCODINGS = ('utf-8', 'utf-8-sig', 'cp1251')
+
+
+def generate_salaries(rng: np.random.Generator, rows: int, distribution: str = 'lognormal') -> np.ndarray:
+    """Зарплаты в рублях, округленные до 100."""
+    if distribution == 'lognormal':
+        values = rng.lognormal(mean=np.log(70000), sigma=0.5, size=rows)
+    elif distribution == 'normal':
+        values = rng.normal(loc=80000, scale=25000, size=rows)
+    elif distribution == 'uniform':
+        values = rng.uniform(20000, 300000, size=rows)
+    elif distribution == 'bimodal':
+        senior = rng.random(rows) < 0.3
+        values = np.where(senior, rng.normal(180000, 30000, rows), rng.normal(50000, 10000, rows))
+    else:
+        raise ValueError(f"Неизвестное распределение зарплат: {distribution}, "
+                         f"доступны: {', '.join(SALARY_DISTRIBUTIONS)}")
+    return (np.clip(values, 15000, 950000) // 100 * 100).astype(np.int64)
+
+
+def generate_employees(rows: int, extra_columns: int = 0, salary_distribution: str = 'lognormal',
+                       duplicate_ratio: float = 0.0, null_ratio: float = 0.0, seed: int = 42) -> pd.DataFrame:
+    """
+    Синтетический набор сотрудников (колонки как в примерах data/processed/archive).
+    Дополнительные числовые колонки содержат отрицательные значения, поэтому
+    не определяются пайплайном как зарплата.
+
+    Args:
+        rows: Количество строк (вместе с дубликатами)
+        extra_columns: Дополнительные колонки (чередуются числовые и текстовые)
+        salary_distribution: lognormal, normal, uniform или bimodal
+        duplicate_ratio: Доля строк - точных копий других строк
+        null_ratio: Доля пропусков в колонке salary
+        seed: Seed генератора
+    """
+    rng = np.random.default_rng(seed)
+    unique_rows = max(rows - int(rows * duplicate_ratio), 1)
+
+    df = pd.DataFrame({
+        'id': np.arange(1, unique_rows + 1),
+        'name': (pd.Series(rng.choice(FIRST_NAMES, unique_rows)) + ' '
+                 + pd.Series(rng.choice(LAST_NAMES, unique_rows))),
+        'age': rng.integers(20, 66, unique_rows),
+        'city': rng.choice(CITIES, unique_rows),
+        'department': rng.choice(DEPARTMENTS, unique_rows),
+        'salary': generate_salaries(rng, unique_rows, salary_distribution).astype(float),
+        'join_date': (pd.Timestamp('2010-01-01')
+                      + pd.to_timedelta(rng.integers(0, 5800, unique_rows), unit='D')).strftime('%Y-%m-%d'),
+    })
+    for number in range(extra_columns):
+        name = f"extra_{number + 1}"
+        if number % 2 == 0:
+            df[name] = rng.normal(0, 1, unique_rows).round(4)
+        else:
+            df[name] = rng.choice(['альфа', 'бета', 'гамма', 'дельта'], unique_rows)
+
+    if null_ratio > 0:
+        df.loc[rng.random(unique_rows) < null_ratio, 'salary'] = np.nan
+
+    if rows > unique_rows:
+        duplicates = df.iloc[rng.integers(0, unique_rows, rows - unique_rows)]
+        df = pd.concat([df, duplicates], ignore_index=True)
+        df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+    return df
+
+
+def write_dataset(df: pd.DataFrame, path: Path, fmt: str = None, encoding: str = 'utf-8') -> Path:
+    """
+    Запись набора в файл. Формат по умолчанию - по расширению файла;
+    encoding применяется к текстовым форматам (csv, jsonl, json).
+    """
+    path = Path(path)
+    fmt = (fmt or path.suffix.lstrip('.')).lower()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == 'csv':
+        df.to_csv(path, index=False, encoding=encoding)
+    elif fmt in ('jsonl', 'ndjson'):
+        df.to_json(path, orient='records', lines=True, force_ascii=False)
+        _reencode(path, encoding)
+    elif fmt == 'json':
+        df.to_json(path, orient='records', force_ascii=False)
+        _reencode(path, encoding)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt in ('feather', 'arrow'):
+        df.to_feather(path)
+    elif fmt == 'xlsx':
+        df.to_excel(path, index=False)
+    else:
+        raise ValueError(f"Неподдерживаемый формат: {fmt}, доступны: {', '.join(FORMATS)}")
+    return path
+
+
+def _reencode(path: Path, encoding: str) -> None:
+    if encoding.lower() not in ('utf-8', 'utf8'):
+        path.write_bytes(path.read_text(encoding='utf-8').encode(encoding))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетического набора сотрудников")
+    parser.add_argument('path', type=Path, help="Файл результата (формат по расширению)")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--extra-columns', type=int, default=0)
+    parser.add_argument('--distribution', choices=SALARY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--duplicates', type=float, default=0.0, help="Доля дубликатов строк")
+    parser.add_argument('--nulls', type=float, default=0.0, help="Доля пропусков зарплаты")
+    parser.add_argument('--encoding', choices=ENCODINGS, default='utf-8')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    df = generate_employees(args.rows, args.extra_columns, args.distribution,
+                            args.duplicates, args.nulls, args.seed)
+    path = write_dataset(df, args.path, encoding=args.encoding)
+    print(f"📝 {path}: {len(df)} строк, {path.stat().st_size} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Локальная замена S3 для бенчмарков: хранилище в памяти, подключаемое к
+клиенту boto3 через событие before-send.
+
+Запросы проходят через весь код AsyncObjectStorage и boto3 (executor,
+сериализация, s3transfer, разбор ответов), но вместо сети обрабатываются
+в процессе. Задержка сети и пропускная способность задаются параметрами:
+
+    storage = make_local_storage(latency_ms=20, bandwidth_mbps=100)
+    await storage.upload('employees.csv', 'processed/employees.csv')
+
+Поддерживаются операции, которые использует пайплайн: Put/Get/Head/Delete,
+DeleteObjects, CopyObject, ListObjectsV2, ListObjectVersions, версионирование
+бакета и multipart upload (включая UploadPartCopy), Range в GetObject.
+"""
+import hashlib
+import itertools
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from botocore.awsrequest import AWSResponse
+
+src_dir = str(Path(__file__).resolve().parent.parent / 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from async_s3_client import AsyncObjectStorage
+
+S3_NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+LIST_PAGE_SIZE = 1000
+LOCAL_ENDPOINT = 'http://s3.local.test'
+
+
+class _RawBody:
+    """Тело ответа для AWSResponse (stream() для content, read() для StreamingBody)."""
+
+    def __init__(self, data: bytes):
+        self._data = data
+        self._position = 0
+
+    def stream(self, **kwargs):
+        yield self.read()
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        end = len(self._data) if amt is None else min(self._position + amt, len(self._data))
+        chunk = self._data[self._position:end]
+        self._position = end
+        return chunk
+
+    def close(self) -> None:
+        pass
+
+
+class LocalS3:
+    """
+    S3 в памяти (один бакет) с имитацией задержки и пропускной способности.
+
+    Args:
+        bucket: Имя бакета
+        latency_ms: Задержка на каждый запрос (время до первого байта)
+        jitter_ms: Случайная добавка к задержке (0..jitter_ms)
+        bandwidth_mbps: Пропускная способность (МБ/с) для тела запроса и ответа, 0 - без ограничения
+        seed: Seed генератора jitter (воспроизводимость)
+    """
+
+    def __init__(self, bucket: str = 'benchmark', latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 bandwidth_mbps: float = 0.0, seed: int = 42):
+        self.bucket = bucket
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.versioning = 'Disabled'
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._versions: Dict[str, List[Dict[str, Any]]] = {}  # ключ -> версии (последняя - текущая)
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+
+    # --- Подключение к boto3 ---
+
+    def attach(self, client) -> None:
+        """Обработка всех запросов клиента boto3 этим хранилищем."""
+        client.meta.events.register('before-send.s3', self._handle)
+
+    def objects(self) -> Dict[str, bytes]:
+        """Текущие версии объектов (для проверок)."""
+        with self._lock:
+            return {key: versions[-1]['data'] for key, versions in self._versions.items()
+                    if not versions[-1]['delete_marker']}
+
+    def _handle(self, request, **kwargs) -> AWSResponse:
+        url = urlsplit(request.url)
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        key = unquote(url.path.lstrip('/'))
+        if url.hostname and not url.hostname.startswith(f"{self.bucket}."):
+            key = key.partition('/')[2]  # path-style адресация: /<бакет>/<ключ>
+        headers = {name.lower(): value.decode('utf-8') if isinstance(value, bytes) else value
+                   for name, value in request.headers.items()}
+        body = self._request_body(request.body, headers)
+
+        self._simulate_network(len(body))
+        with self._lock:
+            self.requests += 1
+            status, response_headers, payload = self._dispatch(request.method, key, query, headers, body)
+        if request.method != 'HEAD':
+            self._simulate_network(len(payload), latency=False)
+        response_headers.setdefault('Content-Length', str(len(payload)))
+        return AWSResponse(request.url, status, response_headers, _RawBody(b'' if request.method == 'HEAD' else payload))
+
+    def _simulate_network(self, size: int, latency: bool = True) -> None:
+        delay = 0.0
+        if latency and (self.latency_ms or self.jitter_ms):
+            delay += (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+        if self.bandwidth_mbps and size:
+            delay += size / (self.bandwidth_mbps * 1024 * 1024)
+        if delay:
+            time.sleep(delay)
+
+    @staticmethod
+    def _request_body(body, headers: Dict[str, str]) -> bytes:
+        if body is None:
+            data = b''
+        elif isinstance(body, (bytes, bytearray)):
+            data = bytes(body)
+        elif isinstance(body, str):
+            data = body.encode('utf-8')
+        else:
+            data = body.read()
+            if hasattr(body, 'seek'):
+                body.seek(0)  # Повтор запроса boto3 перечитывает тело
+        if 'aws-chunked' in headers.get('content-encoding', ''):
+            data = _decode_aws_chunked(data)
+        return data
+
+    # --- Операции ---
+
+    def _dispatch(self, method: str, key: str, query: Dict[str, str], headers: Dict[str, str], body: bytes):
+        if not key:
+            if 'versioning' in query:
+                if method == 'PUT':
+                    self.versioning = _xml_text(body, 'Status') or 'Suspended'
+                    return 200, {}, b''
+                status = f"<Status>{self.versioning}</Status>" if self.versioning != 'Disabled' else ''
+                return 200, {}, _xml('VersioningConfiguration', status)
+            if 'delete' in query and method == 'POST':
+                return self._delete_objects(body)
+            if 'versions' in query:
+                return self._list_versions(query)
+            if method == 'HEAD':
+                return 200, {}, b''
+            return self._list_objects(query)
+
+        if 'uploads' in query and method == 'POST':
+            upload_id = f"upload-{next(self._ids)}"
+            self._uploads[upload_id] = {'key': key, 'parts': {}}
+            return 200, {}, _xml('InitiateMultipartUploadResult',
+                                 f"<Bucket>{self.bucket}</Bucket><Key>{escape(key)}</Key>"
+                                 f"<UploadId>{upload_id}</UploadId>")
+        if 'uploadId' in query:
+            return self._multipart(method, key, query, headers, body)
+
+        if method == 'PUT':
+            if 'x-amz-copy-source' in headers:
+                source = self._copy_source(headers['x-amz-copy-source'])
+                if source is None:
+                    return _error(404, 'NoSuchKey')
+                version = self._put(key, source['data'])
+                return 200, _version_header(version), _xml(
+                    'CopyObjectResult', f"<LastModified>{_iso(version['modified'])}</LastModified>"
+                                        f"<ETag>{escape(version['etag'])}</ETag>")
+            version = self._put(key, body)
+            return 200, {'ETag': version['etag'], **_version_header(version)}, b''
+
+        if method == 'DELETE':
+            if key in self._versions:
+                if self.versioning == 'Enabled':
+                    self._versions[key].append(self._new_version(b'', delete_marker=True))
+                else:
+                    del self._versions[key]
+            return 204, {}, b''
+
+        version = self._find(key, query.get('versionId'))
+        if version is None:
+            if method == 'HEAD':
+                return 404, {}, b''
+            code = 'NoSuchVersion' if 'versionId' in query and key in self._versions else 'NoSuchKey'
+            return _error(404, code)
+
+        data = version['data']
+        response_headers = {
+            'ETag': version['etag'],
+            'Last-Modified': format_datetime(version['modified'], usegmt=True),
+            'Content-Type': 'binary/octet-stream',
+            'Accept-Ranges': 'bytes',
+            **_version_header(version),
+        }
+        if method == 'HEAD':
+            response_headers['Content-Length'] = str(len(data))
+            return 200, response_headers, b''
+        byte_range = _parse_range(headers.get('range'), len(data))
+        if byte_range is not None:
+            start, end = byte_range
+            response_headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            return 206, response_headers, data[start:end + 1]
+        return 200, response_headers, data
+
+    def _multipart(self, method: str, key: str, query: Dict[str, str], headers: Dict[str, str], body: bytes):
+        upload = self._uploads.get(query['uploadId'])
+        if upload is None:
+            return _error(404, 'NoSuchUpload')
+        if method == 'DELETE':
+            del self._uploads[query['uploadId']]
+            return 204, {}, b''
+        if method == 'PUT':
+            if 'x-amz-copy-source' in headers:
+                source = self._copy_source(headers['x-amz-copy-source'])
+                if source is None:
+                    return _error(404, 'NoSuchKey')
+                data = source['data']
+                byte_range = _parse_range(headers.get('x-amz-copy-source-range'), len(data))
+                if byte_range is not None:
+                    data = data[byte_range[0]:byte_range[1] + 1]
+                etag = _etag(data)
+                upload['parts'][int(query['partNumber'])] = (data, etag)
+                return 200, {}, _xml('CopyPartResult', f"<ETag>{escape(etag)}</ETag>")
+            etag = _etag(body)
+            upload['parts'][int(query['partNumber'])] = (body, etag)
+            return 200, {'ETag': etag}, b''
+
+        # CompleteMultipartUpload
+        numbers = [int(number) for number in _xml_texts(body, 'PartNumber')]
+        if any(number not in upload['parts'] for number in numbers):
+            return _error(400, 'InvalidPart')
+        data = b''.join(upload['parts'][number][0] for number in numbers)
+        digest = hashlib.md5(b''.join(bytes.fromhex(upload['parts'][number][1].strip('"'))
+                                      for number in numbers)).hexdigest()
+        del self._uploads[query['uploadId']]
+        version = self._put(key, data, etag=f'"{digest}-{len(numbers)}"')
+        return 200, _version_header(version), _xml(
+            'CompleteMultipartUploadResult', f"<Bucket>{self.bucket}</Bucket><Key>{escape(key)}</Key>"
+                                             f"<ETag>{escape(version['etag'])}</ETag>")
+
+    def _list_objects(self, query: Dict[str, str]):
+        prefix = query.get('prefix', '')
+        max_keys = int(query.get('max-keys', LIST_PAGE_SIZE))
+        start_after = query.get('continuation-token') or query.get('start-after', '')
+        keys = sorted(key for key, versions in self._versions.items()
+                      if key.startswith(prefix) and key > start_after and not versions[-1]['delete_marker'])
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = ''.join(
+            f"<Contents><Key>{escape(key)}</Key>"
+            f"<LastModified>{_iso(self._versions[key][-1]['modified'])}</LastModified>"
+            f"<ETag>{escape(self._versions[key][-1]['etag'])}</ETag>"
+            f"<Size>{len(self._versions[key][-1]['data'])}</Size>"
+            f"<StorageClass>STANDARD</StorageClass></Contents>" for key in page)
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ''
+        return 200, {}, _xml('ListBucketResult',
+                             f"<Name>{self.bucket}</Name><Prefix>{escape(prefix)}</Prefix>"
+                             f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+                             f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}")
+
+    def _list_versions(self, query: Dict[str, str]):
+        prefix = query.get('prefix', '')
+        entries = []
+        for key in sorted(key for key in self._versions if key.startswith(prefix)):
+            versions = self._versions[key]
+            for position, version in reversed(list(enumerate(versions))):
+                tag = 'DeleteMarker' if version['delete_marker'] else 'Version'
+                details = '' if version['delete_marker'] else (
+                    f"<ETag>{escape(version['etag'])}</ETag><Size>{len(version['data'])}</Size>"
+                    f"<StorageClass>STANDARD</StorageClass>")
+                entries.append(
+                    f"<{tag}><Key>{escape(key)}</Key><VersionId>{version['version_id']}</VersionId>"
+                    f"<IsLatest>{'true' if position == len(versions) - 1 else 'false'}</IsLatest>"
+                    f"<LastModified>{_iso(version['modified'])}</LastModified>{details}</{tag}>")
+        return 200, {}, _xml('ListVersionsResult',
+                             f"<Name>{self.bucket}</Name><Prefix>{escape(prefix)}</Prefix>"
+                             f"<IsTruncated>false</IsTruncated>{''.join(entries)}")
+
+    def _delete_objects(self, body: bytes):
+        deleted = []
+        for key in _xml_texts(body, 'Key'):
+            self._dispatch('DELETE', key, {}, {}, b'')
+            deleted.append(f"<Deleted><Key>{escape(key)}</Key></Deleted>")
+        quiet = (_xml_text(body, 'Quiet') or '').lower() == 'true'
+        return 200, {}, _xml('DeleteResult', '' if quiet else ''.join(deleted))
+
+    # --- Хранилище ---
+
+    def _new_version(self, data: bytes, etag: Optional[str] = None, delete_marker: bool = False) -> Dict[str, Any]:
+        return {
+            'version_id': f"{next(self._ids):020d}" if self.versioning == 'Enabled' else 'null',
+            'data': data,
+            'etag': etag or _etag(data),
+            'modified': datetime.now(timezone.utc).replace(microsecond=0),
+            'delete_marker': delete_marker,
+        }
+
+    def _put(self, key: str, data: bytes, etag: Optional[str] = None) -> Dict[str, Any]:
+        version = self._new_version(data, etag)
+        versions = self._versions.setdefault(key, [])
+        if self.versioning != 'Enabled':
+            # Без версионирования перезаписывается версия 'null'
+            versions[:] = [v for v in versions if v['version_id'] != 'null']
+        versions.append(version)
+        return version
+
+    def _find(self, key: str, version_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        versions = self._versions.get(key)
+        if not versions:
+            return None
+        if version_id is None:
+            return None if versions[-1]['delete_marker'] else versions[-1]
+        return next((v for v in versions if v['version_id'] == version_id and not v['delete_marker']), None)
+
+    def _copy_source(self, header: str) -> Optional[Dict[str, Any]]:
+        source, _, version = unquote(header).lstrip('/').partition('?versionId=')
+        return self._find(source.partition('/')[2], version or None)
+
+
+def make_local_storage(bucket: str = 'benchmark', latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                       bandwidth_mbps: float = 0.0, versioning: bool = True) -> AsyncObjectStorage:
+    """
+    AsyncObjectStorage, подключенный к LocalS3. Хранилище доступно как storage.local.
+    """
+    storage = AsyncObjectStorage(key_id='benchmark', secret='benchmark', endpoint=LOCAL_ENDPOINT,
+                                 container=bucket, verify_ssl=False)
+    storage.local = LocalS3(bucket, latency_ms=latency_ms, jitter_ms=jitter_ms, bandwidth_mbps=bandwidth_mbps)
+    if versioning:
+        storage.local.versioning = 'Enabled'
+    storage.local.attach(storage.s3_client)
+    return storage
+
+
+def inject_latency(client, latency_ms: float, jitter_ms: float = 0.0, seed: int = 42) -> None:
+    """
+    Задержка перед каждым запросом клиента boto3 к настоящему хранилищу
+    (moto server, MinIO): запрос после задержки отправляется как обычно.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def delay(request, **kwargs):
+        with lock:
+            pause = (latency_ms + rng.uniform(0, jitter_ms)) / 1000
+        time.sleep(pause)
+        return None
+
+    client.meta.events.register('before-send.s3', delay)
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _iso(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _version_header(version: Dict[str, Any]) -> Dict[str, str]:
+    return {} if version['version_id'] == 'null' else {'x-amz-version-id': version['version_id']}
+
+
+def _xml(root: str, content: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{S3_NS}">{content}</{root}>'.encode('utf-8')
+
+
+def _error(status: int, code: str):
+    return status, {}, _xml('Error', f"<Code>{code}</Code><Message>{code}</Message>")
+
+
+def _xml_texts(body: bytes, tag: str) -> List[str]:
+    if not body:
+        return []
+    root = ElementTree.fromstring(body)
+    return [element.text or '' for element in root.iter() if element.tag.rpartition('}')[2] == tag]
+
+
+def _xml_text(body: bytes, tag: str) -> Optional[str]:
+    texts = _xml_texts(body, tag)
+    return texts[0] if texts else None
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header or '')
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        return max(size - int(end), 0), size - 1
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def _decode_aws_chunked(data: bytes) -> bytes:
+    """Тело в кодировке aws-chunked (контрольная сумма в trailer) -> исходные байты."""
+    chunks, position = [], 0
+    while True:
+        line_end = data.index(b'\r\n', position)
+        size = int(data[position:line_end].split(b';')[0], 16)
+        if size == 0:
+            return b''.join(chunks)
+        chunks.append(data[line_end + 2:line_end + 2 + size])
+        position = line_end + 2 + size + 2
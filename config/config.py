@@ -29,8 +29,101 @@ PIPELINE_CONFIG = {
     's3_logs_folder': 'logs',
     'filter_threshold': 55000,  # Порог для фильтрации salary
     'max_threshold': 1000000, # Максимальный порог, какой может быть зарплата
+    # Бэкенд вычислений: pandas (эталонный) или polars (pip install polars)
+    'compute_backend': os.getenv('PIPELINE_BACKEND', 'pandas'),
+    # Удаление дубликатов между файлами (индекс 64-битных хешей выгруженных строк)
+    'cross_file_dedup': False,
+    'cross_file_dedup_columns': [],  # Ключевые колонки для хеша (пусто - все колонки)
+    'cross_file_dedup_retention_days': 30,  # Сколько дней хранить хеши
+    'dedup_index_folder': str(DATA_DIR / "state" / "dedup_index"),
+    # Журнал обработанных файлов (SQLite): повторно пришедший файл с тем же содержимым не обрабатывается
+    'ledger_path': str(DATA_DIR / "state" / "processing_ledger.sqlite"),  # None - журнал отключен
+    'ledger_on_match': 'skip',  # skip - вернуть прежний результат, copy - скопировать его в S3 на сервере
+    # Определение колонок с зарплатой
+    'salary_columns': [],  # Явный список колонок с зарплатой (если задан - автоопределение не выполняется)
+    'salary_detection_cache_size': 1024,  # Размер кэша определения колонок по заголовку файла
+    # Дополнительные правила фильтрации (объединяются через AND), см. src/filter_rules.py
+    # Пример: [{'column': 'department', 'op': 'in', 'values': ['IT', 'HR']}]
+    'filter_rules': [],
+    # Формат результата
+    'output_format': 'csv',  # csv (с заголовком-комментарием) или parquet
+    'parquet_compression': 'zstd',  # zstd или snappy
+    'parquet_row_group_size': 100000,  # Количество строк в группе строк Parquet
+    # CSV загружается в S3 потоково частями multipart_part_size, без временного файла в data/temp
+    'stream_upload': True,
+    'csv_chunk_rows': 50000,  # Строк в одном куске сериализации
+    'stream_upload_queue_size': 2,  # Частей в очереди между сериализацией и загрузкой
+    'stream_upload_concurrency': 4,  # Одновременно загружаемых частей
+    # Hive-партиционирование результата: processed/<дата>/<колонка>=<значение>/...
+    'partition_by': [],  # Например ['department', 'salary_band']; пусто - один файл
+    'salary_band_width': 50000,  # Ширина диапазона для вычисляемой колонки salary_band
+    'partition_upload_concurrency': 8,  # Количество одновременно загружаемых партиций
+    # Микропакеты: результаты небольших файлов выгружаются одним объектом с колонкой source_file
+    'micro_batch': False,
+    'micro_batch_file_size': 1024 * 1024,  # Файлы не больше этого размера (байт) попадают в пакет
+    'micro_batch_max_bytes': 64 * 1024 * 1024,  # Выгрузка, когда результаты в памяти достигли размера
+    'micro_batch_window_sec': 60,  # ... или когда первый файл пакета ждет дольше
+    'micro_batch_source_column': 'source_file',
+    # Компакция processed/<дата>/ в крупные Parquet файлы (run_compaction.py)
+    'compaction_target_bytes': 128 * 1024 * 1024,  # Суммарный размер исходных объектов на один файл
+    'compaction_small_object_bytes': 16 * 1024 * 1024,  # Объекты больше этого размера не объединяются
+    'compaction_min_objects': 2,
+    'compaction_concurrency': 16,  # Одновременных чтений из S3
+    'compaction_delete_originals': 'delete',  # delete - удалить после проверки, lifecycle - оставить lifecycle policy
+    # Журнал запусков (JSON Lines, только дозапись): fsync раз в интервал для накопившихся записей
+    'run_log_fsync': False,
+    'run_log_fsync_interval_sec': 1.0,
+    # Отправка журнала в S3: logs/pipeline_log_<дата>/part-*.jsonl + _manifest.json (с версионированием)
+    'log_ship_interval_sec': 30,  # Не чаще раза в интервал...
+    'log_ship_max_bytes': 1024 * 1024,  # ...или сразу, когда накопилось столько неотправленных байт
+    # Архив исходных файлов processed/archive/: без сжатия файл переносится без копирования (rename/hardlink)
+    'archive_compression': None,  # None, 'zstd' или 'gzip'
+    'archive_layout': 'file',  # file - файл на исходный файл, daily_tar - один tar архив за день
+    # Профилирование process_file (cProfile + tracemalloc) для выборки файлов, результаты - в data/logs/profiles
+    'profile_sample_every': int(os.getenv('PIPELINE_PROFILE_EVERY', '0')),  # 0 - выключено, N - один из N файлов
+    'profile_patterns': [p for p in os.getenv('PIPELINE_PROFILE_PATTERNS', '').split(',') if p],  # например 'export_*.xlsx'
+    'profile_top': 30,  # Строк в отчетах cProfile и tracemalloc
+    'stage_metrics_window': 1000,  # Файлов в скользящих перцентилях метрик этапов (DataPipeline.stage_percentiles)
     # Настройки обработки
-    'supported_formats': ['.csv', '.json', '.xlsx', '.xls', '.parquet', '.txt'],
+    'supported_formats': ['.csv', '.json', '.xlsx', '.xls', '.parquet', '.arrow', '.feather', '.jsonl', '.ndjson', '.txt'],
+    'jsonl_batch_lines': 50000,  # Размер пакета (строк) при потоковой и пакетной обработке (JSON Lines, CSV, Parquet)
+    # Одновременная обработка файлов с допуском по бюджету памяти: файл ждет, пока его
+    # оценка (размер * коэффициент расширения формата * memory_processing_factor) не
+    # поместится в свободную часть бюджета; файлы больше бюджета обрабатываются пакетами
+    'max_concurrent_files': 1,
+    'memory_budget_mb': int(os.getenv('PIPELINE_MEMORY_BUDGET_MB', '0')),  # 0 - без ограничения
+    'memory_processing_factor': 2.5,  # Пик обработки относительно размера DataFrame
+    'memory_expansion': {},  # Коэффициенты расширения по расширению файла, например {'.xlsx': 15.0}
+    # Очередь файлов incoming: fifo - по времени изменения, sjf - сначала меньшие файлы.
+    # Источник файла - первый совпавший шаблон имени в schedule_sources, значение - приоритет
+    # (больше - раньше); старение поднимает файл на уровень за каждые schedule_aging_sec ожидания
+    'schedule_policy': os.getenv('PIPELINE_SCHEDULE_POLICY', 'fifo'),
+    'schedule_sources': {},  # например {'ops_*': 10, 'history_*': -5}
+    'schedule_aging_sec': 300,  # 0 - без старения
+    # Несколько обработчиков (процессов или узлов с общей NFS) на одной папке incoming:
+    # файл захватывается атомарным переименованием в <claims_folder>/<worker_id>/,
+    # захваты обработчика без heartbeat дольше claim_lease_sec возвращаются в incoming.
+    # Общие хранилища при этом: dedup_index_folder - общая папка, запись под flock и
+    # подгрузка чужих сегментов перед проверкой; archive_layout='daily_tar' - свой
+    # <дата>.<worker_id>.tar у каждого обработчика; манифест партиций обновляется под
+    # lock-файлом в claims_folder с дополнением версии из S3
+    'work_claims': os.getenv('PIPELINE_WORK_CLAIMS', '').lower() in ('1', 'true', 'yes'),
+    'claims_folder': None,  # None - <watch_folder>/.claims (та же файловая система, что и incoming)
+    'worker_id': os.getenv('PIPELINE_WORKER_ID') or None,  # None - <host>-<pid>
+    'claim_lease_sec': 60,
+    'claim_heartbeat_sec': 10,
+    # Контрольные точки потоковой обработки (JSON Lines -> CSV): после сбоя обработка
+    # продолжается с последней загруженной части multipart upload
+    'stream_checkpoints': False,
+    'checkpoint_folder': str(DATA_DIR / "state" / "checkpoints"),
+    'multipart_part_size': 8 * 1024 * 1024,  # Размер части (байт), не меньше 5 МБ
+    'memory_map': True,  # Чтение Parquet и Arrow IPC/Feather через memory map без копирования
+    # Чтение Excel
+    'excel_engine': 'auto',  # auto (calamine, если установлен python-calamine), calamine, openpyxl
+    'excel_sheets': None,  # None - первый лист, 'all' - все листы, или список имен листов
+    'excel_sheet_column': 'sheet',  # Колонка с именем листа при чтении нескольких листов
+    'excel_cache_folder': str(DATA_DIR / "cache" / "excel"),  # Кэш конвертации Excel -> Parquet
+    'excel_cache_max_files': 100,
     'check_interval': 5,  # Интервал проверки файлов (секунды)
 
 }
@@ -0,0 +1,87 @@
+"""
+Компакция результатов пайплайна в S3: объединение небольших объектов
+processed/<дата>/salary_filtered_* в крупные Parquet файлы.
+
+Примеры:
+    python run_compaction.py                     # за вчера
+    python run_compaction.py --date 2026-01-08
+    python run_compaction.py --date 2026-01-08 --dry-run
+"""
+import sys
+import os
+import asyncio
+import argparse
+import logging
+import traceback
+from datetime import datetime, timedelta
+
+import warnings
+
+warnings.filterwarnings('ignore')
+import urllib3
+
+urllib3.disable_warnings()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from async_s3_client import AsyncObjectStorage
+from compaction import PrefixCompactor
+from config import config
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logging.getLogger('urllib3').setLevel(logging.ERROR)
+logging.getLogger('botocore').setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    parser = argparse.ArgumentParser(description="Компакция processed/<дата>/ в крупные Parquet файлы")
+    parser.add_argument('--date', action='append',
+                        help=f"Дата YYYY-MM-DD (можно указать несколько раз), по умолчанию {yesterday}")
+    parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет объединено")
+    args = parser.parse_args()
+    args.date = args.date or [yesterday]
+    return args
+
+
+async def main():
+    args = parse_args()
+
+    client = AsyncObjectStorage(
+        key_id=config.S3_CONFIG['access_key'],
+        secret=config.S3_CONFIG['secret_key'],
+        endpoint=config.S3_CONFIG['endpoint'],
+        container=config.S3_CONFIG['bucket'],
+        region=config.S3_CONFIG.get('region', 'ru-1'),
+        verify_ssl=config.S3_CONFIG.get('verify_ssl', False)
+    )
+    compactor = PrefixCompactor(client, config.PIPELINE_CONFIG)
+
+    for date in args.date:
+        print(f"\n📦 Компакция {config.PIPELINE_CONFIG['s3_processed_folder']}/{date}/"
+              f"{' (dry run)' if args.dry_run else ''}")
+        result = await compactor.compact(date, dry_run=args.dry_run)
+        print(f"   Найдено небольших объектов: {result['objects_found']}")
+        for output in result['outputs']:
+            target = output.get('key', '(новый файл)')
+            print(f"   📝 {target}: {len(output['sources'])} объектов, {output['input_bytes']} байт исходных данных")
+        if not args.dry_run:
+            print(f"   Объединено: {result['objects_compacted']}, удалено: {result['deleted']}")
+        if result['failed']:
+            print(f"   ❌ Ошибки: {result['failed']}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n🛑 Компакция прервана")
+    except Exception as e:
+        print(f"\n💥 Ошибка компакции: {e}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
@@ -110,10 +110,29 @@ async def monitor_and_process(pipeline: DataPipeline, watch_folder: Path, check_
 
     logger.info(f"\n👁️  Мониторинг папки: {watch_folder.absolute()}")
     logger.info(f"🎯 Фильтрация: зарплата > {config.PIPELINE_CONFIG['filter_threshold']}")
-    logger.info("📋 Поддерживаемые форматы: CSV, JSON, Excel, Parquet, TXT")
+    logger.info("📋 Поддерживаемые форматы: CSV, JSON, Excel, Parquet, Arrow/Feather, JSON Lines, TXT")
     logger.info("⏹️  Для остановки нажмите Ctrl+C\n")
     logger.info("=" * 70)
 
+    # Обработчики берут файлы из очереди по приоритету, не больше max_concurrent_files одновременно
+    scheduler = pipeline.scheduler
+
+    async def worker():
+        while (file_path := await scheduler.get()) is not None:
+            try:
+                await handle_new_file(pipeline, file_path, processed_files)
+            except Exception as e:
+                print(f"\n💥 Ошибка обработки {file_path.name}: {e}")
+                logger.error(f"💥 Ошибка обработки {file_path.name}: {e}")
+                logger.error(traceback.format_exc())
+            finally:
+                if pipeline.claims is not None:
+                    # Повторную обработку исключает захват: файл, возвращенный в incoming
+                    # после сбоя другого обработчика, должен быть замечен снова
+                    processed_files.discard(str(file_path.resolve()))
+
+    workers = [asyncio.create_task(worker()) for _ in range(pipeline.max_concurrent_files)]
+
     try:
         while True:
             # Сканируем папку
@@ -126,7 +145,7 @@ async def monitor_and_process(pipeline: DataPipeline, watch_folder: Path, check_
                     continue
 
                 # Проверяем расширение
-                valid_ext = {'.csv', '.json', '.xlsx', '.xls', '.parquet', '.txt'}
+                valid_ext = {'.csv', '.json', '.xlsx', '.xls', '.parquet', '.arrow', '.feather', '.jsonl', '.ndjson', '.txt'}
                 if file_path.suffix.lower() not in valid_ext:
                     continue
 
@@ -137,86 +156,23 @@ async def monitor_and_process(pipeline: DataPipeline, watch_folder: Path, check_
                 file_key = str(file_path.resolve())
 
                 if file_key not in processed_files:
+                    processed_files.add(file_key)
                     unprocessed_files.append(file_path)
 
-            # Показываем статус в консоль
-            print(f"\n⏰ {current_time} | 📁 Файлов в папке: {len(files)} | ⏳ Новых: {len(unprocessed_files)}")
+            # Новые файлы - в очередь
+            scheduler.extend(unprocessed_files)
 
-            # Обрабатываем новые файлы
-            for file_path in unprocessed_files:
-                file_key = str(file_path.resolve())
-                processed_files.add(file_key)
-
-                # Выводим в консоль обнаружение нового файла
-                print(f"\n{'=' * 60}")
-                print(f"📁 ОБНАРУЖЕН НОВЫЙ ФАЙЛ: {file_path.name}")
-                print(f"{'=' * 60}")
-
-                logger.info(f"\n{'=' * 70}")
-                logger.info(f"📁 ОБНАРУЖЕН НОВЫЙ ФАЙЛ: {file_path.name}")
-                logger.info(f"{'=' * 70}")
-
-                # Проверяем, что файл полностью записан
-                print("🔍 Проверка файла...")
-                logger.info("🔍 Проверка файла...")
-                size1 = file_path.stat().st_size
-                await asyncio.sleep(1)
-                size2 = file_path.stat().st_size
-
-                if size1 != size2 or size1 == 0:
-                    print("   ⚠️ Файл еще записывается, пропускаем...")
-                    logger.info("   ⚠️ Файл еще записывается, пропускаем...")
-                    processed_files.remove(file_key)
-                    continue
+            # Показываем статус в консоль
+            queue = scheduler.metrics()
+            print(f"\n⏰ {current_time} | 📁 Файлов в папке: {len(files)} | ⏳ Новых: {len(unprocessed_files)} "
+                  f"| 📬 В очереди: {queue['depth']} (ждет {queue['oldest_wait_sec']:.0f} с)")
+            if pipeline.admission.enabled:
+                usage = pipeline.admission.utilization()
+                print(f"   🧠 Бюджет памяти: пик {usage['peak_utilization']:.0%}, "
+                      f"ожидали допуска: {usage['waited']}, пакетами: {usage['chunked']}")
 
-                # Обрабатываем файл
-                print("🔄 Начало обработки...")
-                logger.info("🔄 Начало обработки...")
-                result = await pipeline.process_file(file_path)
-                await pipeline.log_pipeline_result(result)
-
-                if result['success']:
-                    # Выводим результат в консоль
-                    print(f"\n✅ ФАЙЛ ОБРАБОТАН УСПЕШНО!")
-                    print(f"{'-' * 50}")
-                    print(f"📊 Статистика:")
-                    print(f"   Всего записей: {result.get('records_processed', 0)}")
-                    print(f"   Отфильтровано по зарплате (≤ {config.PIPELINE_CONFIG['filter_threshold']}): "
-                          f"{result.get('filtered_by_salary', 0)}")
-                    print(f"   Осталось записей: {result.get('records_filtered', 0)}")
-                    print(f"📤 Результат:")
-                    print(f"   Загружен в S3: {result.get('s3_path', 'N/A')}")
-                    if result.get('version_id') and result.get('version_id') != 'unknown':
-                        print(f"   Версия: {result.get('version_id', 'N/A')[:12]}...")
-                    print(f"🗂️  Исходный файл перемещен в архив")
-                    print(f"{'=' * 60}")
-
-                    # Также логируем полную информацию
-                    logger.info(f"\n✅ ФАЙЛ ОБРАБОТАН УСПЕШНО!")
-                    logger.info(f"{'-' * 40}")
-                    logger.info(f"📊 Статистика:")
-                    logger.info(f"   Всего записей: {result.get('records_processed', 0)}")
-                    logger.info(f"   Отфильтровано по зарплате (≤ {config.PIPELINE_CONFIG['filter_threshold']}): "
-                                f"{result.get('filtered_by_salary', 0)}")
-                    logger.info(f"   Осталось записей: {result.get('records_filtered', 0)}")
-                    logger.info(f"📤 Результат:")
-                    logger.info(f"   Загружен в S3: {result.get('s3_path', 'N/A')}")
-                    logger.info(f"   Версия: {result.get('version_id', 'N/A')}")
-                    logger.info(f"🗂️  Исходный файл:")
-                    logger.info(f"   Перемещен в: processed/archive/")
-                    logger.info(f"{'=' * 70}")
-                else:
-                    # Выводим ошибку в консоль
-                    print(f"\n❌ ОШИБКА ОБРАБОТКИ!")
-                    print(f"{'-' * 50}")
-                    print(f"   Причина: {result.get('error', 'Неизвестная ошибка')}")
-                    print(f"{'=' * 60}")
-
-                    # Также логируем
-                    logger.error(f"\n❌ ОШИБКА ОБРАБОТКИ:")
-                    logger.error(f"{'-' * 40}")
-                    logger.error(f"   Причина: {result.get('error', 'Неизвестная ошибка')}")
-                    logger.info(f"{'=' * 70}")
+            # Выгрузка микропакета, если он набрал размер или время ожидания
+            await flush_micro_batch(pipeline)
 
             # Ждем перед следующей проверкой
             await asyncio.sleep(check_interval)
@@ -228,6 +184,118 @@ async def monitor_and_process(pipeline: DataPipeline, watch_folder: Path, check_
         print(f"\n💥 Ошибка мониторинга: {e}")
         logger.error(f"\n💥 Ошибка мониторинга: {e}")
         logger.error(traceback.format_exc())
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        pipeline.log_queue_metrics()
+        # Накопленный микропакет выгружается и при остановке
+        await flush_micro_batch(pipeline, force=True)
+        await pipeline.close()
+
+
+async def handle_new_file(pipeline: DataPipeline, file_path: Path, processed_files: set):
+    """Проверка и обработка нового файла с выводом результата в консоль и лог."""
+    file_key = str(file_path.resolve())
+    processed_files.add(file_key)
+
+    # Выводим в консоль обнаружение нового файла
+    print(f"\n{'=' * 60}")
+    print(f"📁 ОБНАРУЖЕН НОВЫЙ ФАЙЛ: {file_path.name}")
+    print(f"{'=' * 60}")
+
+    logger.info(f"\n{'=' * 70}")
+    logger.info(f"📁 ОБНАРУЖЕН НОВЫЙ ФАЙЛ: {file_path.name}")
+    logger.info(f"{'=' * 70}")
+
+    # Проверяем, что файл полностью записан
+    print("🔍 Проверка файла...")
+    logger.info("🔍 Проверка файла...")
+    try:
+        size1 = file_path.stat().st_size
+        await asyncio.sleep(1)
+        size2 = file_path.stat().st_size
+    except FileNotFoundError:
+        print("   ⚠️ Файл взят другим обработчиком, пропускаем...")
+        logger.info("   ⚠️ Файл взят другим обработчиком, пропускаем...")
+        return
+
+    if size1 != size2 or size1 == 0:
+        print("   ⚠️ Файл еще записывается, пропускаем...")
+        logger.info("   ⚠️ Файл еще записывается, пропускаем...")
+        processed_files.remove(file_key)
+        return
+
+    # Захватываем файл (при нескольких обработчиках на одной папке incoming)
+    file_path = pipeline.claim_file(file_path)
+    if file_path is None:
+        print("   ⚠️ Файл взят другим обработчиком, пропускаем...")
+        logger.info("   ⚠️ Файл взят другим обработчиком, пропускаем...")
+        return
+
+    # Обрабатываем файл
+    print("🔄 Начало обработки...")
+    logger.info("🔄 Начало обработки...")
+    result = await pipeline.process_file(file_path)
+    if result.get('micro_batch') == 'pending':
+        print(f"🧺 Результат добавлен в микропакет, выгрузка вместе с другими файлами")
+        logger.info(f"🧺 Результат добавлен в микропакет, выгрузка вместе с другими файлами")
+        return
+    await pipeline.log_pipeline_result(result)
+
+    if result['success']:
+        # Выводим результат в консоль
+        print(f"\n✅ ФАЙЛ ОБРАБОТАН УСПЕШНО!")
+        print(f"{'-' * 50}")
+        print(f"📊 Статистика:")
+        print(f"   Всего записей: {result.get('records_processed', 0)}")
+        print(f"   Отфильтровано по зарплате (≤ {config.PIPELINE_CONFIG['filter_threshold']}): "
+              f"{result.get('filtered_by_salary', 0)}")
+        print(f"   Осталось записей: {result.get('records_filtered', 0)}")
+        print(f"📤 Результат:")
+        print(f"   Загружен в S3: {result.get('s3_path', 'N/A')}")
+        if result.get('version_id') and result.get('version_id') != 'unknown':
+            print(f"   Версия: {result.get('version_id', 'N/A')[:12]}...")
+        print(f"🗂️  Исходный файл перемещен в архив")
+        print(f"{'=' * 60}")
+
+        # Также логируем полную информацию
+        logger.info(f"\n✅ ФАЙЛ ОБРАБОТАН УСПЕШНО!")
+        logger.info(f"{'-' * 40}")
+        logger.info(f"📊 Статистика:")
+        logger.info(f"   Всего записей: {result.get('records_processed', 0)}")
+        logger.info(f"   Отфильтровано по зарплате (≤ {config.PIPELINE_CONFIG['filter_threshold']}): "
+                    f"{result.get('filtered_by_salary', 0)}")
+        logger.info(f"   Осталось записей: {result.get('records_filtered', 0)}")
+        logger.info(f"📤 Результат:")
+        logger.info(f"   Загружен в S3: {result.get('s3_path', 'N/A')}")
+        logger.info(f"   Версия: {result.get('version_id', 'N/A')}")
+        logger.info(f"🗂️  Исходный файл:")
+        logger.info(f"   Перемещен в: processed/archive/")
+        logger.info(f"{'=' * 70}")
+    else:
+        # Выводим ошибку в консоль
+        print(f"\n❌ ОШИБКА ОБРАБОТКИ!")
+        print(f"{'-' * 50}")
+        print(f"   Причина: {result.get('error', 'Неизвестная ошибка')}")
+        print(f"{'=' * 60}")
+
+        # Также логируем
+        logger.error(f"\n❌ ОШИБКА ОБРАБОТКИ:")
+        logger.error(f"{'-' * 40}")
+        logger.error(f"   Причина: {result.get('error', 'Неизвестная ошибка')}")
+        logger.info(f"{'=' * 70}")
+
+
+async def flush_micro_batch(pipeline: DataPipeline, force: bool = False):
+    """Выгрузка микропакета и логирование результатов его файлов."""
+    results = await pipeline.flush_micro_batch(force=force)
+    for result in results:
+        await pipeline.log_pipeline_result(result)
+    if results:
+        status = "✅ Загружен в S3" if results[0]['success'] else "❌ ОШИБКА загрузки"
+        print(f"\n🧺 Микропакет ({len(results)} файлов): {status}: {results[0].get('micro_batch') or ''}")
+        logger.info(f"🧺 Микропакет ({len(results)} файлов): {status}: {results[0].get('micro_batch') or ''}")
 
 
 async def main():
@@ -0,0 +1,247 @@
+"""
+Допуск файлов к обработке по бюджету памяти.
+
+Пиковая память обработки файла оценивается как
+    размер файла * коэффициент расширения формата * processing_factor,
+где коэффициент расширения - отношение размера DataFrame в памяти к размеру
+файла. Начальные коэффициенты уточняются по наблюдаемым файлам (скользящее
+среднее по каждому формату).
+
+Файл допускается, если его оценка помещается в свободную часть бюджета;
+иначе ждет в очереди (в порядке поступления). Файл, который не помещается
+в бюджет даже один, обрабатывается пакетами (CSV, JSON Lines, Parquet) с
+оценкой по размеру пакета, а форматы без пакетного чтения (Excel, JSON)
+обрабатываются монопольно - когда другие файлы не обрабатываются.
+
+Результаты, накопленные в памяти для выгрузки микропакетом, тоже занимают
+бюджет (set_buffered). Они освобождаются только выгрузкой пакета, поэтому
+файл, которому мешают лишь накопленные результаты, допускается, когда
+других файлов в обработке нет.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+from chunked_readers import CHUNKED_FORMATS
+
+MB = 1024 * 1024
+
+# Начальные коэффициенты расширения (DataFrame в памяти / размер файла)
+DEFAULT_EXPANSION = {
+    '.csv': 2.0, '.txt': 2.0, '.json': 8.0, '.jsonl': 6.0, '.ndjson': 6.0,
+    '.xlsx': 12.0, '.xls': 6.0, '.parquet': 5.0, '.arrow': 1.5, '.feather': 1.5,
+}
+UNKNOWN_EXPANSION = 4.0
+
+# Сколько байт с начала файла читается для оценки среднего размера строки
+LINE_SAMPLE_BYTES = 64 * 1024
+
+
+def frame_bytes(frame) -> Optional[int]:
+    """
+    Размер фрейма в памяти (pandas или polars DataFrame), None для ленивых
+    фреймов (polars LazyFrame оценивается после collect - см. PolarsBackend.filter).
+    """
+    if hasattr(frame, 'memory_usage'):
+        return int(frame.memory_usage(deep=True).sum())
+    if hasattr(frame, 'estimated_size'):
+        return int(frame.estimated_size())
+    return None
+
+
+class MemoryAdmissionController:
+    """
+    Резервирование памяти под обработку файлов в пределах бюджета.
+
+    Args:
+        budget_bytes: Бюджет памяти на одновременно обрабатываемые файлы (0 - без ограничения)
+        processing_factor: Пик обработки относительно размера DataFrame (чтение + фильтр + сериализация)
+        batch_rows: Строк в пакете при пакетной обработке
+        smoothing: Вес нового наблюдения в скользящем среднем коэффициента расширения
+    """
+
+    def __init__(self, budget_bytes: int = 0, processing_factor: float = 2.5, batch_rows: int = 50000,
+                 expansion: Optional[Dict[str, float]] = None, smoothing: float = 0.3):
+        self.budget_bytes = int(budget_bytes)
+        self.processing_factor = processing_factor
+        self.batch_rows = batch_rows
+        self.smoothing = smoothing
+        self.expansion = dict(DEFAULT_EXPANSION)
+        self.expansion.update(expansion or {})
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+        self._waiting: list = []  # Очередь ожидающих (порядок поступления)
+        self._reserved = 0
+        self._buffered = 0  # результаты в памяти до выгрузки микропакетом
+        self._active: Dict[int, Dict[str, Any]] = {}
+        self._stats = {'admitted': 0, 'chunked': 0, 'exclusive': 0, 'waited': 0,
+                       'wait_sec_total': 0.0, 'peak_reserved_bytes': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0
+
+    @property
+    def waiting(self) -> int:
+        """Файлов, ожидающих допуска."""
+        return len(self._waiting)
+
+    # --- Оценка ---
+
+    def estimate(self, file_path: Path, file_size: Optional[int] = None) -> int:
+        """Оценка пиковой памяти обработки файла целиком."""
+        if file_size is None:
+            file_size = file_path.stat().st_size
+        ratio = self.expansion.get(file_path.suffix.lower(), UNKNOWN_EXPANSION)
+        return int(file_size * ratio * self.processing_factor)
+
+    def estimate_chunked(self, file_path: Path, file_size: Optional[int] = None) -> int:
+        """Оценка пиковой памяти пакетной обработки: один пакет batch_rows строк."""
+        if file_size is None:
+            file_size = file_path.stat().st_size
+        batch_size = min(file_size, self._row_bytes(file_path, file_size) * self.batch_rows)
+        return self.estimate(file_path, batch_size)
+
+    @staticmethod
+    def _row_bytes(file_path: Path, file_size: int) -> float:
+        """Средний размер строки в файле (по началу файла или метаданным Parquet)."""
+        if file_path.suffix.lower() == '.parquet':
+            import pyarrow.parquet as pq
+
+            rows = pq.ParquetFile(file_path).metadata.num_rows
+            return file_size / max(rows, 1)
+        with open(file_path, 'rb') as f:
+            sample = f.read(LINE_SAMPLE_BYTES)
+        return len(sample) / max(sample.count(b'\n'), 1)
+
+    def observe(self, file_path: Path, file_size: int, in_memory_bytes: Optional[int]) -> None:
+        """Уточнение коэффициента расширения формата по фактическому размеру DataFrame."""
+        if not in_memory_bytes or not file_size:
+            return
+        ext = file_path.suffix.lower()
+        observed = in_memory_bytes / file_size
+        current = self.expansion.get(ext, UNKNOWN_EXPANSION)
+        self.expansion[ext] = round(current + self.smoothing * (observed - current), 3)
+
+    # --- Допуск ---
+
+    @asynccontextmanager
+    async def admit(self, file_path: Path) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Ожидание допуска и резервирование памяти на время обработки файла.
+
+        Yields:
+            {'estimate_bytes', 'reserved_bytes', 'mode': full | chunked | exclusive, 'waited_sec'}
+        """
+        # stat и чтение начала файла для оценки - не в цикле событий
+        ticket = await asyncio.to_thread(self._plan, file_path)
+        await self._acquire(ticket)
+        try:
+            yield ticket
+        finally:
+            await self._release(ticket)
+
+    def _plan(self, file_path: Path) -> Dict[str, Any]:
+        file_size = file_path.stat().st_size if file_path.exists() else 0
+        estimate = self.estimate(file_path, file_size)
+        ticket = {'file_name': file_path.name, 'estimate_bytes': estimate,
+                  'reserved_bytes': estimate, 'mode': 'full', 'waited_sec': 0.0}
+        if not self.enabled or estimate <= self.budget_bytes:
+            return ticket
+
+        if file_path.suffix.lower() in CHUNKED_FORMATS:
+            ticket['mode'] = 'chunked'
+            ticket['reserved_bytes'] = min(self.estimate_chunked(file_path, file_size), self.budget_bytes)
+            self.logger.info(f"   🧩 {file_path.name}: оценка {estimate / MB:.0f} МБ больше бюджета "
+                             f"{self.budget_bytes / MB:.0f} МБ, пакетная обработка "
+                             f"({ticket['reserved_bytes'] / MB:.0f} МБ)")
+        else:
+            ticket['mode'] = 'exclusive'
+            ticket['reserved_bytes'] = self.budget_bytes
+            self.logger.warning(f"   ⚠️ {file_path.name}: оценка {estimate / MB:.0f} МБ больше бюджета "
+                                f"{self.budget_bytes / MB:.0f} МБ, формат не читается пакетами - "
+                                f"обработка без других файлов")
+        return ticket
+
+    def _get_condition(self) -> asyncio.Condition:
+        """Условие ожидания, привязанное к текущему циклу событий."""
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition, self._loop = asyncio.Condition(), loop
+        return self._condition
+
+    async def _acquire(self, ticket: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        condition = self._get_condition()
+        async with condition:
+            self._waiting.append(ticket)
+            try:
+                await condition.wait_for(lambda: self._waiting[0] is ticket and self._fits(ticket))
+            finally:
+                self._waiting.remove(ticket)
+                condition.notify_all()
+            self._reserved += ticket['reserved_bytes']
+            self._active[id(ticket)] = ticket
+            self._stats['peak_reserved_bytes'] = max(self._stats['peak_reserved_bytes'],
+                                                     self._reserved + self._buffered)
+
+        ticket['waited_sec'] = round(time.monotonic() - started, 3)
+        self._stats['admitted'] += 1
+        if ticket['mode'] != 'full':
+            self._stats[ticket['mode']] += 1
+        if ticket['waited_sec'] > 0.001:
+            self._stats['waited'] += 1
+            self._stats['wait_sec_total'] += ticket['waited_sec']
+
+    def _fits(self, ticket: Dict[str, Any]) -> bool:
+        """Помещается ли файл в бюджет вместе с обрабатываемыми файлами и накопленными результатами."""
+        if self._reserved + ticket['reserved_bytes'] > self.budget_bytes:
+            return False
+        return not self._active or self._reserved + self._buffered + ticket['reserved_bytes'] <= self.budget_bytes
+
+    async def _release(self, ticket: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        condition = self._get_condition()
+        async with condition:
+            self._active.pop(id(ticket), None)
+            self._reserved -= ticket['reserved_bytes']
+            condition.notify_all()
+
+    async def set_buffered(self, buffered_bytes: int) -> None:
+        """Учет в бюджете результатов, накопленных в памяти для выгрузки микропакетом."""
+        if not self.enabled:
+            return
+        condition = self._get_condition()
+        async with condition:
+            self._buffered = int(buffered_bytes)
+            self._stats['peak_reserved_bytes'] = max(self._stats['peak_reserved_bytes'],
+                                                     self._reserved + self._buffered)
+            condition.notify_all()
+
+    def utilization(self) -> Dict[str, Any]:
+        """
+        Использование бюджета: зарезервировано под файлы и занято результатами
+        микропакета сейчас, пик, очередь и счетчики допуска.
+        """
+        return {
+            'budget_bytes': self.budget_bytes,
+            'reserved_bytes': self._reserved,
+            'buffered_bytes': self._buffered,
+            'utilization': (round((self._reserved + self._buffered) / self.budget_bytes, 3)
+                            if self.enabled else None),
+            'peak_utilization': (round(self._stats['peak_reserved_bytes'] / self.budget_bytes, 3)
+                                 if self.enabled else None),
+            'active': [ticket['file_name'] for ticket in self._active.values()],
+            'waiting': len(self._waiting),
+            'expansion': dict(self.expansion),
+            **{key: round(value, 3) if isinstance(value, float) else value
+               for key, value in self._stats.items()},
+        }
@@ -0,0 +1,193 @@
+"""
+Архивирование исходных файлов после обработки.
+
+По умолчанию файл переносится в processed/archive/<дата>/ без копирования
+данных: жесткая ссылка + удаление исходного (или os.replace), если архив на
+том же устройстве. Иначе файл копируется в отдельном потоке, не блокируя
+цикл событий.
+
+Опционально архив сжимается (zstd или gzip через кодеки pyarrow):
+    layout='file'      - processed/archive/<дата>/<файл>.zst
+    layout='daily_tar' - processed/archive/<дата>.tar, члены архива сжаты по отдельности
+
+Несколько обработчиков (work_claims) с daily_tar пишут каждый в свой архив
+processed/archive/<дата>.<worker_id>.tar: дозапись в tar идет с известного
+смещения и не может быть общей для процессов без блокировок и перечитывания.
+"""
+import asyncio
+import errno
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Расширения сжатых файлов по кодеку
+COMPRESSION_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class FileArchiver:
+    """
+    Перенос обработанных файлов в архив.
+    """
+
+    def __init__(self, archive_root: Path, compression: Optional[str] = None, layout: str = 'file',
+                 worker_id: Optional[str] = None):
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Неподдерживаемое сжатие архива: {compression}, "
+                             f"доступны: {', '.join(COMPRESSION_SUFFIXES)}")
+        if layout not in ('file', 'daily_tar'):
+            raise ValueError(f"Неизвестный формат архива: {layout}")
+        self.archive_root = Path(archive_root)
+        self.compression = compression
+        self.layout = layout
+        self.worker_id = worker_id
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._tar_lock = threading.Lock()
+        self._tar_index: Dict[Path, Dict[str, Any]] = {}  # tar архив -> {'members', 'end', 'size'}
+
+    async def archive(self, file_path: Path) -> Path:
+        """
+        Архивирование файла; исходный файл удаляется.
+
+        Returns:
+            Путь к файлу в архиве (для daily_tar - путь к tar архиву за день)
+        """
+        archive_date = datetime.now().strftime('%Y-%m-%d')
+        if self.layout == 'daily_tar':
+            self.archive_root.mkdir(parents=True, exist_ok=True)
+            archive_name = f"{archive_date}.{self.worker_id}.tar" if self.worker_id else f"{archive_date}.tar"
+            archive_file = self.archive_root / archive_name
+            await asyncio.to_thread(self._append_to_tar, file_path, archive_file)
+            file_path.unlink()
+            return archive_file
+
+        archive_folder = self.archive_root / archive_date
+        archive_folder.mkdir(parents=True, exist_ok=True)
+        suffix = COMPRESSION_SUFFIXES.get(self.compression, '')
+
+        if self.compression is not None:
+            archive_file = self._free_name(archive_folder, file_path, suffix)
+            await asyncio.to_thread(self._compress, file_path, archive_file)
+            file_path.unlink()
+            return archive_file
+
+        if os.stat(file_path).st_dev == os.stat(archive_folder).st_dev:
+            archive_file = self._move_same_device(file_path, archive_folder)
+            if archive_file is not None:
+                return archive_file
+
+        # Разные устройства: копирование в отдельном потоке, затем удаление исходного
+        archive_file = self._free_name(archive_folder, file_path)
+        tmp_file = archive_file.with_name(archive_file.name + '.part')
+        await asyncio.to_thread(shutil.copy2, file_path, tmp_file)
+        os.replace(tmp_file, archive_file)
+        file_path.unlink()
+        return archive_file
+
+    def _free_name(self, archive_folder: Path, file_path: Path, suffix: str = '') -> Path:
+        """Имя в архиве; если оно занято, добавляется timestamp (как раньше)."""
+        archive_file = archive_folder / (file_path.name + suffix)
+        if archive_file.exists():
+            archive_file = archive_folder / f"{file_path.stem}_{int(time.time())}{file_path.suffix}{suffix}"
+        return archive_file
+
+    def _move_same_device(self, file_path: Path, archive_folder: Path) -> Optional[Path]:
+        """
+        Перенос без копирования данных. Жесткая ссылка не перезаписывает
+        существующий файл архива; если ссылки не поддерживаются - rename
+        с проверкой, что имя все еще свободно (иначе - новое имя).
+        """
+        for attempt in range(3):
+            archive_file = self._free_name(archive_folder, file_path)
+            if attempt:
+                archive_file = archive_file.with_name(f"{file_path.stem}_{time.time_ns()}{file_path.suffix}")
+            try:
+                os.link(file_path, archive_file)
+            except FileExistsError:
+                continue
+            except OSError as e:
+                if e.errno == errno.EXDEV:
+                    return None
+                # Файловая система без жестких ссылок
+                if archive_file.exists():
+                    continue
+                os.rename(file_path, archive_file)
+                return archive_file
+            file_path.unlink()
+            return archive_file
+        return None
+
+    def _compress(self, file_path: Path, archive_file: Path) -> None:
+        """Потоковое сжатие файла в архив (запись во временный файл и атомарная замена)."""
+        import pyarrow as pa
+
+        tmp_file = archive_file.with_name(archive_file.name + '.part')
+        try:
+            with open(file_path, 'rb') as source, pa.CompressedOutputStream(str(tmp_file), self.compression) as sink:
+                while chunk := source.read(COPY_CHUNK_SIZE):
+                    sink.write(chunk)
+            shutil.copystat(file_path, tmp_file)
+            os.replace(tmp_file, archive_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+    def _tar_state(self, archive_file: Path) -> Dict[str, Any]:
+        """
+        Имена членов и конец данных tar архива за день. Архив читается один
+        раз (первая дозапись за день или после изменения архива извне), дальше
+        индекс ведется в памяти; хранится только индекс текущего архива.
+        """
+        size = archive_file.stat().st_size if archive_file.exists() else 0
+        state = self._tar_index.get(archive_file)
+        if state is not None and state['size'] == size:
+            return state
+
+        members, end = set(), 0
+        if size:
+            with tarfile.open(archive_file) as tar:
+                members = set(tar.getnames())
+                end = tar.offset
+        state = {'members': members, 'end': end, 'size': size}
+        self._tar_index = {archive_file: state}
+        return state
+
+    def _append_to_tar(self, file_path: Path, archive_file: Path) -> None:
+        """
+        Дозапись файла в tar архив за день (со сжатием члена архива, если задано).
+        Новый член пишется поверх завершающих нулевых блоков с известного
+        смещения, без повторного чтения заголовков всего архива.
+        """
+        with self._tar_lock:
+            source = file_path
+            compressed = None
+            if self.compression is not None:
+                compressed = archive_file.with_name(f".{file_path.name}{COMPRESSION_SUFFIXES[self.compression]}")
+                self._compress(file_path, compressed)
+                source = compressed
+            try:
+                state = self._tar_state(archive_file)
+                arcname = source.name.lstrip('.') if compressed else file_path.name
+                if arcname in state['members']:
+                    stem, _, rest = arcname.partition('.')
+                    arcname = f"{stem}_{time.time_ns()}.{rest}" if rest else f"{stem}_{time.time_ns()}"
+                archive_file.touch()
+                with open(archive_file, 'r+b') as f:
+                    f.seek(state['end'])
+                    with tarfile.open(fileobj=f, mode='w') as tar:
+                        tar.add(source, arcname=arcname)
+                        end = tar.offset
+                    f.truncate()
+                state['members'].add(arcname)
+                state['end'] = end
+                state['size'] = archive_file.stat().st_size
+            finally:
+                if compressed is not None:
+                    compressed.unlink(missing_ok=True)
@@ -8,7 +8,7 @@ from botocore.config import Config
 from botocore.exceptions import ClientError
 from pathlib import Path
 import logging
-from typing import List, Dict, Optional
+from typing import BinaryIO, List, Dict, Optional
 from functools import partial
 
 
@@ -117,6 +117,143 @@ class AsyncObjectStorage:
             self.logger.error(f"Неожиданная ошибка загрузки {object_name}: {e}")
             return False
 
+    async def upload_fileobj(self, fileobj: BinaryIO, object_name: str) -> bool:
+        """
+        Асинхронная загрузка из файлового объекта или потока.
+        Поток может быть непозиционируемым (например, pipe) - boto3 читает его
+        частями и при необходимости использует multipart upload.
+        """
+        try:
+            self.logger.info(f"Начало потоковой загрузки: {object_name}")
+
+            await self._run_in_executor(
+                self.s3_client.upload_fileobj,
+                fileobj,
+                self.bucket,
+                object_name
+            )
+
+            self.logger.info(f"Загружено: {object_name}")
+            return True
+
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Ошибка загрузки {object_name}: {error_code}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка загрузки {object_name}: {e}")
+            return False
+
+    async def create_multipart_upload(self, object_name: str) -> Optional[str]:
+        """Асинхронное создание multipart upload. Возвращает UploadId."""
+        try:
+            response = await self._run_in_executor(
+                self.s3_client.create_multipart_upload,
+                Bucket=self.bucket,
+                Key=object_name
+            )
+            self.logger.info(f"Начата multipart загрузка: {object_name}")
+            return response['UploadId']
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Ошибка создания multipart загрузки {object_name}: {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка создания multipart загрузки {object_name}: {e}")
+            return None
+
+    async def upload_part(self, object_name: str, upload_id: str, part_number: int,
+                          body: bytes) -> Optional[str]:
+        """
+        Асинхронная загрузка части multipart upload. Возвращает ETag.
+        Все части, кроме последней, должны быть не меньше 5 МБ.
+        """
+        try:
+            response = await self._run_in_executor(
+                self.s3_client.upload_part,
+                Bucket=self.bucket,
+                Key=object_name,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body
+            )
+            self.logger.debug(f"Загружена часть {part_number} ({len(body)} байт): {object_name}")
+            return response['ETag']
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Ошибка загрузки части {part_number} {object_name}: {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка загрузки части {part_number} {object_name}: {e}")
+            return None
+
+    async def complete_multipart_upload(self, object_name: str, upload_id: str,
+                                        parts: List[Dict]) -> Optional[str]:
+        """
+        Асинхронное завершение multipart upload.
+
+        Args:
+            parts: Список {'PartNumber': int, 'ETag': str}
+
+        Returns:
+            VersionId объекта ('null' без версионирования) или None при ошибке
+        """
+        try:
+            response = await self._run_in_executor(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=object_name,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': sorted(parts, key=lambda p: p['PartNumber'])}
+            )
+            version_id = response.get('VersionId', 'null')
+            self.logger.info(f"Завершена multipart загрузка: {object_name}, VersionId: {version_id}")
+            return version_id
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Ошибка завершения multipart загрузки {object_name}: {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка завершения multipart загрузки {object_name}: {e}")
+            return None
+
+    async def abort_multipart_upload(self, object_name: str, upload_id: str) -> bool:
+        """Асинхронная отмена multipart upload (удаляет загруженные части)."""
+        try:
+            await self._run_in_executor(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket,
+                Key=object_name,
+                UploadId=upload_id
+            )
+            self.logger.info(f"Multipart загрузка отменена: {object_name}")
+            return True
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code == 'NoSuchUpload':
+                return True  # Загрузка уже завершена или отменена
+            self.logger.error(f"Ошибка отмены multipart загрузки {object_name}: {error_code}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка отмены multipart загрузки {object_name}: {e}")
+            return False
+
+    async def get_version_id(self, object_name: str) -> Optional[str]:
+        """Асинхронное получение VersionId текущей версии объекта."""
+        try:
+            response = await self._run_in_executor(
+                self.s3_client.head_object,
+                Bucket=self.bucket,
+                Key=object_name
+            )
+            return response.get('VersionId', 'null')
+        except ClientError:
+            # Если версионирование не поддерживается
+            return 'null'
+        except Exception as e:
+            self.logger.error(f"Ошибка получения версии {object_name}: {e}")
+            return None
+
     async def upload_with_versioning(self, file_path: str, object_name: str) -> Optional[str]:
         """Асинхронная загрузка файла с версионированием."""
         try:
@@ -211,6 +348,38 @@ class AsyncObjectStorage:
             self.logger.error(f"Неожиданная ошибка скачивания версии {object_name}: {e}")
             return False
 
+    async def copy(self, source_object: str, object_name: str) -> Optional[str]:
+        """
+        Асинхронное копирование объекта внутри бакета на стороне сервера
+        (данные не скачиваются). Крупные объекты копируются частями.
+
+        Returns:
+            VersionId нового объекта или None при ошибке
+        """
+        try:
+            self.logger.info(f"Копирование: {source_object} -> {object_name}")
+
+            await self._run_in_executor(
+                self.s3_client.copy,
+                {'Bucket': self.bucket, 'Key': source_object},
+                self.bucket,
+                object_name
+            )
+
+            self.logger.info(f"Скопировано: {object_name}")
+            return await self.get_version_id(object_name)
+
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code in ('NoSuchKey', '404'):
+                self.logger.error(f"Исходный файл не найден: {source_object}")
+            else:
+                self.logger.error(f"Ошибка копирования {source_object}: {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка копирования {source_object}: {e}")
+            return None
+
     async def list_files(self, prefix: str = "") -> List[str]:
         """Асинхронное получение списка файлов в бакете."""
         try:
@@ -242,6 +411,91 @@ class AsyncObjectStorage:
             self.logger.error(f"Неожиданная ошибка получения списка файлов: {e}")
             return []
 
+    async def list_objects(self, prefix: str = "") -> List[Dict]:
+        """
+        Асинхронное получение списка объектов с размерами (все страницы листинга).
+
+        Returns:
+            Список {'Key', 'Size', 'LastModified', 'ETag'}
+        """
+        def list_all():
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            objects = []
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                objects.extend(page.get('Contents', []))
+            return objects
+
+        try:
+            objects = await self._run_in_executor(list_all)
+            self.logger.info(f"Получено объектов с префиксом '{prefix}': {len(objects)}")
+            return [{'Key': obj['Key'], 'Size': obj['Size'],
+                     'LastModified': obj.get('LastModified'), 'ETag': obj.get('ETag')}
+                    for obj in objects]
+        except ClientError as e:
+            self.logger.error(f"Ошибка получения списка объектов: {e}")
+            return []
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка получения списка объектов: {e}")
+            return []
+
+    async def read(self, object_name: str) -> Optional[bytes]:
+        """Асинхронное чтение объекта в память (для небольших объектов)."""
+        def get_body():
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=object_name)
+            return response['Body'].read()
+
+        try:
+            return await self._run_in_executor(get_body)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Ошибка чтения {object_name}: {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка чтения {object_name}: {e}")
+            return None
+
+    async def read_range(self, object_name: str, start: int, end: Optional[int] = None) -> Optional[bytes]:
+        """Асинхронное чтение диапазона байт объекта [start, end] (end включительно; None - до конца)."""
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+
+        def get_range():
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=object_name, Range=byte_range)
+            return response['Body'].read()
+
+        try:
+            return await self._run_in_executor(get_range)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Ошибка чтения {object_name} ({byte_range}): {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка чтения {object_name} ({byte_range}): {e}")
+            return None
+
+    async def head(self, object_name: str) -> Optional[Dict]:
+        """
+        Асинхронное получение метаданных объекта без скачивания.
+
+        Returns:
+            {'Size', 'ETag', 'VersionId'} или None, если объекта нет
+        """
+        try:
+            response = await self._run_in_executor(
+                self.s3_client.head_object,
+                Bucket=self.bucket,
+                Key=object_name
+            )
+            return {'Size': response['ContentLength'], 'ETag': response.get('ETag'),
+                    'VersionId': response.get('VersionId', 'null')}
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code not in ('404', 'NoSuchKey'):
+                self.logger.error(f"Ошибка получения метаданных {object_name}: {error_code}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Неожиданная ошибка получения метаданных {object_name}: {e}")
+            return None
+
     async def file_exists(self, object_name: str) -> bool:
         """Асинхронная проверка существования файла в S3."""
         try:
@@ -354,6 +608,30 @@ class AsyncObjectStorage:
             self.logger.error(f"Неожиданная ошибка удаления {object_name}: {e}")
             return False
 
+    async def delete_files(self, object_names: List[str]) -> List[str]:
+        """
+        Асинхронное пакетное удаление объектов (до 1000 ключей за запрос).
+
+        Returns:
+            Ключи, которые не удалось удалить
+        """
+        failed = []
+        for start in range(0, len(object_names), 1000):
+            chunk = object_names[start:start + 1000]
+            try:
+                response = await self._run_in_executor(
+                    self.s3_client.delete_objects,
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+                )
+                errors = response.get('Errors', [])
+                failed.extend(error['Key'] for error in errors)
+                self.logger.info(f"Удалено объектов: {len(chunk) - len(errors)}")
+            except Exception as e:
+                self.logger.error(f"Ошибка пакетного удаления: {e}")
+                failed.extend(chunk)
+        return failed
+
     async def get_bucket_info(self) -> Dict:
         """Получение информации о бакете."""
         try:
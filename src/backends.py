@@ -0,0 +1,273 @@
+"""
+Вычислительные бэкенды для этапов преобразования пайплайна:
+чтение, удаление дубликатов, приведение зарплаты к числу и фильтрация.
+
+pandas - эталонная реализация. Polars - опциональная (pip install polars):
+ленивое чтение CSV/Parquet/Arrow с проталкиванием фильтра в чтение файла и
+многопоточным выполнением. Бэкенд выбирается в PIPELINE_CONFIG['compute_backend'].
+"""
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Расширения файлов Arrow IPC (Feather v2)
+ARROW_IPC_FORMATS = ('.arrow', '.feather', '.ipc')
+
+# Сколько байт CSV проверять на корректность UTF-8 перед ленивым чтением
+UTF8_SAMPLE_SIZE = 1024 * 1024
+
+# Служебная колонка маски фильтра в плане Polars
+KEEP_COLUMN = '__keep'
+
+
+class PandasBackend:
+    """
+    Эталонный бэкенд на pandas: фрейм - это pd.DataFrame.
+    """
+
+    name = 'pandas'
+    native_formats = ()
+
+    def read(self, file_path: Path) -> Optional[pd.DataFrame]:
+        """Нативное чтение не поддерживается - используется чтение пайплайна."""
+        return None
+
+    def from_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df
+
+    def to_pandas(self, frame: pd.DataFrame) -> pd.DataFrame:
+        return frame
+
+    def row_count(self, frame: pd.DataFrame) -> Optional[int]:
+        return len(frame)
+
+    def schema(self, frame: pd.DataFrame) -> List[Tuple[Any, str, bool]]:
+        """Колонки фрейма: (имя, тип, является ли числовой)."""
+        return [(col, str(dtype), pd.api.types.is_numeric_dtype(dtype))
+                for col, dtype in frame.dtypes.items()]
+
+    def numeric_bounds(self, frame: pd.DataFrame, columns: List[Any]) -> pd.DataFrame:
+        """Min/max по колонкам одним вызовом: индекс ['min', 'max'], колонки - columns."""
+        return frame[columns].agg(['min', 'max'])
+
+    def filter(self, frame: pd.DataFrame, salary_columns: List[Any], threshold: float,
+               rules=None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Удаление дубликатов и фильтрация по зарплате одной общей маской.
+        Правила (FilterRuleSet) входят в ту же маску.
+
+        Returns:
+            (отфильтрованный DataFrame, статистика: original_count, duplicates,
+             filtered_count, filtered_by_rules, rule_counters, column_stats)
+        """
+        stats: Dict[str, Any] = {'original_count': len(frame), 'duplicates': 0, 'filtered_count': 0}
+        if frame.empty:
+            return frame, stats
+
+        # Маска уникальных строк (вместо материализации drop_duplicates)
+        unique_mask = ~frame.duplicated()
+        stats['duplicates'] = len(frame) - int(unique_mask.sum())
+
+        # Числовые значения зарплаты и общая маска фильтрации.
+        # Пустые значения (NaN) не проходят сравнение и отсекаются той же маской.
+        salaries = pd.DataFrame(
+            {col: pd.to_numeric(frame[col], errors='coerce') for col in salary_columns},
+            index=frame.index
+        )
+        salary_mask = (salaries > threshold).fillna(False).astype(bool).all(axis=1)
+        keep_mask = unique_mask & salary_mask
+        stats['filtered_count'] = int((unique_mask & ~salary_mask).sum())
+
+        if rules:
+            stats['rule_counters'] = {}
+            rules_mask = rules.evaluate(frame, stats['rule_counters'])
+            stats['filtered_by_rules'] = int((keep_mask & ~rules_mask).sum())
+            keep_mask &= rules_mask
+
+        # Статистика до и после фильтрации по всем колонкам сразу
+        before = salary_stats(salaries.loc[unique_mask])
+        after = salary_stats(salaries.loc[keep_mask])
+        stats['column_stats'] = {str(col): {'before': before[col], 'after': after[col]}
+                                 for col in salary_columns}
+
+        # Единственная материализация результата
+        processed_df = frame.loc[keep_mask]
+        processed_df = processed_df.assign(**{col: salaries.loc[keep_mask, col] for col in salary_columns})
+        return processed_df, stats
+
+
+class PolarsBackend:
+    """
+    Бэкенд на Polars: фрейм - это pl.LazyFrame.
+    Результат фильтрации возвращается как pd.DataFrame для этапов записи.
+    """
+
+    name = 'polars'
+    native_formats = ('.csv', '.parquet', '.jsonl', '.ndjson') + ARROW_IPC_FORMATS
+
+    def __init__(self):
+        try:
+            import polars as pl
+        except ImportError:
+            raise ImportError("Для compute_backend='polars' установите пакет polars: pip install polars")
+        self.pl = pl
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def read(self, file_path: Path):
+        """
+        Ленивое чтение CSV/Parquet/Arrow IPC/JSON Lines. Для остальных форматов и CSV не в UTF-8
+        возвращает None - тогда файл читается пайплайном через pandas.
+        """
+        ext = file_path.suffix.lower()
+        if ext == '.parquet':
+            return self.pl.scan_parquet(file_path)
+        if ext in ARROW_IPC_FORMATS:
+            # Несжатый Arrow IPC Polars читает через memory map без копирования
+            return self.pl.scan_ipc(file_path)
+        if ext in ('.jsonl', '.ndjson'):
+            return self.pl.scan_ndjson(file_path)
+        if ext == '.csv':
+            with open(file_path, 'rb') as f:
+                sample = f.read(UTF8_SAMPLE_SIZE)
+            try:
+                sample.decode('utf-8')
+            except UnicodeDecodeError as e:
+                if e.start < len(sample) - 3:  # Обрезанный многобайтовый символ в конце не считается
+                    return None
+            return self.pl.scan_csv(file_path, infer_schema_length=10000)
+        return None
+
+    def from_pandas(self, df: pd.DataFrame):
+        return self.pl.from_pandas(df).lazy()
+
+    def to_pandas(self, frame) -> pd.DataFrame:
+        return frame.collect().to_pandas()
+
+    def row_count(self, frame) -> Optional[int]:
+        return None  # Неизвестно до выполнения плана
+
+    def schema(self, frame) -> List[Tuple[Any, str, bool]]:
+        return [(name, str(dtype), dtype.is_numeric())
+                for name, dtype in frame.collect_schema().items()]
+
+    def numeric_bounds(self, frame, columns: List[Any]) -> pd.DataFrame:
+        pl = self.pl
+        row = frame.select(
+            [pl.col(col).min().alias(f"min_{i}") for i, col in enumerate(columns)]
+            + [pl.col(col).max().alias(f"max_{i}") for i, col in enumerate(columns)]
+        ).collect().row(0)
+        n = len(columns)
+        return pd.DataFrame([row[:n], row[n:]], index=['min', 'max'], columns=columns, dtype=float)
+
+    def _numeric(self, frame, col):
+        """Выражение с числовым значением колонки (нечисловые значения -> null)."""
+        pl = self.pl
+        if frame.collect_schema()[col].is_numeric():
+            return pl.col(col)
+        return pl.col(col).cast(pl.String).str.strip_chars().cast(pl.Float64, strict=False)
+
+    def filter(self, frame, salary_columns: List[Any], threshold: float,
+               rules=None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Тот же результат, что у PandasBackend.filter.
+
+        Дубликаты удаляются одним unique(): в том же плане к уникальным
+        строкам добавляется маска фильтра по зарплате, и одним collect_all
+        вычисляются уникальные строки и число строк файла. Статистика "до",
+        счетчики и результат считаются по уже материализованным уникальным
+        строкам без повторного прохода по файлу.
+        Правила применяются к результату через pandas.
+        """
+        pl = self.pl
+        numeric = {col: self._numeric(frame, col) for col in salary_columns}
+
+        predicate = pl.all_horizontal([(expr > threshold).fill_null(False) for expr in numeric.values()]) \
+            if numeric else pl.lit(True)
+        unique = (frame.unique(maintain_order=True)
+                  .with_columns([expr.alias(col) for col, expr in numeric.items()]
+                                + [predicate.alias(KEEP_COLUMN)]))
+        total = frame.select(pl.len())
+
+        total_df, unique_df = pl.collect_all([total, unique])
+        stats: Dict[str, Any] = {'collected_bytes': int(unique_df.estimated_size())}
+        before_df = unique_df.select(
+            [pl.col(col).min().alias(f"min_{i}") for i, col in enumerate(salary_columns)]
+            + [pl.col(col).max().alias(f"max_{i}") for i, col in enumerate(salary_columns)]
+            + [pl.col(col).mean().alias(f"mean_{i}") for i, col in enumerate(salary_columns)]
+            + [pl.col(col).count().alias(f"count_{i}") for i, col in enumerate(salary_columns)]
+        )
+        processed_df = unique_df.filter(pl.col(KEEP_COLUMN)).drop(KEEP_COLUMN).to_pandas()
+
+        original_count = total_df.item()
+        unique_count = len(unique_df)
+        stats.update({
+            'original_count': original_count,
+            'duplicates': original_count - unique_count,
+            'filtered_count': unique_count - len(processed_df),
+        })
+
+        if rules:
+            stats['rule_counters'] = {}
+            rules_mask = rules.evaluate(processed_df, stats['rule_counters'])
+            stats['filtered_by_rules'] = int((~rules_mask).sum())
+            processed_df = processed_df.loc[rules_mask]
+
+        after = salary_stats(processed_df[salary_columns])
+        stats['column_stats'] = {
+            str(col): {
+                'before': {stat: _to_float(before_df[f"{stat}_{i}"][0]) for stat in ('min', 'max', 'mean', 'count')},
+                'after': after[col],
+            }
+            for i, col in enumerate(salary_columns)
+        }
+        return processed_df.reset_index(drop=True), stats
+
+
+BACKENDS = {
+    'pandas': PandasBackend,
+    'polars': PolarsBackend,
+}
+
+
+def get_backend(name: str):
+    """Создание бэкенда по имени из конфигурации."""
+    try:
+        backend_class = BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Неизвестный бэкенд: {name}, доступны: {', '.join(BACKENDS)}")
+    return backend_class()
+
+
+def salary_stats(salaries: pd.DataFrame) -> Dict[Any, Dict[str, float]]:
+    """Min/max/mean/count (непустых значений) по всем колонкам зарплаты одним вызовом."""
+    if salaries.shape[1] == 0:
+        return {}
+    stats = salaries.apply(pd.to_numeric, errors='coerce').agg(['min', 'max', 'mean', 'count'])
+    return {col: {stat: _to_float(stats.at[stat, col]) for stat in stats.index} for col in salaries.columns}
+
+
+def _to_float(value) -> float:
+    return float('nan') if value is None or pd.isna(value) else float(value)
+
+
+def merge_column_stats(total: Dict[str, Dict[str, Dict[str, float]]],
+                       batch: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    """
+    Объединение статистики колонок зарплаты по пакетам (на месте в total).
+    Среднее пересчитывается с учетом количества непустых значений.
+    """
+    for col, stages in batch.items():
+        for stage, values in stages.items():
+            current = total.setdefault(col, {}).get(stage)
+            if current is None or not current['count']:
+                total[col][stage] = dict(values)
+                continue
+            if not values['count']:
+                continue
+            count = current['count'] + values['count']
+            current['mean'] = (current['mean'] * current['count'] + values['mean'] * values['count']) / count
+            current['min'] = min(current['min'], values['min'])
+            current['max'] = max(current['max'], values['max'])
+            current['count'] = count
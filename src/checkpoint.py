@@ -0,0 +1,133 @@
+"""
+Контрольные точки потоковой обработки больших файлов.
+
+После каждой загруженной части multipart upload сохраняется состояние:
+смещение во входном файле, номера и ETag загруженных частей и накопленная
+статистика. Перезапущенный пайплайн продолжает обработку с последней
+сохраненной точки, а не с начала файла.
+
+Хеши строк (для удаления дубликатов) сохраняются сегментами - только
+добавленные с предыдущей точки, поэтому стоимость сохранения не растет
+с размером файла.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+STATE_FILE = 'state.json'
+
+
+class CheckpointStore:
+    """
+    Хранилище контрольных точек: одна папка на входной файл.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def _dir(self, file_path: Path) -> Path:
+        """
+        Папка точки по имени файла, а не по пути: при work_claims файл
+        переносится между incoming и папками обработчиков, и точку
+        продолжает любой обработчик. Тот ли это файл, проверяет is_current.
+        """
+        digest = hashlib.sha1(Path(file_path).name.encode('utf-8')).hexdigest()[:16]
+        return self.folder / f"{Path(file_path).stem}_{digest}"
+
+    @staticmethod
+    def fingerprint(file_path: Path) -> Dict[str, Any]:
+        """Отпечаток входного файла: контрольная точка действительна только для него."""
+        stat = Path(file_path).stat()
+        return {'name': Path(file_path).name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def load(self, file_path: Path) -> Optional[Dict[str, Any]]:
+        """Загрузка состояния контрольной точки (None - точки нет или она повреждена)."""
+        state_file = self._dir(file_path) / STATE_FILE
+        if not state_file.exists():
+            return None
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Не удалось прочитать контрольную точку {state_file}: {e}")
+            return None
+
+    def is_current(self, state: Dict[str, Any], file_path: Path) -> bool:
+        """Файл не изменился с момента сохранения контрольной точки."""
+        return state.get('fingerprint') == self.fingerprint(file_path)
+
+    def save(self, file_path: Path, state: Dict[str, Any],
+             segments: Optional[Dict[str, np.ndarray]] = None) -> None:
+        """
+        Сохранение контрольной точки.
+
+        Args:
+            state: Состояние (JSON); state['parts'] - загруженные части
+            segments: Новые хеши по видам ('seen', 'pending') с предыдущей точки
+        """
+        checkpoint_dir = self._dir(file_path)
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        # Сегменты пишутся до состояния: сегмент без состояния при загрузке игнорируется
+        part = len(state.get('parts', []))
+        for kind, hashes in (segments or {}).items():
+            if len(hashes):
+                np.save(checkpoint_dir / f"{kind}_{part:05d}.npy", np.asarray(hashes, dtype=np.uint64))
+
+        tmp_file = checkpoint_dir / (STATE_FILE + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, checkpoint_dir / STATE_FILE)
+
+    def load_hashes(self, file_path: Path, kind: str, parts: int) -> np.ndarray:
+        """Хеши вида kind из сегментов, сохраненных вместе с первыми parts частями."""
+        segments = []
+        for segment in sorted(self._dir(file_path).glob(f"{kind}_*.npy")):
+            if int(segment.stem.split('_')[-1]) <= parts:
+                segments.append(np.load(segment))
+        return np.concatenate(segments) if segments else np.empty(0, dtype=np.uint64)
+
+    # --- Реестр незавершенных multipart upload ---
+    # Хранится отдельно от контрольных точек: upload, точка которого потеряна,
+    # находится по отпечатку входного файла и прерывается
+
+    def _upload_record(self, upload_id: str) -> Path:
+        return self.folder / "uploads" / (hashlib.sha1(upload_id.encode('utf-8')).hexdigest()[:16] + '.json')
+
+    def register_upload(self, file_path: Path, s3_key: str, upload_id: str) -> None:
+        record = self._upload_record(upload_id)
+        record.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = record.with_suffix('.tmp')
+        tmp_file.write_text(json.dumps({'fingerprint': self.fingerprint(file_path), 's3_key': s3_key,
+                                        'upload_id': upload_id}, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_file, record)
+
+    def unregister_upload(self, upload_id: str) -> None:
+        self._upload_record(upload_id).unlink(missing_ok=True)
+
+    def orphaned_uploads(self, file_path: Path, active_upload_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Незавершенные upload того же входного файла, кроме upload текущей контрольной точки."""
+        fingerprint = self.fingerprint(file_path)
+        uploads = []
+        for record in (self.folder / "uploads").glob("*.json"):
+            try:
+                upload = json.loads(record.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if upload['fingerprint'] == fingerprint and upload['upload_id'] != active_upload_id:
+                uploads.append(upload)
+        return uploads
+
+    def remove(self, file_path: Path) -> None:
+        """Удаление контрольной точки после успешной обработки."""
+        shutil.rmtree(self._dir(file_path), ignore_errors=True)
@@ -0,0 +1,56 @@
+"""
+Чтение файлов пакетами строк для потоковой обработки: JSON Lines, CSV и Parquet.
+В памяти одновременно находится один пакет.
+"""
+import codecs
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+from jsonl_reader import JSONL_FORMATS, iter_jsonl_batches
+
+# Форматы, которые можно обработать пакетами
+CHUNKED_FORMATS = ('.csv',) + JSONL_FORMATS + ('.parquet',)
+
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
+
+def detect_csv_encoding(file_path: Path) -> str:
+    """
+    Кодировка CSV по началу файла: utf-8, иначе cp1251 (тот же порядок, что при
+    чтении файла целиком).
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+    try:
+        # Незавершенный символ в конце выборки не считается ошибкой
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1251'
+
+
+def iter_csv_batches(file_path: Path, batch_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(file_path, encoding=detect_csv_encoding(file_path), chunksize=batch_rows) as reader:
+        yield from reader
+
+
+def iter_parquet_batches(file_path: Path, batch_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(file_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas()
+
+
+def iter_file_batches(file_path: Path, batch_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    """Пакеты строк файла любого формата из CHUNKED_FORMATS."""
+    ext = file_path.suffix.lower()
+    if ext in JSONL_FORMATS:
+        return (batch for batch, _ in iter_jsonl_batches(file_path, batch_rows))
+    if ext == '.csv':
+        return iter_csv_batches(file_path, batch_rows)
+    if ext == '.parquet':
+        return iter_parquet_batches(file_path, batch_rows)
+    raise ValueError(f"Формат {ext} не читается пакетами")
@@ -0,0 +1,337 @@
+"""
+Компакция результатов пайплайна в S3.
+
+За день в processed/<дата>/ накапливается много небольших объектов
+salary_filtered_*. Компакция объединяет их в несколько крупных Parquet
+файлов заданного размера в processed/<дата>/compacted/, записывает
+манифест и после проверки новых объектов удаляет исходные (или оставляет
+их удаление lifecycle policy бакета).
+"""
+import asyncio
+import io
+import json
+import logging
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from output_writers import (PARQUET_TAIL_BYTES, CountingWriter, parquet_footer_size, parquet_metadata,
+                            read_csv_output, stream_to_uploader)
+
+COMPACTED_FOLDER = 'compacted'
+MANIFEST_NAME = '_manifest.json'
+
+
+class PrefixCompactor:
+    """
+    Компакция объектов за день в крупные Parquet файлы.
+    """
+
+    def __init__(self, s3_client, config: Dict[str, Any]):
+        self.s3_client = s3_client
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.s3_folder = config.get('s3_processed_folder', 'processed')
+        self.target_bytes = int(config.get('compaction_target_bytes', 128 * 1024 * 1024))
+        self.small_object_bytes = int(config.get('compaction_small_object_bytes', 16 * 1024 * 1024))
+        self.min_objects = int(config.get('compaction_min_objects', 2))
+        self.concurrency = int(config.get('compaction_concurrency', 16))
+        self.delete_originals = config.get('compaction_delete_originals', 'delete')
+        if self.delete_originals not in ('delete', 'lifecycle'):
+            raise ValueError(f"Неизвестный режим compaction_delete_originals: {self.delete_originals}")
+        self.compression = config.get('parquet_compression', 'zstd')
+        self.row_group_size = int(config.get('parquet_row_group_size', 100_000))
+        self.source_column = config.get('compaction_source_column', 'source_object')
+
+    def _prefix(self, date: str) -> str:
+        return f"{self.s3_folder}/{date}/"
+
+    async def compact(self, date: str, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Компакция объектов за дату.
+
+        Args:
+            date: Дата в формате YYYY-MM-DD
+            dry_run: Только показать, какие объекты будут объединены
+
+        Returns:
+            Результат компакции: найденные и объединенные объекты, новые файлы, удаленные объекты
+        """
+        prefix = self._prefix(date)
+        manifest_key = f"{prefix}{COMPACTED_FOLDER}/{MANIFEST_NAME}"
+        result = {
+            'date': date,
+            'prefix': prefix,
+            'objects_found': 0,
+            'objects_compacted': 0,
+            'outputs': [],
+            'deleted': 0,
+            'failed': [],
+            'dry_run': dry_run,
+        }
+
+        manifest = await self._load_manifest(manifest_key)
+        already_compacted = {source for output in manifest['outputs'] for source in output['sources']}
+
+        candidates = self._select_candidates(await self.s3_client.list_objects(prefix), prefix, already_compacted)
+        result['objects_found'] = len(candidates)
+        if len(candidates) < self.min_objects:
+            self.logger.info(f"📦 Компакция {prefix}: объектов для объединения {len(candidates)}, "
+                             f"минимум {self.min_objects} - пропуск")
+            return result
+
+        groups = self._group_by_size(candidates)
+        self.logger.info(f"📦 Компакция {prefix}: {len(candidates)} объектов -> {len(groups)} файлов")
+        if dry_run:
+            result['outputs'] = [{'sources': [obj['Key'] for obj in group],
+                                  'input_bytes': sum(obj['Size'] for obj in group)} for group in groups]
+            return result
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        verified_sources = []
+        for number, group in enumerate(groups, 1):
+            output = await self._compact_group(prefix, group, number, semaphore, result)
+            if output is not None:
+                result['outputs'].append(output)
+                manifest['outputs'].append(output)
+                verified_sources.extend(output['sources'])
+
+        if not result['outputs']:
+            return result
+
+        # Манифест - до удаления исходных: по нему же пропускаются уже объединенные объекты
+        manifest['updated_at'] = datetime.now().isoformat()
+        content = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        if not await self.s3_client.upload_fileobj(io.BytesIO(content), manifest_key):
+            result['failed'].append(manifest_key)
+            self.logger.error(f"Не удалось загрузить манифест {manifest_key}, исходные объекты не удаляются")
+            return result
+        result['objects_compacted'] = len(verified_sources)
+
+        if self.delete_originals == 'delete':
+            not_deleted = await self.s3_client.delete_files(verified_sources)
+            result['deleted'] = len(verified_sources) - len(not_deleted)
+            result['failed'].extend(not_deleted)
+        else:
+            self.logger.info(f"   Исходные объекты ({len(verified_sources)}) удалит lifecycle policy бакета")
+
+        self.logger.info(f"   ✅ Компакция завершена: объединено {len(verified_sources)} объектов, "
+                         f"новых файлов {len(result['outputs'])}, удалено {result['deleted']}")
+        return result
+
+    def _select_candidates(self, objects: List[Dict], prefix: str, already_compacted: set) -> List[Dict]:
+        """
+        Небольшие результаты пайплайна непосредственно в папке дня
+        (без партиций, уже объединенных файлов и объектов из манифеста).
+        """
+        candidates = []
+        for obj in objects:
+            name = obj['Key'][len(prefix):]
+            if '/' in name or not name.startswith('salary_filtered_'):
+                continue
+            if not name.endswith(('.csv', '.parquet')) or obj['Key'] in already_compacted:
+                continue
+            if obj['Size'] >= self.small_object_bytes:
+                continue
+            candidates.append(obj)
+        return sorted(candidates, key=lambda obj: obj['Key'])
+
+    def _group_by_size(self, objects: List[Dict]) -> List[List[Dict]]:
+        """Разбиение объектов на группы с суммарным размером около target_bytes."""
+        groups, current, current_bytes = [], [], 0
+        for obj in objects:
+            if current and current_bytes + obj['Size'] > self.target_bytes:
+                groups.append(current)
+                current, current_bytes = [], 0
+            current.append(obj)
+            current_bytes += obj['Size']
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _spool_object(self, key: str, folder: Path, semaphore: asyncio.Semaphore) -> Optional[Path]:
+        """Скачивание исходного объекта во временную папку (в памяти - не больше одного объекта на чтение)."""
+        async with semaphore:
+            data = await self.s3_client.read(key)
+        if data is None:
+            return None
+        path = folder / key.rsplit('/', 1)[-1]
+        await asyncio.to_thread(path.write_bytes, data)
+        return path
+
+    def _read_source(self, key: str, path: Path) -> pd.DataFrame:
+        """Чтение результата пайплайна (CSV с комментариями или Parquet) в DataFrame."""
+        if key.endswith('.parquet'):
+            df = pd.read_parquet(path)
+        else:
+            with open(path, 'rb') as f:
+                df = read_csv_output(f)
+        return df.assign(**{self.source_column: key.rsplit('/', 1)[-1]})
+
+    def _scan_sources(self, spooled: Dict[str, Path], result: Dict) -> tuple[Dict[str, int], Any]:
+        """
+        Первый проход по исходным объектам (по одному в памяти): число строк
+        и общая схема. Колонка с разными типами в разных файлах - строковая,
+        целые и дробные числа приводятся к float64.
+        """
+        import pyarrow as pa
+
+        rows, types = {}, {}
+        for key, path in spooled.items():
+            try:
+                df = self._read_source(key, path)
+            except Exception as e:
+                self.logger.error(f"Не удалось прочитать {key}: {e}")
+                result['failed'].append(key)
+                continue
+            rows[key] = len(df)
+            for field in pa.Schema.from_pandas(df, preserve_index=False):
+                if not pa.types.is_null(field.type):
+                    types.setdefault(field.name, set()).add(field.type)
+                else:
+                    types.setdefault(field.name, set())
+
+        fields = []
+        for name, column_types in types.items():
+            if len(column_types) == 1:
+                column_type = column_types.pop()
+            elif column_types and all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in column_types):
+                column_type = pa.float64()
+            else:
+                column_type = pa.string()
+            fields.append(pa.field(name, column_type))
+        return rows, pa.schema(fields)
+
+    @staticmethod
+    def _conform(df: pd.DataFrame, schema) -> pd.DataFrame:
+        """Приведение фрейма исходного объекта к общей схеме."""
+        import pyarrow as pa
+
+        df = df.reindex(columns=schema.names)
+        for field in schema:
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+                df[field.name] = df[field.name].astype('string')
+            elif pa.types.is_floating(field.type):
+                df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype('float64')
+        return df
+
+    async def _compact_group(self, prefix: str, group: List[Dict], number: int,
+                             semaphore: asyncio.Semaphore, result: Dict) -> Optional[Dict[str, Any]]:
+        """
+        Объединение группы объектов в один Parquet файл с проверкой загрузки.
+
+        Исходные объекты скачиваются во временную папку; Parquet пишется по
+        одному исходному объекту в pipe, из которого одновременно читает
+        загрузчик S3, поэтому в памяти нет ни всей группы, ни результата.
+        Перед удалением исходных загруженный файл проверяется без повторного
+        скачивания: размер объекта равен числу записанных байт, а футер,
+        прочитанный ranged GET, содержит сумму строк исходных объектов.
+
+        Returns:
+            Запись манифеста или None при ошибке
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        keys = [obj['Key'] for obj in group]
+        output_key = f"{prefix}{COMPACTED_FOLDER}/part-{int(time.time())}-{number:04d}.parquet"
+
+        with tempfile.TemporaryDirectory(prefix='compaction_') as work:
+            work_dir = Path(work)
+            (work_dir / "sources").mkdir()
+            paths = await asyncio.gather(*(self._spool_object(key, work_dir / "sources", semaphore)
+                                           for key in keys))
+            result['failed'].extend(key for key, path in zip(keys, paths) if path is None)
+            spooled = {key: path for key, path in zip(keys, paths) if path is not None}
+
+            rows, schema = await asyncio.to_thread(self._scan_sources, spooled, result)
+            sources = [key for key in keys if key in rows]
+            if not sources:
+                return None
+            expected_rows = sum(rows.values())
+            schema = schema.with_metadata(parquet_metadata(
+                {'compacted_sources': len(sources), 'compacted_at': datetime.now().isoformat()}))
+
+            def write(sink) -> tuple[int, int]:
+                written, counter = 0, CountingWriter(sink)
+                with pq.ParquetWriter(counter, schema, compression=self.compression) as writer:
+                    for key in sources:
+                        df = self._conform(self._read_source(key, spooled[key]), schema)
+                        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False, safe=False),
+                                           row_group_size=self.row_group_size)
+                        written += len(df)
+                return written, counter.bytes_written
+
+            try:
+                uploaded, written = await stream_to_uploader(
+                    write, lambda stream: self.s3_client.upload_fileobj(stream, output_key))
+            except Exception as e:
+                self.logger.error(f"Ошибка записи {output_key}: {e}")
+                uploaded, written = False, None
+            if not uploaded:
+                result['failed'].append(output_key)
+                return None
+            written, written_bytes = written
+
+        # Проверка: загружены все байты, футер читается и содержит все строки исходных объектов
+        info = await self.s3_client.head(output_key)
+        uploaded_rows = None
+        if info is not None and info['Size'] == written_bytes:
+            uploaded_rows = await self._uploaded_rows(output_key, info['Size'])
+        if uploaded_rows is None or uploaded_rows != expected_rows or written != expected_rows:
+            self.logger.error(f"Проверка {output_key} не пройдена: ожидалось {expected_rows} строк "
+                              f"({written_bytes} байт), записано {written}, в S3 {uploaded_rows} "
+                              f"({info and info['Size']} байт)")
+            result['failed'].append(output_key)
+            await self.s3_client.delete_files([output_key])
+            return None
+
+        self.logger.info(f"   📝 {output_key}: {len(sources)} объектов, {expected_rows} строк, {info['Size']} байт")
+        return {
+            'key': output_key,
+            'rows': expected_rows,
+            'bytes': info['Size'],
+            'input_bytes': sum(obj['Size'] for obj in group if obj['Key'] in sources),
+            'version_id': info.get('VersionId'),
+            'sources': sources,
+            'created_at': datetime.now().isoformat(),
+        }
+
+    async def _uploaded_rows(self, key: str, size: int) -> Optional[int]:
+        """
+        Число строк загруженного Parquet по футеру: ranged GET последних байт
+        объекта (второй запрос - только если футер больше PARQUET_TAIL_BYTES).
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tail = await self.s3_client.read_range(key, max(0, size - PARQUET_TAIL_BYTES))
+        footer_size = parquet_footer_size(tail or b'')
+        if footer_size is None or footer_size > size:
+            self.logger.error(f"Загруженный {key} не заканчивается футером Parquet")
+            return None
+        if footer_size > len(tail):
+            tail = await self.s3_client.read_range(key, size - footer_size)
+            if tail is None:
+                return None
+        try:
+            return pq.read_metadata(pa.BufferReader(tail[-footer_size:])).num_rows
+        except Exception as e:
+            self.logger.error(f"Не удалось прочитать футер загруженного {key}: {e}")
+            return None
+
+    async def _load_manifest(self, manifest_key: str) -> Dict[str, Any]:
+        """Манифест компакции за день (пустой, если компакция еще не выполнялась)."""
+        manifest = {'outputs': []}
+        if await self.s3_client.head(manifest_key) is None:
+            return manifest
+        data = await self.s3_client.read(manifest_key)
+        try:
+            manifest = json.loads(data)
+        except (TypeError, ValueError) as e:
+            raise RuntimeError(f"Манифест {manifest_key} поврежден: {e}")
+        return manifest
@@ -0,0 +1,221 @@
+"""
+Персистентный индекс хешей строк для удаления дубликатов между файлами.
+
+Хранит 64-битные хеши уже выгруженных строк в отсортированных массивах
+numpy - сегментами по дням (8 байт на строку, точная проверка без
+ложных срабатываний). Проверка членства векторизована через searchsorted.
+Файлы старше retention_days удаляются при загрузке и при смене дня в
+работающем процессе.
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from file_lock import file_lock
+
+LOCK_FILE = '.row_hashes.lock'
+
+
+def hash_rows(df: pd.DataFrame, key_columns: Optional[List[str]] = None) -> np.ndarray:
+    """
+    Векторизованный 64-битный хеш строк по ключевым колонкам (по умолчанию - все).
+    Числа приводятся к float64, остальные значения - к строкам, чтобы хеш
+    не зависел от типа колонки в конкретном файле (50000 и 50000.0 совпадают).
+    """
+    columns = [col for col in key_columns if col in df.columns] if key_columns else list(df.columns)
+    normalized = pd.DataFrame({
+        str(col): (pd.to_numeric(df[col], errors='coerce').astype('float64')
+                   if pd.api.types.is_numeric_dtype(df[col]) else df[col].astype(str))
+        for col in columns
+    }, index=df.index)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy(dtype=np.uint64)
+
+
+class RowHashIndex:
+    """
+    Индекс хешей строк с хранением по дням и ограниченным сроком хранения.
+
+    Каждый commit записывает отдельный отсортированный сегмент
+    row_hashes_<день>_<метка>.npy (только дозапись, без перезаписи индекса
+    дня). При загрузке сегменты прошедших дней сливаются в один файл.
+    В памяти сегменты дня сливаются по принципу LSM: соседние сегменты
+    близкого размера объединяются, поэтому сегментов O(log n), а общий
+    объем слияний за день - O(n log n).
+
+    contains() вызывается из потоков обработки файлов: список сегментов
+    копируется под блокировкой, поиск идет без нее.
+
+    Папку индекса могут делить несколько обработчиков (shared, при
+    work_claims): загрузка со слиянием файлов выполняется под монопольной
+    блокировкой lock-файла, а перед каждой проверкой contains() под
+    разделяемой подгружаются сегменты, записанные другими обработчиками.
+    Строки, которые два обработчика выгружают одновременно (между проверкой
+    и commit), могут пройти оба - как и у параллельных файлов одного процесса.
+    """
+
+    def __init__(self, folder: str, retention_days: int = 30, shared: bool = False):
+        self.folder = Path(folder)
+        self.retention_days = retention_days
+        self.shared = shared
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        self._days = {}  # дата -> список отсортированных массивов uint64
+        self._files = defaultdict(set)  # дата -> имена загруженных файлов сегментов
+        self._lock = threading.RLock()
+        self._lock_file = self.folder / LOCK_FILE
+        self._today = datetime.now().strftime('%Y-%m-%d')
+        with file_lock(self._lock_file):
+            self._load()
+
+    def __len__(self) -> int:
+        return sum(len(hashes) for segments in self._days.values() for hashes in segments)
+
+    def _segment_file(self, day: str) -> Path:
+        stamp = datetime.now().strftime('%H%M%S%f')
+        return self.folder / f"row_hashes_{day}_{stamp}_{os.getpid()}_{uuid.uuid4().hex[:8]}.npy"
+
+    def _scan(self) -> Dict[str, List[Path]]:
+        """Файлы сегментов по дням (без временных)."""
+        files_by_day = defaultdict(list)
+        for day_file in sorted(self.folder.glob("row_hashes_*.npy")):
+            if '.tmp' not in day_file.name:
+                files_by_day[day_file.stem[len("row_hashes_"):][:10]].append(day_file)
+        return files_by_day
+
+    def _load_files(self, day: str, day_files: List[Path]) -> None:
+        for day_file in day_files:
+            try:
+                self._add_segment(day, np.load(day_file))
+            except Exception as e:
+                self.logger.warning(f"Не удалось загрузить индекс {day_file.name}: {e}")
+                continue
+            self._files[day].add(day_file.name)
+
+    def _oldest_day(self) -> str:
+        return (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+
+    def _delete_expired(self, day_files: List[Path]) -> None:
+        for day_file in day_files:
+            day_file.unlink(missing_ok=True)
+            self.logger.info(f"Удален устаревший индекс дубликатов: {day_file.name}")
+
+    def _load(self) -> None:
+        """Загрузка индексов за период хранения, удаление устаревших, слияние сегментов прошедших дней."""
+        oldest = self._oldest_day()
+        for day, day_files in self._scan().items():
+            if day < oldest:
+                self._delete_expired(day_files)
+                continue
+            self._load_files(day, day_files)
+            if day != self._today and len(day_files) > 1:
+                self._compact_files(day, day_files)
+        self.logger.info(f"Индекс дубликатов загружен: {len(self)} хешей за {len(self._days)} дн.")
+
+    def _check_day(self) -> None:
+        """
+        При смене дня в работающем процессе - удаление дней старше срока
+        хранения из памяти и с диска (под монопольной блокировкой папки).
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today == self._today:
+            return
+        oldest = self._oldest_day()
+        with file_lock(self._lock_file), self._lock:
+            if today == self._today:
+                return
+            self._today = today
+            for day in [day for day in self._days if day < oldest]:
+                self._days.pop(day, None)
+                self._files.pop(day, None)
+            for day, day_files in self._scan().items():
+                if day < oldest:
+                    self._delete_expired(day_files)
+
+    def refresh(self) -> None:
+        """
+        Подгрузка сегментов, записанных другими обработчиками. Если часть уже
+        загруженных файлов дня исчезла (другой обработчик слил их), день
+        перечитывается целиком.
+        """
+        oldest = self._oldest_day()
+        with file_lock(self._lock_file, shared=True), self._lock:
+            for day, day_files in self._scan().items():
+                if day < oldest:
+                    continue
+                known = self._files.get(day, set())
+                names = {day_file.name for day_file in day_files}
+                if names <= known:
+                    continue
+                if known - names:
+                    self._days.pop(day, None)
+                    self._files.pop(day, None)
+                    self._load_files(day, day_files)
+                else:
+                    self._load_files(day, [day_file for day_file in day_files if day_file.name not in known])
+
+    def _add_segment(self, day: str, hashes: np.ndarray) -> None:
+        with self._lock:
+            segments = list(self._days.get(day, []))
+            segments.append(hashes)
+            while len(segments) > 1 and len(segments[-2]) <= 2 * len(segments[-1]):
+                last = segments.pop()
+                segments[-1] = np.union1d(segments[-1], last)
+            self._days[day] = segments
+
+    def _compact_files(self, day: str, day_files: List[Path]) -> None:
+        """
+        Слияние файлов дня в один новый сегмент (под монопольной блокировкой
+        папки). Исходные файлы удаляются после записи нового.
+        """
+        merged = np.unique(np.concatenate(self._days[day]))
+        merged_file = self._write_segment(day, merged)
+        for day_file in day_files:
+            day_file.unlink(missing_ok=True)
+        self._days[day] = [merged]
+        self._files[day] = {merged_file.name}
+
+    def _write_segment(self, day: str, hashes: np.ndarray) -> Path:
+        segment_file = self._segment_file(day)
+        tmp_file = segment_file.with_name(segment_file.stem + '.tmp.npy')
+        np.save(tmp_file, hashes)
+        os.replace(tmp_file, segment_file)
+        return segment_file
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Булева маска: встречался ли хеш ранее."""
+        self._check_day()
+        if self.shared:
+            self.refresh()
+        with self._lock:
+            segments = [day_hashes for day_segments in self._days.values() for day_hashes in day_segments]
+        found = np.zeros(len(hashes), dtype=bool)
+        for day_hashes in segments:
+            if len(day_hashes) == 0:
+                continue
+            positions = np.searchsorted(day_hashes, hashes)
+            positions[positions == len(day_hashes)] = 0
+            found |= day_hashes[positions] == hashes
+        return found
+
+    def commit(self, hashes: np.ndarray) -> None:
+        """
+        Добавление хешей в индекс текущего дня: запись нового сегмента.
+        Вызывается только после успешной выгрузки результата.
+        """
+        if len(hashes) == 0:
+            return
+        self._check_day()
+        day = self._today
+        hashes = np.unique(hashes.astype(np.uint64))
+        with self._lock:
+            self._files[day].add(self._write_segment(day, hashes).name)
+            self._add_segment(day, hashes)
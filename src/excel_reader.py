@@ -0,0 +1,122 @@
+"""
+Чтение Excel файлов для пайплайна.
+
+Быстрый движок calamine (pip install python-calamine) используется, если он
+установлен; иначе - openpyxl/xlrd по умолчанию pandas. Результат чтения
+кэшируется в Parquet по хешу содержимого файла и параметрам чтения, поэтому
+повторная обработка той же книги не разбирает Excel заново. Файл кэша
+появляется атомарно (запись во временный файл и переименование), а
+нечитаемый файл кэша удаляется и книга разбирается заново.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional, Union
+
+import pandas as pd
+
+from file_utils import file_sha256
+
+
+def calamine_available() -> bool:
+    """Установлен ли движок calamine."""
+    try:
+        import python_calamine  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ExcelReader:
+    """
+    Чтение Excel с выбором движка, поддержкой нескольких листов и кэшем конвертации.
+    """
+
+    def __init__(self, engine: str = 'auto', sheets: Union[None, str, List[str]] = None,
+                 sheet_column: str = 'sheet', cache_folder: Optional[str] = None,
+                 cache_max_files: int = 100):
+        """
+        Args:
+            engine: 'auto' (calamine, если установлен), 'calamine', 'openpyxl' и т.д.
+            sheets: None - первый лист, 'all' - все листы, список - указанные листы
+            sheet_column: Колонка с именем листа при чтении нескольких листов
+            cache_folder: Папка кэша конвертации в Parquet (None - без кэша)
+            cache_max_files: Максимальное количество файлов в кэше
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.sheets = sheets
+        self.sheet_column = sheet_column
+        self.cache_folder = Path(cache_folder) if cache_folder else None
+        self.cache_max_files = cache_max_files
+
+        if engine == 'auto':
+            engine = 'calamine' if calamine_available() else None
+        elif engine == 'calamine' and not calamine_available():
+            self.logger.warning("Движок calamine не установлен (pip install python-calamine), "
+                                "используется движок pandas по умолчанию")
+            engine = None
+        self.engine = engine
+
+        if self.cache_folder:
+            self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def read(self, file_path: Path) -> pd.DataFrame:
+        """Чтение книги с использованием кэша конвертации."""
+        cache_file = self._cache_file(file_path) if self.cache_folder else None
+        if cache_file is not None and cache_file.exists():
+            try:
+                df = pd.read_parquet(cache_file)
+            except Exception as e:
+                cache_file.unlink(missing_ok=True)
+                self.logger.warning(f"   ⚠️ Поврежденный файл кэша Excel {cache_file.name} удален: {e}")
+            else:
+                self.logger.info(f"   ⚡ Excel из кэша конвертации: {cache_file.name}")
+                cache_file.touch()  # Обновляем время использования для вытеснения
+                return df
+
+        df = self._read_excel(file_path)
+
+        if cache_file is not None:
+            # Временный файл в той же папке: в кэше не бывает недописанных файлов
+            tmp_file = cache_file.with_name(f"{cache_file.name}.{uuid.uuid4().hex[:8]}.tmp")
+            try:
+                df.to_parquet(tmp_file, index=False)
+                os.replace(tmp_file, cache_file)
+                self._evict()
+            except Exception as e:
+                tmp_file.unlink(missing_ok=True)
+                self.logger.warning(f"   ⚠️ Не удалось сохранить Excel в кэш: {e}")
+        return df
+
+    def _read_excel(self, file_path: Path) -> pd.DataFrame:
+        """Чтение одного или нескольких листов."""
+        sheet_name = None if self.sheets == 'all' else (self.sheets or 0)
+        self.logger.info(f"   Чтение Excel, движок: {self.engine or 'по умолчанию'}")
+        data = pd.read_excel(file_path, sheet_name=sheet_name, engine=self.engine)
+
+        if isinstance(data, pd.DataFrame):
+            return data
+
+        # Несколько листов: объединяем, сохраняя имя листа
+        frames = [sheet_df.assign(**{self.sheet_column: name}) for name, sheet_df in data.items()
+                  if not sheet_df.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _cache_file(self, file_path: Path) -> Path:
+        """Путь в кэше: хеш содержимого + параметры чтения (движок, листы, колонка листа)."""
+        sheets = self.sheets if self.sheets is None or isinstance(self.sheets, str) \
+            else '\n'.join(map(str, self.sheets))
+        options = '\0'.join(map(str, (self.engine, sheets, self.sheet_column)))
+        options_hash = hashlib.sha256(options.encode('utf-8')).hexdigest()[:8]
+        return self.cache_folder / f"{file_sha256(file_path)}_{options_hash}.parquet"
+
+    def _evict(self) -> None:
+        """Удаление давно неиспользуемых файлов сверх cache_max_files."""
+        cached = sorted(self.cache_folder.glob("*.parquet"), key=lambda p: p.stat().st_mtime)
+        for old_file in cached[:max(0, len(cached) - self.cache_max_files)]:
+            old_file.unlink(missing_ok=True)
+
@@ -0,0 +1,49 @@
+"""
+Блокировка через lock-файл для хранилищ, общих для нескольких обработчиков
+(work_claims): индекс дубликатов, манифест партиций.
+
+flock блокирует и между процессами, и между потоками одного процесса
+(у каждого захвата свой дескриптор). На NFS Linux выполняет flock через
+блокировки NFS (NLM/NFSv4). На Windows блокировка не выполняется - там
+пайплайн работает одним процессом.
+
+    with file_lock(folder / '.lock'):
+        ...
+    async with async_file_lock(path):  # ожидание блокировки - в отдельном потоке
+        ...
+"""
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False) -> Iterator[None]:
+    """Монопольная (или разделяемая при shared) блокировка lock-файла path."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def async_file_lock(path: Path) -> AsyncIterator[None]:
+    """Монопольная блокировка без блокировки цикла событий на время ожидания."""
+    lock = file_lock(path)
+    await asyncio.to_thread(lock.__enter__)
+    try:
+        yield
+    finally:
+        lock.__exit__(None, None, None)
@@ -0,0 +1,17 @@
+"""
+Вспомогательные функции для работы с файлами пайплайна.
+"""
+import hashlib
+from pathlib import Path
+
+# Размер блока чтения при хешировании
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: Path) -> str:
+    """SHA-256 содержимого файла (читается блоками, без загрузки целиком в память)."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
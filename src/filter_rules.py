@@ -0,0 +1,292 @@
+"""
+Декларативные правила фильтрации для пайплайна.
+Правила описываются в PIPELINE_CONFIG['filter_rules'] и компилируются
+один раз при запуске в векторизованные функции над DataFrame.
+
+Пример конфигурации:
+    'filter_rules': [
+        {'name': 'active_departments', 'column': 'department', 'op': 'in', 'values': ['IT', 'HR']},
+        {'column': 'salary', 'op': 'range', 'min': 55000, 'max': 500000},
+        {'any': [
+            {'column': 'email', 'op': 'regex', 'pattern': r'@company\\.ru$'},
+            {'column': 'email', 'op': 'isnull'},
+        ]},
+        {'op': 'expr', 'expr': 'bonus < salary * 0.5'},  # колонки определяются по выражению
+    ]
+
+Правила верхнего уровня объединяются через AND, вложенные группы - через
+'all' (AND) или 'any' (OR).
+"""
+import ast
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+# Поддерживаемые операции
+RULE_OPERATIONS = ('range', 'gt', 'ge', 'lt', 'le', 'eq', 'ne', 'in', 'not_in',
+                   'regex', 'isnull', 'notnull', 'expr')
+
+
+def _new_counters() -> Dict[str, float]:
+    return {'calls': 0, 'rows': 0, 'rejected': 0, 'total_time': 0.0}
+
+
+def merge_rule_counters(total: Dict[str, Dict[str, float]], counters: Dict[str, Dict[str, float]]) -> None:
+    """Сложение счетчиков правил (на месте в total), например по пакетам одного файла."""
+    for name, values in counters.items():
+        current = total.setdefault(name, _new_counters())
+        for key, value in values.items():
+            current[key] += value
+
+
+class FilterRule:
+    """
+    Скомпилированное правило фильтрации.
+    Хранит векторизованную функцию-предикат; счетчики выполнения пишутся
+    в словарь вызывающего (правило используется параллельно для разных файлов).
+    """
+
+    def __init__(self, name: str, evaluator: Callable[..., pd.Series],
+                 columns: List[str], children: Optional[List['FilterRule']] = None):
+        self.name = name
+        self.columns = columns
+        self.children = children or []
+        self._evaluator = evaluator  # у групп - evaluator(df, counters)
+
+    def evaluate(self, df: pd.DataFrame, counters: Dict[str, Dict[str, float]]) -> pd.Series:
+        """Вычисление булевой маски правила с замером времени в counters[имя правила]."""
+        start = time.perf_counter()
+        mask = self._evaluator(df, counters) if self.children else self._evaluator(df)
+        rule_counters = counters.setdefault(self.name, _new_counters())
+        rule_counters['total_time'] += time.perf_counter() - start
+        rule_counters['calls'] += 1
+        rule_counters['rows'] += len(df)
+        rule_counters['rejected'] += int((~mask).sum())
+        return mask
+
+    def timings(self, counters: Dict[str, Dict[str, float]]) -> List[Dict[str, Any]]:
+        """Статистика выполнения правила и его вложенных правил по счетчикам counters."""
+        values = counters.get(self.name) or _new_counters()
+        total_time = values['total_time']
+        stats = [{
+            'rule': self.name,
+            'calls': values['calls'],
+            'rows': values['rows'],
+            'rejected': values['rejected'],
+            'total_ms': round(total_time * 1000, 3),
+            'rows_per_sec': round(values['rows'] / total_time) if total_time > 0 else None,
+        }]
+        for child in self.children:
+            stats.extend(child.timings(counters))
+        return stats
+
+
+class FilterRuleSet:
+    """
+    Набор скомпилированных правил, объединенных через AND.
+
+    evaluate() пишет счетчики вызова в переданный словарь (статистика файла),
+    timings(counters) строит по нему отчет; суммарная статистика за время
+    работы процесса ведется отдельно, под блокировкой - timings() без аргументов.
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        """
+        Компиляция правил из конфигурации.
+
+        Args:
+            rules: Список описаний правил из PIPELINE_CONFIG['filter_rules']
+
+        Raises:
+            ValueError: если описание правила некорректно
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.rules = [self._compile(rule, f"rule_{i}") for i, rule in enumerate(rules or [], 1)]
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def evaluate(self, df: pd.DataFrame, counters: Optional[Dict[str, Dict[str, float]]] = None) -> pd.Series:
+        """
+        Вычисление общей маски всех правил.
+        Правила, колонок которых нет в файле, пропускаются.
+
+        Args:
+            df: Данные
+            counters: Словарь счетчиков вызова (дополняется на месте)
+        """
+        call_counters: Dict[str, Dict[str, float]] = {}
+        mask = pd.Series(True, index=df.index)
+        for rule in self.rules:
+            missing = [col for col in rule.columns if col not in df.columns]
+            if missing:
+                self.logger.warning(f"   ⚠️ Правило {rule.name} пропущено: нет колонок {missing}")
+                continue
+            mask &= rule.evaluate(df, call_counters)
+
+        if counters is not None:
+            merge_rule_counters(counters, call_counters)
+        with self._lock:
+            merge_rule_counters(self._totals, call_counters)
+        return mask
+
+    def timings(self, counters: Optional[Dict[str, Dict[str, float]]] = None) -> List[Dict[str, Any]]:
+        """
+        Статистика времени выполнения по каждому правилу: по счетчикам counters
+        (например, одного файла) или за все время работы процесса.
+        """
+        if counters is None:
+            with self._lock:
+                counters = {name: dict(values) for name, values in self._totals.items()}
+        stats = []
+        for rule in self.rules:
+            stats.extend(rule.timings(counters))
+        return stats
+
+    def _compile(self, spec: Dict[str, Any], default_name: str) -> FilterRule:
+        """Компиляция одного описания правила в FilterRule."""
+        if not isinstance(spec, dict):
+            raise ValueError(f"Правило {default_name} должно быть словарем: {spec!r}")
+
+        name = spec.get('name', default_name)
+
+        # Группы правил: all (AND) / any (OR)
+        for group, combine in (('all', _combine_all), ('any', _combine_any)):
+            if group in spec:
+                children = [self._compile(child, f"{name}.{i}")
+                            for i, child in enumerate(spec[group], 1)]
+                if not children:
+                    raise ValueError(f"Правило {name}: пустая группа '{group}'")
+                columns = sorted({col for child in children for col in child.columns})
+                return FilterRule(name, combine(children), columns, children)
+
+        op = spec.get('op')
+        if op not in RULE_OPERATIONS:
+            raise ValueError(f"Правило {name}: неизвестная операция {op!r}, "
+                             f"доступны: {', '.join(RULE_OPERATIONS)}")
+
+        if op == 'expr':
+            expression = spec.get('expr')
+            if not expression:
+                raise ValueError(f"Правило {name}: не задано выражение 'expr'")
+            # Колонки выражения определяются по его разбору: правило с отсутствующими
+            # колонками пропускается, как и остальные правила
+            columns = sorted(set(spec.get('columns', [])) | set(_expr_columns(name, expression)))
+            return FilterRule(name, _compile_expr(expression), columns)
+
+        column = spec.get('column')
+        if column is None:
+            raise ValueError(f"Правило {name}: не задана колонка 'column'")
+
+        return FilterRule(name, _compile_column_predicate(name, op, column, spec), [column])
+
+
+def _combine_all(children: List[FilterRule]) -> Callable[..., pd.Series]:
+    def evaluator(df: pd.DataFrame, counters: Dict[str, Dict[str, float]]) -> pd.Series:
+        mask = children[0].evaluate(df, counters)
+        for child in children[1:]:
+            mask = mask & child.evaluate(df, counters)
+        return mask
+    return evaluator
+
+
+def _combine_any(children: List[FilterRule]) -> Callable[..., pd.Series]:
+    def evaluator(df: pd.DataFrame, counters: Dict[str, Dict[str, float]]) -> pd.Series:
+        mask = children[0].evaluate(df, counters)
+        for child in children[1:]:
+            mask = mask | child.evaluate(df, counters)
+        return mask
+    return evaluator
+
+
+def _expr_columns(name: str, expression: str) -> List[str]:
+    """
+    Имена колонок, на которые ссылается выражение DataFrame.eval
+    (включая имена в обратных кавычках). Имена вызываемых функций не считаются колонками.
+    """
+    quoted = re.findall(r'`([^`]*)`', expression)
+    try:
+        tree = ast.parse(re.sub(r'`[^`]*`', '__quoted__', expression).strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Правило {name}: некорректное выражение {expression!r}: {e}")
+    functions = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    names = {node.id for node in ast.walk(tree)
+             if isinstance(node, ast.Name) and id(node) not in functions and node.id != '__quoted__'}
+    return sorted(names | set(quoted))
+
+
+def _compile_expr(expression: str) -> Callable[[pd.DataFrame], pd.Series]:
+    """Выражение в стиле DataFrame.eval (использует numexpr, если он установлен)."""
+    def evaluator(df: pd.DataFrame) -> pd.Series:
+        return df.eval(expression).fillna(False).astype(bool)
+    return evaluator
+
+
+def _compile_column_predicate(name: str, op: str, column: str,
+                              spec: Dict[str, Any]) -> Callable[[pd.DataFrame], pd.Series]:
+    """Компиляция предиката над одной колонкой."""
+    if op == 'isnull':
+        return lambda df: df[column].isna()
+    if op == 'notnull':
+        return lambda df: df[column].notna()
+
+    if op in ('in', 'not_in'):
+        values = spec.get('values')
+        if not isinstance(values, (list, tuple, set)):
+            raise ValueError(f"Правило {name}: 'values' должен быть списком")
+        values = list(values)
+        if op == 'in':
+            return lambda df: df[column].isin(values)
+        return lambda df: ~df[column].isin(values) & df[column].notna()
+
+    if op == 'regex':
+        try:
+            pattern = re.compile(spec['pattern'], 0 if spec.get('case', True) else re.IGNORECASE)
+        except (KeyError, re.error) as e:
+            raise ValueError(f"Правило {name}: некорректный 'pattern': {e}")
+        return lambda df: df[column].astype('string').str.contains(pattern, na=False).astype(bool)
+
+    if op == 'range':
+        low, high = spec.get('min'), spec.get('max')
+        if low is None and high is None:
+            raise ValueError(f"Правило {name}: для 'range' нужен 'min' и/или 'max'")
+        inclusive = spec.get('inclusive', 'both')
+
+        def evaluator(df: pd.DataFrame) -> pd.Series:
+            values = pd.to_numeric(df[column], errors='coerce')
+            mask = values.notna()
+            if low is not None:
+                mask &= values >= low if inclusive in ('both', 'left') else values > low
+            if high is not None:
+                mask &= values <= high if inclusive in ('both', 'right') else values < high
+            return mask
+        return evaluator
+
+    # Сравнения с одним значением
+    if 'value' not in spec:
+        raise ValueError(f"Правило {name}: для '{op}' нужно значение 'value'")
+    value = spec['value']
+    numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+    comparators = {
+        'gt': lambda s: s > value,
+        'ge': lambda s: s >= value,
+        'lt': lambda s: s < value,
+        'le': lambda s: s <= value,
+        'eq': lambda s: s == value,
+        'ne': lambda s: (s != value) & s.notna(),
+    }
+    compare = comparators[op]
+
+    def evaluator(df: pd.DataFrame) -> pd.Series:
+        values = pd.to_numeric(df[column], errors='coerce') if numeric else df[column]
+        return compare(values).fillna(False).astype(bool)
+    return evaluator
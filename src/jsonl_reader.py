@@ -0,0 +1,42 @@
+"""
+Потоковое чтение JSON Lines (NDJSON) пакетами строк.
+Для разбора используется orjson, если он установлен.
+"""
+import json
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import pandas as pd
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Расширения файлов JSON Lines
+JSONL_FORMATS = ('.jsonl', '.ndjson')
+
+
+def iter_jsonl_batches(file_path: Path, batch_lines: int = 50000,
+                       start_offset: int = 0) -> Iterator[Tuple[pd.DataFrame, int]]:
+    """
+    Чтение файла пакетами не более batch_lines строк.
+    В памяти одновременно находится только один пакет. Пустые строки пропускаются.
+
+    Args:
+        start_offset: Смещение в байтах, с которого продолжить чтение (начало строки)
+
+    Yields:
+        (пакет, смещение в байтах сразу после последней строки пакета)
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start_offset)
+        while True:
+            lines = list(islice(iter(f.readline, b''), batch_lines))
+            if not lines:
+                break
+            records = [_loads(line) for line in lines if line.strip()]
+            if records:
+                yield pd.DataFrame.from_records(records), f.tell()
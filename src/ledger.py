@@ -0,0 +1,102 @@
+"""
+Журнал обработанных файлов (SQLite) для идемпотентных перезапусков.
+
+Ключ записи - хеш содержимого файла + хеш настроек пайплайна, влияющих на
+результат. Если файл с тем же содержимым уже обрабатывался с теми же
+настройками, пайплайн не обрабатывает его повторно.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Настройки PIPELINE_CONFIG, от которых зависит результат обработки
+OUTPUT_CONFIG_KEYS = (
+    'filter_threshold', 'max_threshold', 'salary_columns', 'filter_rules',
+    'output_format', 'parquet_compression', 'parquet_row_group_size',
+    'partition_by', 'salary_band_width', 'excel_sheets', 'excel_sheet_column',
+    'cross_file_dedup', 'cross_file_dedup_columns',
+)
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """Хеш настроек, влияющих на результат обработки."""
+    relevant = {key: config.get(key) for key in OUTPUT_CONFIG_KEYS}
+    payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ProcessingLedger:
+    """
+    Персистентный журнал результатов обработки файлов.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_files (
+                content_hash TEXT NOT NULL,
+                config_hash TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                file_size INTEGER,
+                s3_path TEXT NOT NULL,
+                version_id TEXT,
+                records_processed INTEGER,
+                records_filtered INTEGER,
+                start_time TEXT,
+                end_time TEXT,
+                duration_sec REAL,
+                batch_files INTEGER,
+                PRIMARY KEY (content_hash, config_hash)
+            )
+        """)
+        # Журналы, созданные до появления batch_files
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(processed_files)")}
+        if 'batch_files' not in columns:
+            self._conn.execute("ALTER TABLE processed_files ADD COLUMN batch_files INTEGER")
+        self._conn.commit()
+
+    def lookup(self, content_hash: str, config_digest: str) -> Optional[Dict[str, Any]]:
+        """Поиск результата обработки того же содержимого с теми же настройками."""
+        row = self._conn.execute(
+            "SELECT * FROM processed_files WHERE content_hash = ? AND config_hash = ?",
+            (content_hash, config_digest)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def record(self, content_hash: str, config_digest: str, file_size: int,
+               result: Dict[str, Any], duration_sec: float) -> None:
+        """
+        Сохранение результата успешной обработки. Для файла из микропакета
+        s3_path - объект всего пакета, batch_files - число файлов в нем.
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO processed_files (content_hash, config_hash, file_name, file_size, s3_path, "
+            "version_id, records_processed, records_filtered, start_time, end_time, duration_sec, batch_files) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, config_digest, result['file_name'], file_size,
+             result['s3_path'], result.get('version_id'),
+             result.get('records_processed'), result.get('records_filtered'),
+             result.get('start_time'), result.get('end_time'), duration_sec,
+             result.get('micro_batch_files'))
+        )
+        self._conn.commit()
+
+    def forget(self, content_hash: str, config_digest: str) -> None:
+        """Удаление записи, результат которой больше недоступен."""
+        self._conn.execute(
+            "DELETE FROM processed_files WHERE content_hash = ? AND config_hash = ?",
+            (content_hash, config_digest)
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,166 @@
+"""
+Отправка журнала запусков в S3 сегментами.
+
+Вместо повторной загрузки всего журнала за день после каждого файла в S3
+загружаются только новые строки - отдельными объектами-частями:
+
+    logs/pipeline_log_<дата>/part-00001.jsonl
+    logs/pipeline_log_<дата>/part-00002.jsonl
+    logs/pipeline_log_<дата>/_manifest.json   <- перезаписывается с версионированием
+
+Изменения накапливаются: загрузка выполняется не чаще раза в interval_sec
+или сразу, когда неотправленных данных больше max_bytes. При остановке
+пайплайна отправляется остаток (flush).
+
+Несколько обработчиков (work_claims) пишут журналы в свои папки и
+отправляют их с worker_id: части и манифест каждого обработчика лежат в
+своей папке дня, файл состояния отправки тоже у каждого свой:
+
+    logs/pipeline_log_<дата>/<worker_id>/part-00001.jsonl
+    logs/pipeline_log_<дата>/<worker_id>/_manifest.json
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+STATE_FILE = '.log_shipper_state.json'
+
+
+class LogShipper:
+    """
+    Отправка новых строк журналов JSON Lines из папки логов в S3.
+    """
+
+    def __init__(self, s3_client, log_folder: str, s3_prefix: str = 'logs', pattern: str = 'pipeline_log_*.jsonl',
+                 interval_sec: float = 30.0, max_bytes: int = 1024 * 1024, worker_id: Optional[str] = None):
+        self.s3_client = s3_client
+        self.log_folder = Path(log_folder)
+        self.s3_prefix = s3_prefix.rstrip('/')
+        self.pattern = pattern
+        self.interval_sec = interval_sec
+        self.max_bytes = max_bytes
+        self.worker_id = worker_id
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._last_ship: Optional[float] = None  # Первая отправка - сразу
+        self._state_file = self.log_folder / (f".log_shipper_state.{worker_id}.json" if worker_id else STATE_FILE)
+        self._state = self._load_state()  # имя файла -> {'offset', 'parts'}
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        if not self._state_file.exists():
+            return {}
+        try:
+            with open(self._state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Состояние отправки журналов повреждено, отправка с начала: {e}")
+            return {}
+
+    def _save_state(self) -> None:
+        tmp_file = self._state_file.with_name(self._state_file.name + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self._state_file)
+
+    def pending_bytes(self) -> int:
+        """Объем неотправленных данных во всех журналах."""
+        return sum(max(path.stat().st_size - self._state.get(path.name, {}).get('offset', 0), 0)
+                   for path in self.log_folder.glob(self.pattern))
+
+    async def notify(self) -> None:
+        """
+        Сообщение о новых записях. Отправка выполняется сразу, если накопилось
+        max_bytes или прошло interval_sec с прошлой отправки; иначе - отложенно.
+        """
+        if self._last_ship is None or self.pending_bytes() >= self.max_bytes \
+                or time.monotonic() - self._last_ship >= self.interval_sec:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._ship_later())
+
+    async def _ship_later(self) -> None:
+        try:
+            await asyncio.sleep(max(self.interval_sec - (time.monotonic() - self._last_ship), 0))
+            await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self) -> None:
+        """Отмена отложенной отправки и отправка остатка."""
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Отправка всех новых строк.
+
+        Returns:
+            Количество загруженных частей
+        """
+        async with self._lock:
+            self._last_ship = time.monotonic()
+            shipped = 0
+            for path in sorted(self.log_folder.glob(self.pattern)):
+                if await self._ship_file(path):
+                    shipped += 1
+            return shipped
+
+    async def _ship_file(self, path: Path) -> bool:
+        """Загрузка новых полных строк файла отдельной частью и обновление манифеста."""
+        state = self._state.setdefault(path.name, {'offset': 0, 'parts': []})
+        with open(path, 'rb') as f:
+            f.seek(state['offset'])
+            data = f.read()
+        # Отправляются только полные строки: последняя может дописываться прямо сейчас
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return False
+
+        folder = f"{self.s3_prefix}/{path.stem}"
+        if self.worker_id:
+            folder = f"{folder}/{self.worker_id}"
+        part_number = len(state['parts']) + 1
+        part_key = f"{folder}/part-{part_number:05d}.jsonl"
+        if not await self.s3_client.upload_fileobj(io.BytesIO(data), part_key):
+            self.logger.error(f"Не удалось загрузить часть журнала {part_key}")
+            return False
+
+        state['parts'].append({
+            'key': part_key,
+            'offset': state['offset'],
+            'bytes': len(data),
+            'records': data.count(b'\n'),
+            'uploaded_at': datetime.now().isoformat(),
+        })
+        state['offset'] += len(data)
+
+        # Манифест - единственный перезаписываемый объект: одна версия на отправку
+        manifest_file = self.log_folder / (f"{path.stem}.{self.worker_id}.manifest.json" if self.worker_id
+                                           else f"{path.stem}.manifest.json")
+        manifest = {
+            'log': path.name,
+            'worker_id': self.worker_id,
+            'parts': state['parts'],
+            'records': sum(part['records'] for part in state['parts']),
+            'bytes': state['offset'],
+            'updated_at': datetime.now().isoformat(),
+        }
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        manifest_key = f"{folder}/_manifest.json"
+        version_id = await self.s3_client.upload_with_versioning(str(manifest_file), manifest_key)
+        if version_id is None:
+            self.logger.warning(f"Манифест {manifest_key} не обновлен, будет обновлен при следующей отправке")
+
+        self._save_state()
+        self.logger.info(f"   📋 Журнал отправлен: {part_key} ({len(data)} байт)")
+        return True
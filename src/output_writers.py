@@ -0,0 +1,396 @@
+"""
+Запись результатов пайплайна в выходные форматы.
+"""
+import asyncio
+import io
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+import pandas as pd
+
+# Префикс ключей метаданных фильтрации в Parquet файле
+PARQUET_METADATA_PREFIX = 'salary_filter.'
+
+# Значение партиции для пустых значений (как в Hive/Arrow)
+HIVE_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# Минимальный размер части multipart upload в S3 (кроме последней)
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Сколько байт с конца Parquet файла читать за раз для разбора футера
+PARQUET_TAIL_BYTES = 64 * 1024
+PARQUET_MAGIC = b'PAR1'
+
+
+def parquet_metadata(metadata: Dict[str, Any]) -> Dict[bytes, bytes]:
+    """Преобразование метаданных фильтрации в key-value метаданные Parquet."""
+    return {
+        f"{PARQUET_METADATA_PREFIX}{key}".encode('utf-8'): str(value).encode('utf-8')
+        for key, value in metadata.items()
+    }
+
+
+def read_parquet_metadata(source) -> Dict[str, str]:
+    """Чтение метаданных фильтрации из Parquet файла."""
+    import pyarrow.parquet as pq
+
+    file_metadata = pq.read_metadata(source).metadata or {}
+    return {
+        key.decode('utf-8')[len(PARQUET_METADATA_PREFIX):]: value.decode('utf-8')
+        for key, value in file_metadata.items()
+        if key.decode('utf-8').startswith(PARQUET_METADATA_PREFIX)
+    }
+
+
+def parquet_footer_size(tail: bytes) -> Optional[int]:
+    """
+    Размер футера Parquet (метаданные + длина + magic) по последним байтам
+    файла; None, если байты не похожи на конец Parquet файла.
+    """
+    if len(tail) < 8 or tail[-4:] != PARQUET_MAGIC:
+        return None
+    return int.from_bytes(tail[-8:-4], 'little') + 8
+
+
+def read_csv_output(source: BinaryIO) -> pd.DataFrame:
+    """
+    Чтение CSV результата пайплайна. Строки-комментарии (заголовок с
+    информацией о фильтрации и итоговый блок) пропускаются; символ '#'
+    внутри значений не считается комментарием.
+    """
+    lines = (line for line in source if not line.startswith(b'#'))
+    return pd.read_csv(io.BytesIO(b''.join(lines)))
+
+
+def write_parquet(df: pd.DataFrame, sink: BinaryIO, metadata: Dict[str, Any],
+                  compression: str = 'zstd', row_group_size: int = 100_000) -> int:
+    """
+    Потоковая запись DataFrame в Parquet по группам строк.
+
+    Каждая группа строк конвертируется в Arrow и сразу пишется в sink, поэтому
+    sink может быть непозиционируемым потоком (pipe в загрузчик S3).
+
+    Returns:
+        Количество записанных групп строк
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    schema = schema.with_metadata({**(schema.metadata or {}), **parquet_metadata(metadata)})
+
+    row_groups = 0
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for start in range(0, len(df), row_group_size):
+            chunk = df.iloc[start:start + row_group_size]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False),
+                               row_group_size=row_group_size)
+            row_groups += 1
+    return row_groups
+
+
+async def stream_to_uploader(write: Callable[[BinaryIO], Any],
+                             upload: Callable[[BinaryIO], Any]) -> tuple[bool, Optional[Any]]:
+    """
+    Одновременная запись и загрузка через pipe без временного файла.
+
+    Args:
+        write: Синхронная функция, пишущая данные в переданный поток
+        upload: Асинхронная функция загрузки, читающая из переданного потока
+
+    Returns:
+        (успех загрузки, результат write). Если запись завершилась ошибкой,
+        загрузка считается неуспешной, даже если поток был прочитан до конца.
+    """
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, 'rb')
+    writer = os.fdopen(write_fd, 'wb')
+
+    def write_and_close():
+        try:
+            return write(writer)
+        finally:
+            try:
+                writer.close()
+            except OSError:
+                pass  # Загрузчик уже закрыл поток
+
+    loop = asyncio.get_running_loop()
+    write_task = loop.run_in_executor(None, write_and_close)
+    try:
+        uploaded = await upload(reader)
+    finally:
+        # Разблокируем писателя, если загрузка прервалась раньше
+        reader.close()
+
+    try:
+        written = await write_task
+    except Exception:
+        if uploaded:
+            raise
+        return False, None
+    return uploaded, written
+
+
+class CountingWriter:
+    """Поток записи, считающий записанные байты (для потоков без tell, например pipe)."""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        self.bytes_written += len(data)
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    @property
+    def closed(self) -> bool:
+        return self.raw.closed
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+def iter_csv_chunks(df: pd.DataFrame, header: str, chunk_rows: int = 50_000) -> Iterator[bytes]:
+    """
+    Сериализация DataFrame в CSV кусками по chunk_rows строк:
+    заголовок-комментарий, затем строка с именами колонок и данные.
+    """
+    yield header.encode('utf-8')
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode('utf-8')
+
+
+async def upload_stream(s3_client, object_name: str, chunks: Iterator[bytes],
+                        part_size: int = MULTIPART_MIN_PART_SIZE, queue_size: int = 2,
+                        concurrency: int = 4) -> bool:
+    """
+    Загрузка потока байт в S3 без временного файла.
+
+    Куски из chunks собираются в части по part_size байт в отдельном потоке
+    и передаются загрузчикам multipart upload через очередь из queue_size
+    частей: сериализация и передача по сети идут одновременно, в памяти не
+    больше (queue_size + concurrency + 1) частей. Если все данные уместились
+    в одну часть, объект загружается одним запросом.
+    """
+    def next_part() -> tuple[bytes, bool]:
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= part_size:
+                return b''.join(buffer), False
+        return b''.join(buffer), True
+
+    data, exhausted = await asyncio.to_thread(next_part)
+    if exhausted:
+        return await s3_client.upload_fileobj(io.BytesIO(data), object_name)
+
+    upload_id = await s3_client.create_multipart_upload(object_name)
+    if upload_id is None:
+        return False
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    parts: List[Dict[str, Any]] = []
+    failed = False
+
+    async def upload_parts():
+        nonlocal failed
+        while (item := await queue.get()) is not None:
+            part_number, body = item
+            if failed:
+                continue  # Очередь дочитывается, чтобы не блокировать сериализацию
+            try:
+                etag = await s3_client.upload_part(object_name, upload_id, part_number, body)
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Ошибка загрузки части {part_number} {object_name}: {e}")
+                etag = None
+            if etag is None:
+                failed = True
+            else:
+                parts.append({'PartNumber': part_number, 'ETag': etag})
+
+    async def produce():
+        part_number = 1
+        await queue.put((part_number, data))
+        last = False
+        try:
+            while not last and not failed:
+                body, last = await asyncio.to_thread(next_part)
+                part_number += 1
+                await queue.put((part_number, body))
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    try:
+        await asyncio.gather(produce(), *(upload_parts() for _ in range(concurrency)))
+    except BaseException:
+        await s3_client.abort_multipart_upload(object_name, upload_id)
+        raise
+
+    if failed or await s3_client.complete_multipart_upload(object_name, upload_id, parts) is None:
+        await s3_client.abort_multipart_upload(object_name, upload_id)
+        return False
+    return True
+
+
+def salary_band(salaries: pd.Series, width: int) -> pd.Series:
+    """Диапазон зарплаты вида '50000-99999' для партиционирования."""
+    lower = (pd.to_numeric(salaries, errors='coerce') // width) * width
+    return lower.map(lambda value: HIVE_NULL_PARTITION if pd.isna(value)
+                     else f"{int(value)}-{int(value) + width - 1}")
+
+
+def hive_partition_path(columns: List[str], values: tuple) -> str:
+    """Путь партиции вида 'department=IT/salary_band=50000-99999'."""
+    parts = []
+    for column, value in zip(columns, values):
+        value = HIVE_NULL_PARTITION if pd.isna(value) else quote(str(value), safe='')
+        parts.append(f"{quote(str(column), safe='')}={value}")
+    return '/'.join(parts)
+
+
+def partition_frame(df: pd.DataFrame, columns: List[str]) -> Iterator[tuple[str, pd.DataFrame]]:
+    """
+    Разбиение DataFrame на Hive-партиции.
+    Колонки партиционирования убираются из данных - их значения хранятся в пути.
+    """
+    data_columns = [col for col in df.columns if col not in columns]
+    for values, part in df.groupby(columns, dropna=False, sort=True):
+        if not isinstance(values, tuple):
+            values = (values,)
+        yield hive_partition_path(columns, values), part[data_columns]
+
+
+def _append_csv(df: pd.DataFrame, out, columns: Optional[List[str]]) -> List[str]:
+    """
+    Дозапись пакета в CSV. Колонки фиксируются по первому пакету (тогда же
+    пишется строка заголовка), новые колонки последующих пакетов пропускаются.
+
+    Returns:
+        Колонки CSV
+    """
+    if columns is None:
+        df.to_csv(out, index=False)
+        return list(df.columns)
+    extra = [col for col in df.columns if col not in columns]
+    if extra:
+        logging.getLogger(__name__).warning(f"   ⚠️ Новые колонки в пакете пропущены: {extra}")
+    df.reindex(columns=columns).to_csv(out, index=False, header=False)
+    return columns
+
+
+class CsvBatchWriter:
+    """
+    Запись CSV по пакетам. Заголовок-комментарий становится известен только
+    после последнего пакета, поэтому данные пишутся во вспомогательный файл,
+    а при закрытии собираются в итоговый: заголовок + данные.
+    Колонки фиксируются по первому пакету.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.body_path = path.with_name(path.name + '.body')
+        self.columns = None
+        self.rows = 0
+        self._body = open(self.body_path, 'w', encoding='utf-8', newline='')
+
+    def write(self, df: pd.DataFrame) -> None:
+        self.columns = _append_csv(df, self._body, self.columns)
+        self.rows += len(df)
+
+    def close(self, header: str) -> Path:
+        self._body.close()
+        with open(self.path, 'w', encoding='utf-8', newline='') as f:
+            f.write(header)
+            with open(self.body_path, 'r', encoding='utf-8', newline='') as body:
+                shutil.copyfileobj(body, f)
+        self.body_path.unlink()
+        return self.path
+
+    def abort(self) -> None:
+        self._body.close()
+        self.body_path.unlink(missing_ok=True)
+        self.path.unlink(missing_ok=True)
+
+
+class ParquetBatchWriter:
+    """
+    Запись Parquet по пакетам. Схема фиксируется по первому пакету,
+    метаданные фильтрации добавляются в футер при закрытии.
+    """
+
+    def __init__(self, path: Path, compression: str = 'zstd', row_group_size: int = 100_000):
+        self.path = path
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._schema = None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self._schema = pa.Schema.from_pandas(df, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+        df = df.reindex(columns=self._schema.names)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False, safe=False)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows += len(df)
+
+    def close(self, metadata: Dict[str, Any]) -> Path:
+        if self._writer is None:
+            self.write(pd.DataFrame())
+        self._writer.add_key_value_metadata(parquet_metadata(metadata))
+        self._writer.close()
+        return self.path
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self.path.unlink(missing_ok=True)
+
+
+class MultipartCsvWriter:
+    """
+    Запись CSV частями для multipart upload. Данные копятся в памяти и
+    забираются частью, когда буфер достигает part_size. Уже загруженную
+    часть изменить нельзя, поэтому итоговые счетчики пишутся в конец файла
+    комментарием (finish), а в начале - только известная заранее информация.
+    """
+
+    def __init__(self, part_size: int, header: str = '', columns: Optional[List[str]] = None):
+        self.part_size = part_size
+        self.columns = columns
+        self.rows = 0
+        self._buffer = io.StringIO()
+        self._buffer.write(header)
+
+    def write(self, df: pd.DataFrame) -> None:
+        self.columns = _append_csv(df, self._buffer, self.columns)
+        self.rows += len(df)
+
+    def ready(self) -> bool:
+        """Накоплено достаточно данных для очередной части."""
+        return self._buffer.tell() >= self.part_size
+
+    def take(self) -> bytes:
+        """Содержимое буфера для загрузки частью; буфер очищается."""
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer = io.StringIO()
+        return data
+
+    def finish(self, trailer: str) -> bytes:
+        """Последняя часть: остаток буфера и итоговый комментарий."""
+        self._buffer.write(trailer)
+        return self.take()
@@ -3,13 +3,43 @@
 С фильтрацией по зарплате.
 """
 import asyncio
+import io
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import logging
 import json
 import time
 from datetime import datetime
-from typing import Dict, Optional, Any, List
+from collections import OrderedDict
+from typing import Dict, Optional, Any, List, Union
+
+from admission import MemoryAdmissionController, frame_bytes
+from archiver import FileArchiver
+from backends import ARROW_IPC_FORMATS, PandasBackend, get_backend, merge_column_stats
+from checkpoint import CheckpointStore
+from chunked_readers import iter_file_batches
+from dedup_index import RowHashIndex, hash_rows
+from excel_reader import ExcelReader
+from file_lock import async_file_lock
+from file_utils import file_sha256
+from filter_rules import FilterRuleSet, merge_rule_counters
+from jsonl_reader import JSONL_FORMATS, iter_jsonl_batches
+from ledger import ProcessingLedger, config_hash
+from log_shipper import LogShipper
+from run_log import RunLogWriter
+from scheduler import FileScheduler
+from stage_metrics import RollingPercentiles, StageMetrics, add_bytes, measured, stage, to_thread
+from work_claims import WorkClaims
+from profiling import FileProfiler
+from output_writers import (MULTIPART_MIN_PART_SIZE, CsvBatchWriter, MultipartCsvWriter,
+                            ParquetBatchWriter, iter_csv_chunks, partition_frame, salary_band,
+                            stream_to_uploader, upload_stream, write_parquet)
+
+# Ключевые слова для поиска колонок с зарплатой
+SALARY_KEYWORDS = ['salary', 'зарплата', 'оклад', 'income', 'доход', 'pay', 'wage', 'compensation']
+# Признаки числовых колонок, которые не являются зарплатой
+NON_SALARY_KEYWORDS = ['id', 'age', 'возраст', 'код', 'номер']
 
 
 class DataPipeline:
@@ -39,22 +69,210 @@ class DataPipeline:
         self.filter = int(config['filter_threshold'])
         self.max_threshold = int(config['max_threshold'])
 
+        # Бэкенд вычислений: pandas (эталонный) или polars
+        self.backend = get_backend(config.get('compute_backend', 'pandas'))
+
+        # Потоковая обработка JSON Lines пакетами (бэкенд pandas)
+        self.jsonl_batch_lines = int(config.get('jsonl_batch_lines', 50000))
+        self.stream_backend = PandasBackend()
+
+        # Размер части multipart upload (потоковая загрузка и контрольные точки)
+        self.multipart_part_size = int(config.get('multipart_part_size', 8 * 1024 * 1024))
+        if self.multipart_part_size < MULTIPART_MIN_PART_SIZE:
+            self.logger.warning(f"multipart_part_size меньше минимального размера части S3 "
+                                f"({MULTIPART_MIN_PART_SIZE} байт)")
+
+        # Контрольные точки потоковой обработки: продолжение после сбоя с последней загруженной части
+        self.checkpoints = None
+        if config.get('stream_checkpoints', False):
+            self.checkpoints = CheckpointStore(
+                config.get('checkpoint_folder', str(Path(config['temp_folder']) / "checkpoints")))
+
+        # Чтение Parquet и Arrow IPC через memory map (без копирования файла в память)
+        self.memory_map = bool(config.get('memory_map', True))
+
+        # Чтение Excel: быстрый движок, несколько листов, кэш конвертации в Parquet
+        self.excel_reader = ExcelReader(
+            engine=config.get('excel_engine', 'auto'),
+            sheets=config.get('excel_sheets'),
+            sheet_column=config.get('excel_sheet_column', 'sheet'),
+            cache_folder=config.get('excel_cache_folder'),
+            cache_max_files=int(config.get('excel_cache_max_files', 100))
+        )
+
+        # Удаление дубликатов между файлами по персистентному индексу хешей строк
+        # (при work_claims папка индекса общая: сегменты других обработчиков подгружаются)
+        self.dedup_columns = list(config.get('cross_file_dedup_columns') or [])
+        self.dedup_index = None
+        if config.get('cross_file_dedup', False):
+            self.dedup_index = RowHashIndex(
+                config.get('dedup_index_folder', str(Path(config['processed_folder']) / "dedup_index")),
+                retention_days=int(config.get('cross_file_dedup_retention_days', 30)),
+                shared=bool(config.get('work_claims'))
+            )
+
+        # Журнал обработанных файлов по хешу содержимого (переживает перезапуск)
+        self.ledger = None
+        self.config_hash = config_hash(config)
+        self.ledger_on_match = config.get('ledger_on_match', 'skip')
+        if config.get('ledger_path'):
+            self.ledger = ProcessingLedger(config['ledger_path'])
+
+        # Определение колонок с зарплатой: явный список или кэш по заголовку
+        self.salary_columns_override = list(config.get('salary_columns') or [])
+        self.salary_detection_cache_size = int(config.get('salary_detection_cache_size', 1024))
+        self._salary_columns_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+        # Формат выходных файлов: csv (с заголовком-комментарием) или parquet
+        self.output_format = config.get('output_format', 'csv').lower()
+        if self.output_format not in ('csv', 'parquet'):
+            raise ValueError(f"Неподдерживаемый формат вывода: {self.output_format}")
+        self.parquet_compression = config.get('parquet_compression', 'zstd')
+        self.parquet_row_group_size = int(config.get('parquet_row_group_size', 100_000))
+
+        # Потоковая загрузка CSV в S3 без временного файла (multipart upload частями multipart_part_size)
+        self.stream_upload = bool(config.get('stream_upload', True))
+        self.csv_chunk_rows = int(config.get('csv_chunk_rows', 50_000))
+        self.stream_upload_queue_size = int(config.get('stream_upload_queue_size', 2))
+        self.stream_upload_concurrency = int(config.get('stream_upload_concurrency', 4))
+
+        # Hive-партиционирование результата по колонкам (например, department, salary_band)
+        self.partition_by = list(config.get('partition_by') or [])
+        self.salary_band_width = int(config.get('salary_band_width', 50000))
+        self.partition_upload_concurrency = int(config.get('partition_upload_concurrency', 8))
+
+        # Микропакеты: результаты небольших файлов копятся в памяти и выгружаются одним объектом
+        self.micro_batch = bool(config.get('micro_batch', False))
+        self.micro_batch_file_size = int(config.get('micro_batch_file_size', 1024 * 1024))
+        self.micro_batch_max_bytes = int(config.get('micro_batch_max_bytes', 64 * 1024 * 1024))
+        self.micro_batch_window = float(config.get('micro_batch_window_sec', 60))
+        self.micro_batch_source_column = config.get('micro_batch_source_column', 'source_file')
+        self._micro_batch: List[Dict[str, Any]] = []
+        self._micro_batch_bytes = 0
+        self._micro_batch_flushing = 0  # байт в выгружаемых сейчас микропакетах
+        self._micro_batch_started = 0.0
+
+        # Выборочное профилирование (cProfile + tracemalloc), результаты - в log_folder/profiles
+        self.profiler = FileProfiler(
+            Path(config.get('profile_folder') or self.log_folder / "profiles"),
+            sample_every=int(config.get('profile_sample_every') or 0),
+            patterns=list(config.get('profile_patterns') or []),
+            top=int(config.get('profile_top', 30))
+        )
+
+        # Одновременная обработка файлов с допуском по бюджету памяти (0 - без ограничения);
+        # файлы, не помещающиеся в бюджет, обрабатываются пакетами по jsonl_batch_lines строк
+        self.max_concurrent_files = max(int(config.get('max_concurrent_files', 1)), 1)
+        self.admission = MemoryAdmissionController(
+            budget_bytes=int(config.get('memory_budget_mb') or 0) * 1024 * 1024,
+            processing_factor=float(config.get('memory_processing_factor', 2.5)),
+            batch_rows=self.jsonl_batch_lines,
+            expansion=config.get('memory_expansion')
+        )
+
+        # Очередь файлов incoming: политика (fifo, sjf), приоритеты источников и старение
+        self.scheduler = FileScheduler(
+            policy=config.get('schedule_policy', 'fifo'),
+            sources=config.get('schedule_sources'),
+            aging_sec=float(config.get('schedule_aging_sec') or 0),
+            window=int(config.get('stage_metrics_window', 1000))
+        )
+
+        # Несколько обработчиков на одной папке incoming: файл захватывается переименованием
+        # в папку обработчика, захваты обработчика без heartbeat возвращаются в incoming
+        self.claims = None
+        if config.get('work_claims'):
+            self.claims = WorkClaims(
+                self.watch_folder,
+                claims_folder=config.get('claims_folder'),
+                worker_id=config.get('worker_id'),
+                lease_sec=float(config.get('claim_lease_sec', 60)),
+                heartbeat_sec=float(config.get('claim_heartbeat_sec', 10))
+            )
+            self.claims.start()
+
+        # Метрики этапов обработки и скользящие перцентили по типам файлов
+        self.stage_stats = RollingPercentiles(int(config.get('stage_metrics_window', 1000)))
+
+        # Дополнительные бизнес-правила фильтрации (компилируются один раз)
+        self.filter_rules = FilterRuleSet(config.get('filter_rules'))
+
         for folder in [self.watch_folder, self.temp_folder,
                        self.processed_folder, self.log_folder]:
             folder.mkdir(parents=True, exist_ok=True)
 
+        # Архив исходных файлов: перенос без копирования или сжатый архив
+        # (daily_tar при work_claims - свой tar архив у каждого обработчика)
+        self.archiver = FileArchiver(
+            self.processed_folder / "archive",
+            compression=config.get('archive_compression'),
+            layout=config.get('archive_layout', 'file'),
+            worker_id=self.claims.worker_id if self.claims is not None else None
+        )
+
+        # Журнал запусков JSON Lines: запись в фоновом потоке, только дозапись.
+        # Несколько обработчиков пишут каждый в свою папку log_folder/<worker_id>
+        worker_id = self.claims.worker_id if self.claims is not None else None
+        run_log_folder = self.log_folder / worker_id if worker_id else self.log_folder
+        self.run_log = RunLogWriter(
+            run_log_folder,
+            fsync=bool(config.get('run_log_fsync', False)),
+            fsync_interval=float(config.get('run_log_fsync_interval_sec', 1.0))
+        )
+        # Отправка журнала в S3 новыми частями, не чаще раза в интервал
+        self.log_shipper = LogShipper(
+            s3_client, run_log_folder,
+            s3_prefix=config.get('s3_logs_folder', 'logs'),
+            interval_sec=float(config.get('log_ship_interval_sec', 30)),
+            max_bytes=int(config.get('log_ship_max_bytes', 1024 * 1024)),
+            worker_id=worker_id
+        )
+
         self.logger.info(f"Пайплайн инициализирован")
         self.logger.info(f"Фильтрация: зарплата > {self.filter}")
+        self.logger.info(f"Бэкенд вычислений: {self.backend.name}")
+        if self.filter_rules:
+            self.logger.info(f"Дополнительных правил фильтрации: {len(self.filter_rules)}")
         self.logger.info(f"Папка наблюдения: {self.watch_folder}")
         self.logger.info(f"Папка обработки: {self.processed_folder}")
 
     async def process_file(self, file_path: Path) -> Dict[str, Any]:
         """
         Обработка одного файла через пайплайн.
+        Метрики этапов (время, CPU потоков этапа, байты) сохраняются в
+        result['stage_metrics'] и в скользящих перцентилях stage_percentiles().
+        Выбранные для профилирования файлы обрабатываются под cProfile и
+        tracemalloc, пути к результатам - в result['profile'].
+        При заданном бюджете памяти файл ждет допуска; оценка памяти, режим
+        (full, chunked, exclusive) и время ожидания - в result['memory'].
 
         Returns:
             Dict с результатами обработки
         """
+        async with self.admission.admit(file_path) as ticket:
+            metrics = StageMetrics()
+            token = metrics.activate()
+            try:
+                chunked = ticket['mode'] == 'chunked'
+                if self.profiler.should_profile(file_path):
+                    with self.profiler.profile(file_path) as profile:
+                        result = await self._process_file(file_path, chunked)
+                    result['profile'] = profile
+                else:
+                    result = await self._process_file(file_path, chunked)
+            finally:
+                metrics.deactivate(token)
+        if self.admission.enabled:
+            result['memory'] = ticket
+        result['stage_metrics'] = metrics.as_dict()
+        self.stage_stats.add(file_path.suffix.lower(), result['stage_metrics'])
+        return result
+
+    def stage_percentiles(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Перцентили метрик этапов по типам файлов за последние stage_metrics_window файлов."""
+        return self.stage_stats.percentiles()
+
+    async def _process_file(self, file_path: Path, chunked: bool = False) -> Dict[str, Any]:
         result = {
             'file_path': str(file_path),
             'file_name': file_path.name,
@@ -68,6 +286,10 @@ class DataPipeline:
             'version_id': None
         }
 
+        started = time.monotonic()
+        content_hash = None
+        file_size = 0
+
         try:
             # Шаг 1: Проверка файла
             self.logger.info(f"📁 Начало обработки файла: {file_path.name}")
@@ -80,47 +302,142 @@ class DataPipeline:
             file_size = file_path.stat().st_size
             self.logger.info(f"   Размер файла: {file_size} байт")
 
-            # Шаг 2: Чтение данных в зависимости от формата
-            df = await self._read_data_file(file_path)
-            if df is None:
-                result['error'] = f"Не удалось прочитать файл: {file_path}"
-                self.logger.error(result['error'])
-                return result
+            # Файл с тем же содержимым уже обрабатывался с теми же настройками
+            if self.ledger is not None:
+                content_hash = await to_thread(file_sha256, file_path)
+                previous = self.ledger.lookup(content_hash, self.config_hash)
+                if previous is not None:
+                    reused = await self._reuse_previous_result(file_path, previous, result)
+                    if reused is not None:
+                        return reused
+                    # Прежний результат недоступен: запись удаляется, файл обрабатывается заново
+                    self.ledger.forget(content_hash, self.config_hash)
 
-            result['records_processed'] = len(df)
-            self.logger.info(f"   Прочитано записей: {len(df)}")
-
-            # Шаг 3: Обработка данных с фильтрацией по зарплате
-            processed_df, salary_stats = await self._process_data_with_salary_filter(df)
-            result['records_filtered'] = len(processed_df)
+            s3_object_name = (f"processed/"
+                              f"{datetime.now().strftime('%Y-%m-%d')}/"
+                              f"salary_filtered_{file_path.stem}_{int(time.time())}.{self.output_format}")
+
+            if self._is_streamed_input(file_path) and self.checkpoints is not None \
+                    and self.output_format == 'csv':
+                # Шаги 2-5: Потоковая обработка JSON Lines с загрузкой частями и контрольными точками
+                processed_df = None
+                temp_file = None
+                with stage('stream', bytes_in=file_size):
+                    s3_object_name, salary_stats, pending_hashes = await self._process_jsonl_checkpointed(
+                        file_path, result, s3_object_name)
+                if s3_object_name is None:
+                    result['error'] = f"Не удалось обработать файл: {file_path}"
+                    self.logger.error(result['error'])
+                    return result
+                records_filtered = salary_stats['remaining_count']
+            elif self._is_streamed_input(file_path) or chunked:
+                # Шаги 2-4: Потоковое чтение пакетами (JSON Lines или файл больше бюджета памяти)
+                # с записью во временный файл
+                processed_df = None
+                with stage('stream', bytes_in=file_size):
+                    temp_file, salary_stats, pending_hashes = await self._process_stream(file_path, result)
+                if temp_file is None:
+                    result['error'] = f"Не удалось обработать файл: {file_path}"
+                    self.logger.error(result['error'])
+                    return result
+                records_filtered = salary_stats['remaining_count']
+            else:
+                # Шаг 2: Чтение данных в зависимости от формата
+                with stage('read', bytes_in=file_size):
+                    df = await self._load_frame(file_path)
+                if df is None:
+                    result['error'] = f"Не удалось прочитать файл: {file_path}"
+                    self.logger.error(result['error'])
+                    return result
+
+                records = self.backend.row_count(df)
+                if records is not None:
+                    self.logger.info(f"   Прочитано записей: {records}")
+
+                # Шаг 3: Обработка данных с фильтрацией по зарплате
+                processed_df, salary_stats = await self._process_data_with_salary_filter(df)
+                # Ленивый фрейм Polars оценивается по данным, материализованным при collect
+                collected_bytes = salary_stats.pop('collected_bytes', None)
+                if self.admission.enabled:
+                    self.admission.observe(file_path, file_size, frame_bytes(df) or collected_bytes)
+                pending_hashes = []
+                if self.dedup_index is not None:
+                    with stage('filter'):
+                        processed_df, file_hashes = await to_thread(
+                            self._drop_seen_rows, processed_df, salary_stats)
+                    pending_hashes.append(file_hashes)
+                records_filtered = len(processed_df)
+
+            result['records_processed'] = salary_stats.get('original_count') or 0
+            result['records_filtered'] = records_filtered
             result['filtered_by_salary'] = salary_stats.get('filtered_count', 0)
             result['salary_stats'] = salary_stats
 
-            if len(processed_df) == 0:
+            if processed_df is not None and self.micro_batch and file_size <= self.micro_batch_file_size:
+                # Небольшой файл: результат выгружается вместе с другими в flush_micro_batch
+                self._add_to_micro_batch(file_path, processed_df, pending_hashes, result,
+                                         content_hash, file_size, started)
+                await self._update_buffered_bytes()
+                return result
+
+            if records_filtered == 0:
                 self.logger.warning(f"   После фильтрации данных не осталось")
             else:
-                self.logger.info(f"   После фильтрации осталось: {len(processed_df)} записей")
+                self.logger.info(f"   После фильтрации осталось: {records_filtered} записей")
                 self.logger.info(f"   Отфильтровано по зарплате: {salary_stats.get('filtered_count', 0)} записей")
 
-            # Шаг 4: Сохранение во временный файл
-            temp_file = await self._save_temp_file(processed_df, file_path, result)
-            if temp_file is None:
-                result['error'] = "Не удалось сохранить временный файл"
-                self.logger.error(result['error'])
-                return result
-
-            # Шаг 5: Загрузка в S3
-            s3_object_name = (f"processed/"
-                              f"{datetime.now().strftime('%Y-%m-%d')}/"
-                              f"salary_filtered_{file_path.stem}_{int(time.time())}.csv")
-
-            self.logger.info(f"   📤 Загрузка в S3: {s3_object_name}")
-            success = await self.s3_client.upload(str(temp_file), s3_object_name)
+            if processed_df is None and temp_file is None:
+                # Результат уже загружен частями
+                success = True
+            elif processed_df is None:
+                # Шаг 5: Загрузка в S3 файла, записанного потоково
+                self.logger.info(f"   📤 Загрузка в S3: {s3_object_name}")
+                with stage('upload', bytes_out=temp_file.stat().st_size):
+                    success = await self.s3_client.upload(str(temp_file), s3_object_name)
+            elif self.partition_by:
+                # Шаги 4-5: Запись Hive-партиций напрямую в S3
+                temp_file = None
+                self.logger.info(f"   📤 Загрузка партиций в S3: {Path(s3_object_name).parent.as_posix()}/")
+                with stage('upload'):
+                    s3_object_name = await self._upload_partitioned(processed_df, file_path, result, s3_object_name)
+                success = s3_object_name is not None
+            elif self.output_format == 'parquet':
+                # Шаги 4-5: Потоковая запись Parquet сразу в S3, без временного файла
+                temp_file = None
+                self.logger.info(f"   📤 Потоковая загрузка Parquet в S3: {s3_object_name}")
+                with stage('upload'):
+                    success = await self._upload_parquet(processed_df, file_path, result, s3_object_name)
+            elif self.stream_upload:
+                # Шаги 4-5: Потоковая загрузка CSV в S3 частями, без временного файла
+                temp_file = None
+                self.logger.info(f"   📤 Потоковая загрузка CSV в S3: {s3_object_name}")
+                with stage('upload'):
+                    success = await self._upload_csv_stream(processed_df, file_path, result, s3_object_name)
+            else:
+                # Шаг 4: Сохранение во временный файл
+                with stage('serialize'):
+                    temp_file = await self._save_temp_file(processed_df, file_path, result)
+                if temp_file is None:
+                    result['error'] = "Не удалось сохранить временный файл"
+                    self.logger.error(result['error'])
+                    return result
+
+                # Шаг 5: Загрузка в S3
+                add_bytes('serialize', bytes_out=temp_file.stat().st_size)
+                self.logger.info(f"   📤 Загрузка в S3: {s3_object_name}")
+                with stage('upload', bytes_out=temp_file.stat().st_size):
+                    success = await self.s3_client.upload(str(temp_file), s3_object_name)
 
             if success:
                 # Получаем версию файла
                 try:
-                    version_id = await self.s3_client.upload_with_versioning(str(temp_file), s3_object_name)
+                    if result.get('version_id'):
+                        # Версия получена при завершении multipart upload
+                        version_id = result['version_id']
+                    elif temp_file is None:
+                        version_id = await self.s3_client.get_version_id(s3_object_name)
+                    else:
+                        version_id = await self.s3_client.upload_with_versioning(str(temp_file), s3_object_name)
                     result['version_id'] = version_id
                 except:
                     result['version_id'] = 'unknown'
@@ -129,15 +446,22 @@ class DataPipeline:
                 result['success'] = True
                 self.logger.info(f"   ✅ Файл загружен в S3: {s3_object_name}")
 
+                # Выгруженные строки попадают в индекс только после успешной загрузки
+                if self.dedup_index is not None and pending_hashes:
+                    self.dedup_index.commit(np.concatenate(pending_hashes))
+
                 # Шаг 6: Перемещение исходного файла
-                await self._move_original_file(file_path)
+                with stage('archive', bytes_in=file_size):
+                    await self._move_original_file(file_path)
+                if self.checkpoints is not None:
+                    self.checkpoints.remove(file_path)
 
             else:
                 result['error'] = "Не удалось загрузить файл в S3"
                 self.logger.error(result['error'])
 
             # Шаг 7: Удаление временного файла
-            if temp_file.exists():
+            if temp_file is not None and temp_file.exists():
                 temp_file.unlink()
                 self.logger.info(f"   🗑️  Временный файл удален: {temp_file.name}")
 
@@ -146,37 +470,551 @@ class DataPipeline:
             self.logger.error(f"❌ Ошибка обработки файла {file_path.name}: {e}")
 
         result['end_time'] = datetime.now().isoformat()
+
+        if self.ledger is not None and content_hash is not None and result['success']:
+            self.ledger.record(content_hash, self.config_hash, file_size, result,
+                               time.monotonic() - started)
         return result
 
-    async def _read_data_file(self, file_path: Path) -> Optional[pd.DataFrame]:
+    async def _reuse_previous_result(self, file_path: Path, previous: Dict[str, Any],
+                                     result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
-        Чтение файла данных в зависимости от формата.
+        Повторное использование результата из журнала обработки: файл не
+        читается и не фильтруется. В режиме ledger_on_match='copy' результат
+        копируется на стороне S3 в папку текущего дня.
+
+        Returns:
+            Результат или None, если прежний объект в S3 недоступен (удален,
+            например, при компактизации) - тогда файл обрабатывается заново
         """
+        self.logger.info(f"   ♻️  Файл уже обработан ранее ({previous['end_time']}): {previous['s3_path']}")
+        s3_path, version_id = previous['s3_path'], previous['version_id']
+
+        extension = Path(previous['s3_path']).suffix
+        s3_object_name = (f"processed/"
+                          f"{datetime.now().strftime('%Y-%m-%d')}/"
+                          f"salary_filtered_{file_path.stem}_{int(time.time())}{extension}")
+
+        # Объект микропакета содержит строки других файлов: копирование не подходит
+        batched = bool(previous.get('batch_files'))
+        if batched and self.ledger_on_match == 'copy':
+            self.logger.info(f"   Результат выгружен в микропакете, копирование пропущено")
+
+        if (self.ledger_on_match == 'copy' and not self.partition_by and not batched
+                and s3_object_name != previous['s3_path']):
+            version_id = await self.s3_client.copy(previous['s3_path'], s3_object_name)
+            if version_id is None:
+                self.logger.warning(f"   ⚠️ Не удалось скопировать результат {previous['s3_path']}, "
+                                    f"файл обрабатывается заново")
+                return None
+            result['copied_from'] = previous['s3_path']
+            s3_path = s3_object_name
+            self.logger.info(f"   ✅ Результат скопирован в S3: {s3_object_name}")
+        elif await self.s3_client.head(previous['s3_path']) is None:
+            self.logger.warning(f"   ⚠️ Результат {previous['s3_path']} не найден в S3, файл обрабатывается заново")
+            return None
+
+        result['ledger_hit'] = True
+        result['records_processed'] = previous['records_processed']
+        result['records_filtered'] = previous['records_filtered']
+        result['s3_path'] = s3_path
+        result['version_id'] = version_id
+        result['success'] = True
+        await self._move_original_file(file_path)
+        result['end_time'] = datetime.now().isoformat()
+        return result
+
+    def _add_to_micro_batch(self, file_path: Path, processed_df: pd.DataFrame,
+                            pending_hashes: List[np.ndarray], result: Dict[str, Any],
+                            content_hash: Optional[str], file_size: int, started: float) -> None:
+        """
+        Добавление результата небольшого файла в текущий микропакет.
+        Исходный файл остается в папке наблюдения до выгрузки пакета.
+        """
+        if self.dedup_index is not None and self._micro_batch and pending_hashes:
+            # Строки, уже попавшие в пакет из других файлов, - тоже повторы
+            buffered = np.concatenate([h for entry in self._micro_batch for h in entry['hashes']])
+            hashes = np.concatenate(pending_hashes)
+            repeated = np.isin(hashes, buffered)
+            if repeated.any():
+                processed_df = processed_df.loc[~repeated]
+                pending_hashes = [hashes[~repeated]]
+                result['salary_stats']['cross_file_duplicates'] = \
+                    result['salary_stats'].get('cross_file_duplicates', 0) + int(repeated.sum())
+                result['records_filtered'] = len(processed_df)
+
+        if not self._micro_batch:
+            self._micro_batch_started = time.monotonic()
+        self._micro_batch.append({
+            'file_path': file_path,
+            'df': processed_df,
+            'hashes': pending_hashes,
+            'result': result,
+            'content_hash': content_hash,
+            'file_size': file_size,
+            'started': started,
+        })
+        self._micro_batch_bytes += int(processed_df.memory_usage(deep=True).sum())
+
+        result['micro_batch'] = 'pending'
+        result['end_time'] = datetime.now().isoformat()
+        self.logger.info(f"   🧺 Результат добавлен в микропакет: файлов {len(self._micro_batch)}, "
+                         f"{self._micro_batch_bytes} байт")
+
+    def micro_batch_due(self) -> bool:
+        """
+        Микропакет набрал max_bytes, ждет дольше window_sec или файлы ждут
+        допуска по бюджету памяти, который занимают накопленные результаты.
+        """
+        if not self._micro_batch:
+            return False
+        return (self._micro_batch_bytes >= self.micro_batch_max_bytes
+                or time.monotonic() - self._micro_batch_started >= self.micro_batch_window
+                or self.admission.waiting > 0)
+
+    async def _update_buffered_bytes(self) -> None:
+        """Результаты микропакета (накапливаемого и выгружаемого) в бюджете памяти."""
+        await self.admission.set_buffered(self._micro_batch_bytes + self._micro_batch_flushing)
+
+    async def flush_micro_batch(self, force: bool = False) -> List[Dict[str, Any]]:
+        """
+        Выгрузка микропакета одним объектом. Каждая строка хранит имя исходного
+        файла (micro_batch_source_column). Исходные файлы перемещаются в архив
+        только после успешной загрузки пакета; при ошибке они остаются в папке
+        наблюдения и будут обработаны повторно.
+
+        Args:
+            force: Выгрузить пакет, даже если он не набрал размер или время ожидания
+
+        Returns:
+            Итоговые результаты обработки файлов пакета (пустой список, если выгрузки не было)
+        """
+        if not self._micro_batch or not (force or self.micro_batch_due()):
+            return []
+
+        flushing = self._micro_batch_bytes
+        entries, self._micro_batch, self._micro_batch_bytes = self._micro_batch, [], 0
+        self._micro_batch_flushing += flushing
+        sources = [entry['file_path'] for entry in entries]
+        df = pd.concat([entry['df'].assign(**{self.micro_batch_source_column: entry['file_path'].name})
+                        for entry in entries], ignore_index=True)
+
+        batch_result = {
+            'records_processed': sum(entry['result']['records_processed'] for entry in entries),
+            'filtered_by_salary': sum(entry['result']['filtered_by_salary'] for entry in entries),
+        }
+        s3_object_name = (f"processed/"
+                          f"{datetime.now().strftime('%Y-%m-%d')}/"
+                          f"salary_filtered_batch_{int(time.time())}_{len(entries)}files.{self.output_format}")
+        self.logger.info(f"🧺 Выгрузка микропакета: файлов {len(entries)}, записей {len(df)}")
+
         try:
-            ext = file_path.suffix.lower()
+            if self.partition_by:
+                batch_result['salary_stats'] = entries[0]['result']['salary_stats']
+                s3_object_name = await self._upload_partitioned(df, sources, batch_result, s3_object_name)
+                success = s3_object_name is not None
+            elif self.output_format == 'parquet':
+                success = await self._upload_parquet(df, sources, batch_result, s3_object_name)
+            else:
+                content = self._csv_header(len(df), sources, batch_result) + await to_thread(
+                    df.to_csv, index=False)
+                success = await self.s3_client.upload_fileobj(io.BytesIO(content.encode('utf-8')),
+                                                              s3_object_name)
+            version_id = await self.s3_client.get_version_id(s3_object_name) if success else None
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка выгрузки микропакета: {e}")
+            success = False
+        del df
+        self._micro_batch_flushing -= flushing
+        await self._update_buffered_bytes()
+
+        results = []
+        for entry in entries:
+            result = entry['result']
+            result['micro_batch'] = s3_object_name if success else None
+            result['micro_batch_files'] = len(entries)
+            if success:
+                result['success'] = True
+                result['s3_path'] = s3_object_name
+                result['version_id'] = version_id or 'unknown'
+                if self.dedup_index is not None and entry['hashes']:
+                    self.dedup_index.commit(np.concatenate(entry['hashes']))
+                await self._move_original_file(entry['file_path'])
+            else:
+                result['error'] = "Не удалось загрузить микропакет в S3"
+            result['end_time'] = datetime.now().isoformat()
+            if self.ledger is not None and entry['content_hash'] is not None and success:
+                self.ledger.record(entry['content_hash'], self.config_hash, entry['file_size'], result,
+                                   time.monotonic() - entry['started'])
+            results.append(result)
+
+        if success:
+            self.logger.info(f"   ✅ Микропакет загружен в S3: {s3_object_name}")
+        else:
+            self.logger.error(f"   Исходные файлы остаются в папке наблюдения: {[p.name for p in sources]}")
+        return results
+
+    def _drop_seen_rows(self, df: pd.DataFrame, salary_stats: Dict,
+                        file_keys: Optional[set] = None) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Удаление строк, уже выгруженных из предыдущих файлов (по индексу хешей),
+        и повторов ключа внутри файла: в самом df и, при потоковой обработке,
+        в предыдущих пакетах файла (хеши пакетов накапливаются в file_keys).
 
-            if ext == '.csv':
-                # Пробуем разные кодировки
-                try:
-                    df = pd.read_csv(file_path, encoding='utf-8')
-                except:
-                    try:
-                        df = pd.read_csv(file_path, encoding='cp1251')
-                    except:
-                        df = pd.read_csv(file_path, encoding='utf-8', errors='replace')
-            elif ext == '.json':
-                df = pd.read_json(file_path)
-            elif ext in ['.xlsx', '.xls']:
-                df = pd.read_excel(file_path)
-            elif ext == '.parquet':
-                df = pd.read_parquet(file_path)
+        Returns:
+            (DataFrame без повторов, хеши оставшихся строк для фиксации в индексе)
+        """
+        if df.empty:
+            return df, np.empty(0, dtype=np.uint64)
+
+        hashes = hash_rows(df, self.dedup_columns)
+        seen = self.dedup_index.contains(hashes)
+        repeated = pd.Series(hashes).duplicated().to_numpy()
+        if file_keys:
+            repeated = repeated | np.fromiter((h in file_keys for h in hashes.tolist()),
+                                              dtype=bool, count=len(hashes))
+        repeated = repeated & ~seen
+        duplicates, key_duplicates = int(seen.sum()), int(repeated.sum())
+        salary_stats['cross_file_duplicates'] = salary_stats.get('cross_file_duplicates', 0) + duplicates
+        salary_stats['key_duplicates'] = salary_stats.get('key_duplicates', 0) + key_duplicates
+        if duplicates:
+            self.logger.info(f"   Удалено дубликатов из предыдущих файлов: {duplicates}")
+        if key_duplicates:
+            self.logger.info(f"   Удалено повторов ключа внутри файла: {key_duplicates}")
+
+        keep = ~(seen | repeated)
+        if not keep.all():
+            df = df.loc[keep]
+        if file_keys is not None:
+            file_keys.update(hashes[keep].tolist())
+        return df, hashes[keep]
+
+    def _is_streamed_input(self, file_path: Path) -> bool:
+        """
+        JSON Lines обрабатываются пакетами, если бэкенд не читает их сам.
+        """
+        ext = file_path.suffix.lower()
+        return ext in JSONL_FORMATS and ext not in self.backend.native_formats
+
+    async def _process_stream(self, file_path: Path,
+                              result: Dict) -> tuple[Optional[Path], Dict, List[np.ndarray]]:
+        """
+        Потоковая обработка (JSON Lines, а также CSV и Parquet, не помещающиеся
+        в бюджет памяти): чтение пакетами по jsonl_batch_lines строк,
+        фильтрация каждого пакета и дозапись результата во временный файл.
+        В памяти одновременно находится один пакет.
+
+        Дубликаты удаляются по всему файлу: хранятся 64-битные хеши уже
+        встреченных строк. Колонки с зарплатой определяются по первому пакету.
+        Партиционирование в этом режиме не применяется.
+
+        Returns:
+            (временный файл или None, статистика фильтрации,
+             хеши строк для индекса дубликатов между файлами)
+        """
+        salary_stats = self._new_stream_stats()
+        if self.partition_by:
+            self.logger.warning("   ⚠️ Партиционирование не применяется к потоковой обработке")
+
+        temp_file = self.temp_folder / (f"salary_filtered_{file_path.stem}_"
+                                        f"{int(time.time())}.{self.output_format}")
+        if self.output_format == 'parquet':
+            writer = ParquetBatchWriter(temp_file, self.parquet_compression, self.parquet_row_group_size)
+        else:
+            writer = CsvBatchWriter(temp_file)
+
+        pending_hashes = []
+        column_stats = {}
+
+        def process_batches() -> Optional[List[str]]:
+            # Чтение, фильтрация и запись пакетов - в отдельном потоке, не блокируя цикл событий
+            seen_hashes, file_keys = set(), set()
+            salary_columns = None
+            for batch in iter_file_batches(file_path, self.jsonl_batch_lines):
+                if salary_columns is None:
+                    salary_columns = self._find_salary_columns(batch)
+                    salary_stats['salary_columns'] = salary_columns
+                    self.logger.info(f"   Формат: {file_path.suffix.lower()} (пакетами), "
+                                     f"колонки: {list(batch.columns)}")
+                    self.logger.info(f"   Найдены колонки с зарплатой: {salary_columns}")
+
+                processed, _, batch_hashes = self._filter_stream_batch(
+                    batch, salary_columns, seen_hashes, file_keys, salary_stats, column_stats)
+                if batch_hashes is not None:
+                    pending_hashes.append(batch_hashes)
+
+                writer.write(processed)
+                salary_stats['remaining_count'] += len(processed)
+            return salary_columns
+
+        try:
+            salary_columns = await to_thread(process_batches)
+            if salary_columns is None:
+                self.logger.warning("   ⚠️ Файл пуст")
+            if self.filter_rules:
+                salary_stats['rule_timings'] = self.filter_rules.timings(salary_stats.pop('rule_counters', {}))
+            salary_stats['column_stats'] = column_stats
+
+            result['records_processed'] = salary_stats['original_count']
+            result['filtered_by_salary'] = salary_stats['filtered_count']
+            if self.output_format == 'parquet':
+                await to_thread(
+                    writer.close, self._output_metadata(salary_stats['remaining_count'], file_path, result))
             else:
-                # Пробуем как текстовый файл
-                try:
-                    df = pd.read_csv(file_path, sep=None, engine='python', encoding='utf-8')
-                except:
-                    self.logger.error(f"Неподдерживаемый формат файла: {ext}")
-                    return None
+                await to_thread(
+                    writer.close, self._csv_header(salary_stats['remaining_count'], file_path, result))
+
+            self.logger.info(f"   Обработано пакетов: {salary_stats['batches']}, "
+                             f"записей: {salary_stats['original_count']}, "
+                             f"дубликатов: {salary_stats['duplicates']}")
+            self.logger.info(f"   📝 Временный файл сохранен: {temp_file.name}")
+            return temp_file, salary_stats, pending_hashes
+
+        except Exception as e:
+            writer.abort()
+            self.logger.error(f"Ошибка потоковой обработки файла {file_path}: {e}")
+            return None, salary_stats, []
+
+    def _new_stream_stats(self) -> Dict[str, Any]:
+        """Начальная статистика потоковой обработки."""
+        salary_stats = {
+            'filtered_count': 0,
+            'salary_columns': [],
+            'original_count': 0,
+            'duplicates': 0,
+            'remaining_count': 0,
+            'batches': 0
+        }
+        if self.filter_rules:
+            salary_stats['filtered_by_rules'] = 0
+            salary_stats['rule_counters'] = {}  # счетчики правил по пакетам файла
+        return salary_stats
+
+    def _filter_stream_batch(self, batch: pd.DataFrame, salary_columns: List[str], seen_hashes: set,
+                             file_keys: set, salary_stats: Dict, column_stats: Dict
+                             ) -> tuple[pd.DataFrame, np.ndarray, Optional[np.ndarray]]:
+        """
+        Обработка одного пакета потокового чтения: удаление дубликатов (внутри
+        пакета и с предыдущими пакетами), фильтрация и накопление статистики.
+        file_keys - хеши ключей дубликатов между файлами, выгружаемых из этого файла.
+
+        Returns:
+            (результат пакета, хеши впервые встреченных строк,
+             хеши для индекса дубликатов между файлами или None)
+        """
+        salary_stats['batches'] += 1
+        salary_stats['original_count'] += len(batch)
+        salary_columns_present = [col for col in salary_columns if col in batch.columns]
+
+        try:
+            hashes = pd.util.hash_pandas_object(batch, index=False).to_numpy()
+        except TypeError:
+            # Вложенные объекты (dict/list) хешируются по строковому представлению
+            hashes = pd.util.hash_pandas_object(batch.astype(str), index=False).to_numpy()
+        new_mask = ~pd.Series(hashes).duplicated().to_numpy()
+        new_mask &= np.fromiter((h not in seen_hashes for h in hashes), dtype=bool, count=len(hashes))
+        new_hashes = hashes[new_mask]
+        seen_hashes.update(new_hashes.tolist())
+        salary_stats['duplicates'] += int((~new_mask).sum())
+        batch = batch.loc[new_mask]
+
+        if salary_columns_present or self.filter_rules:
+            processed, batch_stats = self.stream_backend.filter(
+                batch, salary_columns_present, self.filter, self.filter_rules)
+            salary_stats['filtered_count'] += batch_stats['filtered_count']
+            if self.filter_rules:
+                salary_stats['filtered_by_rules'] += batch_stats.get('filtered_by_rules', 0)
+                merge_rule_counters(salary_stats['rule_counters'], batch_stats.get('rule_counters', {}))
+            merge_column_stats(column_stats, batch_stats.get('column_stats', {}))
+        else:
+            processed = batch
+
+        batch_hashes = None
+        if self.dedup_index is not None:
+            processed, batch_hashes = self._drop_seen_rows(processed, salary_stats, file_keys)
+        return processed, new_hashes, batch_hashes
+
+    async def _process_jsonl_checkpointed(self, file_path: Path, result: Dict, s3_object_name: str
+                                          ) -> tuple[Optional[str], Dict, List[np.ndarray]]:
+        """
+        Потоковая обработка JSON Lines с контрольными точками: результат
+        загружается в S3 частями multipart upload по мере обработки, после
+        каждой части сохраняется контрольная точка (смещение во входном файле,
+        загруженные части, статистика). После сбоя обработка продолжается
+        с последней точки, уже загруженные части не загружаются повторно.
+
+        Returns:
+            (ключ объекта в S3 или None при ошибке, статистика фильтрации,
+             хеши строк для индекса дубликатов между файлами)
+        """
+        if self.partition_by:
+            self.logger.warning("   ⚠️ Партиционирование не применяется к потоковой обработке JSON Lines")
+
+        state = self.checkpoints.load(file_path)
+        if state is not None and not self.checkpoints.is_current(state, file_path):
+            # Файл изменился: прежняя точка недействительна
+            self.logger.warning(f"   ⚠️ Файл изменился после контрольной точки, обработка с начала")
+            await self.s3_client.abort_multipart_upload(state['s3_key'], state['upload_id'])
+            self.checkpoints.unregister_upload(state['upload_id'])
+            self.checkpoints.remove(file_path)
+            state = None
+
+        # Upload того же файла без контрольной точки (точка потеряна) не продолжить - прерываем
+        for upload in self.checkpoints.orphaned_uploads(file_path, state and state['upload_id']):
+            self.logger.warning(f"   ⚠️ Прерывание незавершенной загрузки {upload['s3_key']}")
+            if await self.s3_client.abort_multipart_upload(upload['s3_key'], upload['upload_id']):
+                self.checkpoints.unregister_upload(upload['upload_id'])
+
+        if state is not None:
+            parts_done = len(state['parts'])
+            seen_hashes = set(self.checkpoints.load_hashes(file_path, 'seen', parts_done).tolist())
+            pending_hashes = [self.checkpoints.load_hashes(file_path, 'pending', parts_done)]
+            if state.get('completed'):
+                self.logger.info(f"   ♻️  Результат уже загружен до сбоя: {state['s3_key']}")
+                result['version_id'] = state.get('version_id')
+                return state['s3_key'], state['salary_stats'], pending_hashes
+            self.logger.info(f"   ♻️  Продолжение с контрольной точки: часть {parts_done + 1}, "
+                             f"смещение {state['offset']} байт")
+        else:
+            upload_id = await self.s3_client.create_multipart_upload(s3_object_name)
+            if upload_id is None:
+                return None, self._new_stream_stats(), []
+            self.checkpoints.register_upload(file_path, s3_object_name, upload_id)
+            state = {
+                'fingerprint': self.checkpoints.fingerprint(file_path),
+                's3_key': s3_object_name,
+                'upload_id': upload_id,
+                'parts': [],
+                'offset': 0,
+                'columns': None,
+                'salary_columns': None,
+                'salary_stats': self._new_stream_stats(),
+                'column_stats': {},
+                'completed': False,
+            }
+            seen_hashes = set()
+            pending_hashes = []
+
+        s3_key, upload_id = state['s3_key'], state['upload_id']
+        salary_stats, column_stats = state['salary_stats'], state['column_stats']
+        file_keys = set(np.concatenate(pending_hashes).tolist()) if pending_hashes else set()
+        header = '' if state['parts'] else (
+            f"# Файл отфильтрован по зарплате (> {self.filter})\n"
+            f"# Исходный файл: {file_path.name}\n"
+            f"# Время обработки: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"#\n")
+        writer = MultipartCsvWriter(self.multipart_part_size, header, state['columns'])
+        new_seen, new_pending = [], []
+
+        async def upload_part(body: bytes) -> None:
+            part_number = len(state['parts']) + 1
+            etag = await self.s3_client.upload_part(s3_key, upload_id, part_number, body)
+            if etag is None:
+                raise IOError(f"Не удалось загрузить часть {part_number}")
+            state['parts'].append({'PartNumber': part_number, 'ETag': etag})
+
+        batches = iter_jsonl_batches(file_path, self.jsonl_batch_lines, state['offset'])
+
+        def process_next_batch() -> Optional[int]:
+            # Чтение, фильтрация и сериализация пакета - в отдельном потоке; None - конец файла
+            item = next(batches, None)
+            if item is None:
+                return None
+            batch, offset = item
+            if state.get('salary_columns') is None:
+                # Пустой список - тоже результат определения, повторно не выполняется
+                state['salary_columns'] = salary_stats['salary_columns'] = self._find_salary_columns(batch)
+                self.logger.info(f"   Найдены колонки с зарплатой: {salary_stats['salary_columns']}")
+
+            processed, batch_seen, batch_hashes = self._filter_stream_batch(
+                batch, salary_stats['salary_columns'], seen_hashes, file_keys, salary_stats, column_stats)
+            new_seen.append(batch_seen)
+            if batch_hashes is not None:
+                new_pending.append(batch_hashes)
+                pending_hashes.append(batch_hashes)
+
+            writer.write(processed)
+            salary_stats['remaining_count'] += len(processed)
+            return offset
+
+        try:
+            while (offset := await to_thread(process_next_batch)) is not None:
+                if writer.ready():
+                    await upload_part(writer.take())
+                    state.update(offset=offset, columns=writer.columns)
+                    await to_thread(self.checkpoints.save, file_path, state, {
+                        'seen': np.concatenate(new_seen),
+                        'pending': np.concatenate(new_pending) if new_pending else np.empty(0, dtype=np.uint64),
+                    })
+                    new_seen.clear()
+                    new_pending.clear()
+
+            if self.filter_rules:
+                salary_stats['rule_timings'] = self.filter_rules.timings(salary_stats.pop('rule_counters', {}))
+            salary_stats['column_stats'] = column_stats
+            result['records_processed'] = salary_stats['original_count']
+            result['filtered_by_salary'] = salary_stats['filtered_count']
+
+            # Итоговые счетчики - в конце файла: первая часть уже загружена
+            await upload_part(writer.finish(
+                f"# Всего записей: {salary_stats['original_count']}\n"
+                f"# Отфильтровано по зарплате: {salary_stats['filtered_count']}\n"
+                f"# Осталось записей: {salary_stats['remaining_count']}\n"
+                f"# Порог фильтрации: > {self.filter}\n"))
+            version_id = await self.s3_client.complete_multipart_upload(s3_key, upload_id, state['parts'])
+            if version_id is None:
+                raise IOError("Не удалось завершить multipart загрузку")
+            self.checkpoints.unregister_upload(upload_id)
+            result['version_id'] = version_id
+
+            # Точка удаляется после перемещения исходного файла
+            state.update(completed=True, version_id=version_id)
+            await to_thread(self.checkpoints.save, file_path, state, {
+                'seen': np.concatenate(new_seen) if new_seen else np.empty(0, dtype=np.uint64),
+                'pending': np.concatenate(new_pending) if new_pending else np.empty(0, dtype=np.uint64),
+            })
+
+            self.logger.info(f"   Обработано пакетов: {salary_stats['batches']}, "
+                             f"записей: {salary_stats['original_count']}, "
+                             f"дубликатов: {salary_stats['duplicates']}, "
+                             f"частей загружено: {len(state['parts'])}")
+            return s3_key, salary_stats, pending_hashes
+
+        except Exception as e:
+            # Контрольная точка сохраняется: следующий запуск продолжит с нее
+            self.logger.error(f"Ошибка потоковой обработки файла {file_path} "
+                              f"(загружено частей: {len(state['parts'])}): {e}")
+            return None, salary_stats, []
+
+    async def _load_frame(self, file_path: Path):
+        """
+        Чтение файла во фрейм выбранного бэкенда.
+        Форматы, которые бэкенд не читает сам, читаются через pandas.
+        """
+        try:
+            frame = await to_thread(self.backend.read, file_path)
+        except Exception as e:
+            self.logger.warning(f"   ⚠️ Бэкенд {self.backend.name} не прочитал файл, чтение через pandas: {e}")
+            frame = None
+        if frame is not None:
+            self.logger.info(f"   Формат: {file_path.suffix.lower()}, бэкенд: {self.backend.name}")
+            return frame
+
+        df = await self._read_data_file(file_path)
+        if df is None:
+            return None
+        return await to_thread(self.backend.from_pandas, df)
+
+    async def _read_data_file(self, file_path: Path) -> Optional[pd.DataFrame]:
+        """
+        Чтение файла данных в зависимости от формата (в отдельном потоке).
+        """
+        try:
+            ext = file_path.suffix.lower()
+            df = await to_thread(self._read_by_format, file_path, ext)
+            if df is None:
+                self.logger.error(f"Неподдерживаемый формат файла: {ext}")
+                return None
 
             self.logger.info(f"   Формат: {ext}, колонки: {list(df.columns)}")
             self.logger.info(f"   Размер: {df.shape[0]} строк, {df.shape[1]} столбцов")
@@ -187,89 +1025,120 @@ class DataPipeline:
             self.logger.error(f"Ошибка чтения файла {file_path}: {e}")
             return None
 
-    async def _process_data_with_salary_filter(self, df: pd.DataFrame) -> tuple[pd.DataFrame, Dict]:
+    def _read_by_format(self, file_path: Path, ext: str) -> Optional[pd.DataFrame]:
+        """
+        Разбор файла по расширению; None - неподдерживаемый формат.
+        """
+        if ext == '.csv':
+            # Пробуем разные кодировки
+            try:
+                return pd.read_csv(file_path, encoding='utf-8')
+            except:
+                try:
+                    return pd.read_csv(file_path, encoding='cp1251')
+                except:
+                    return pd.read_csv(file_path, encoding='utf-8', errors='replace')
+        elif ext == '.json':
+            return pd.read_json(file_path)
+        elif ext in JSONL_FORMATS:
+            return pd.read_json(file_path, lines=True)
+        elif ext in ['.xlsx', '.xls']:
+            return self.excel_reader.read(file_path)
+        elif ext == '.parquet':
+            return pd.read_parquet(file_path, memory_map=self.memory_map)
+        elif ext in ARROW_IPC_FORMATS:
+            return self._read_arrow_ipc(file_path)
+        else:
+            # Пробуем как текстовый файл
+            try:
+                return pd.read_csv(file_path, sep=None, engine='python', encoding='utf-8')
+            except:
+                return None
+
+    def _read_arrow_ipc(self, file_path: Path) -> pd.DataFrame:
+        """
+        Чтение Arrow IPC / Feather файла.
+
+        При memory_map файл отображается в память, а колонки DataFrame
+        ссылаются на буферы Arrow (pd.ArrowDtype) без копирования в память
+        процесса: в память попадают только строки, прошедшие фильтр.
+        Сжатые файлы (lz4/zstd - по умолчанию для Feather) при чтении
+        распаковываются, для них копирование неизбежно.
+        """
+        from pyarrow import feather
+
+        table = feather.read_table(str(file_path), memory_map=self.memory_map)
+        if self.memory_map:
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return table.to_pandas()
+
+    async def _process_data_with_salary_filter(self, df) -> tuple[pd.DataFrame, Dict]:
         """
         Обработка и фильтрация данных по зарплате.
 
+        Удаление дубликатов, приведение зарплаты к числу и фильтрация
+        выполняются бэкендом (compute_backend): все условия собираются
+        в один фильтр, результат материализуется один раз.
+
+        Args:
+            df: Фрейм бэкенда (pd.DataFrame для pandas, LazyFrame для polars)
+
         Возвращает:
             - Отфильтрованный DataFrame
             - Статистику фильтрации
         """
-        if df.empty:
-            return df, {'filtered_count': 0, 'salary_columns': []}
-
-        processed_df = df.copy()
         salary_stats = {
             'filtered_count': 0,
             'salary_columns': [],
-            'original_count': len(df)
+            'original_count': self.backend.row_count(df)
         }
 
         try:
             # Шаг 1: Поиск колонок с зарплатой
-            salary_columns = self._find_salary_columns(processed_df)
+            with stage('detect'):
+                salary_columns = await to_thread(self._find_salary_columns, df)
             salary_stats['salary_columns'] = salary_columns
 
             if not salary_columns:
                 self.logger.warning("   ⚠️ Колонки с зарплатой не найдены")
                 self.logger.info("   Доступные колонки для фильтрации:")
-                for col in processed_df.columns:
-                    col_type = processed_df[col].dtype
+                for col, col_type, _ in self.backend.schema(df):
                     self.logger.info(f"     - {col} ({col_type})")
-                return processed_df, salary_stats
-
-            self.logger.info(f"   Найдены колонки с зарплатой: {salary_columns}")
-
-            # Шаг 2: Очистка данных
-            initial_count = len(processed_df)
-
-            # Удаление дубликатов
-            processed_df = processed_df.drop_duplicates()
-            dup_removed = initial_count - len(processed_df)
-            if dup_removed > 0:
-                self.logger.info(f"   Удалено дубликатов: {dup_removed}")
-
-            # Шаг 3: Фильтрация по зарплате
-            for salary_col in salary_columns:
-                if salary_col in processed_df.columns:
-                    # Конвертируем в числовой формат
-                    processed_df[salary_col] = pd.to_numeric(processed_df[salary_col], errors='coerce')
-
-                    # Статистика до фильтрации
-                    salary_before = processed_df[salary_col].describe()
-                    self.logger.info(f"   Статистика по {salary_col} до фильтрации:")
-                    self.logger.info(f"     Мин: {salary_before.get('min', 'N/A'):.2f}")
-                    self.logger.info(f"     Макс: {salary_before.get('max', 'N/A'):.2f}")
-                    self.logger.info(f"     Среднее: {salary_before.get('mean', 'N/A'):.2f}")
-
-                    # ФИЛЬТРАЦИЯ: зарплата > 100
-                    mask = processed_df[salary_col] > self.filter
-                    filtered_count = (~mask).sum()
-
-                    if filtered_count > 0:
-                        self.logger.info(
-                            f"   Отфильтровано записей по {salary_col} "
-                            f"(зарплата <= {self.filter}): {filtered_count}")
-                        salary_stats['filtered_count'] += int(filtered_count)
-                        processed_df = processed_df[mask]
-                    else:
-                        self.logger.info(f"   Все записи по {salary_col} имеют зарплату > "
-                                         f"{self.filter}")
-
-                    # Статистика после фильтрации
-                    if len(processed_df) > 0:
-                        salary_after = processed_df[salary_col].describe()
-                        self.logger.info(f"   Статистика по {salary_col} после фильтрации:")
-                        self.logger.info(f"     Мин: {salary_after.get('min', 'N/A'):.2f}")
-                        self.logger.info(f"     Макс: {salary_after.get('max', 'N/A'):.2f}")
-                        self.logger.info(f"     Среднее: {salary_after.get('mean', 'N/A'):.2f}")
-
-            # Шаг 4: Дополнительная очистка
-            # Удаление строк с пустыми значениями в важных колонках
-            if salary_columns:
-                processed_df = processed_df.dropna(subset=salary_columns)
-                self.logger.info(f"   Удалено записей с зарплатой <="
-                                 f" {self.filter}: {initial_count - len(processed_df)}")
+                if not self.filter_rules:
+                    df = await to_thread(self.backend.to_pandas, df)
+                    salary_stats['original_count'] = len(df)
+                    return df, salary_stats
+            else:
+                self.logger.info(f"   Найдены колонки с зарплатой: {salary_columns}")
+
+            # Шаги 2-4: Дубликаты, числовая зарплата, общая маска, материализация
+            with stage('filter'):
+                processed_df, filter_stats = await to_thread(
+                    self.backend.filter, df, salary_columns, self.filter, self.filter_rules)
+            rule_counters = filter_stats.pop('rule_counters', {})
+            salary_stats.update(filter_stats)
+            initial_count = salary_stats['original_count']
+
+            if salary_stats['duplicates'] > 0:
+                self.logger.info(f"   Удалено дубликатов: {salary_stats['duplicates']}")
+
+            if self.filter_rules:
+                salary_stats['rule_timings'] = self.filter_rules.timings(rule_counters)
+                self.logger.info(f"   Отфильтровано правилами из конфига: "
+                                 f"{salary_stats.get('filtered_by_rules', 0)}")
+
+            for col, col_stats in salary_stats.get('column_stats', {}).items():
+                for moment, title in (('before', 'до'), ('after', 'после')):
+                    self.logger.info(f"   Статистика по {col} {title} фильтрации:")
+                    self.logger.info(f"     Мин: {col_stats[moment]['min']:.2f}")
+                    self.logger.info(f"     Макс: {col_stats[moment]['max']:.2f}")
+                    self.logger.info(f"     Среднее: {col_stats[moment]['mean']:.2f}")
+
+            if salary_stats['filtered_count'] > 0:
+                self.logger.info(f"   Отфильтровано записей (зарплата <= {self.filter}): "
+                                 f"{salary_stats['filtered_count']}")
+            else:
+                self.logger.info(f"   Все записи имеют зарплату > {self.filter}")
 
             # Шаг 5: Логирование результата
             self.logger.info(f"   Итоговая статистика:")
@@ -280,42 +1149,97 @@ class DataPipeline:
             return processed_df, salary_stats
 
         except Exception as e:
+            # Нефильтрованные данные не выгружаются: файл завершается с ошибкой
             self.logger.error(f"Ошибка обработки данных: {e}")
-            return df, salary_stats
+            raise
 
     def _find_salary_columns(self, df: pd.DataFrame) -> List[str]:
         """
         Поиск колонок с зарплатой в DataFrame.
+
+        Порядок определения:
+            1. Явный список колонок из конфига (salary_columns) - автоопределение не выполняется
+            2. Кэш по сигнатуре заголовка (имена колонок + типы)
+            3. Векторизованное определение по ключевым словам и диапазону значений
+
+        Кэш хранит результат для заголовка целиком, поэтому файлы с тем же
+        заголовком не пересчитывают min/max (диапазон проверяется по первому файлу).
+        """
+        schema = self.backend.schema(df)
+
+        # Явное сопоставление схемы из конфига
+        if self.salary_columns_override:
+            column_names = {col for col, _, _ in schema}
+            salary_columns = [col for col in self.salary_columns_override if col in column_names]
+            if salary_columns:
+                return salary_columns
+            self.logger.warning(f"   ⚠️ Колонки из конфига {self.salary_columns_override} "
+                                f"не найдены, выполняется автоопределение")
+
+        signature = tuple((str(col), dtype) for col, dtype, _ in schema)
+        cached = self._salary_columns_cache.get(signature)
+        if cached is not None:
+            self._salary_columns_cache.move_to_end(signature)
+            return list(cached)
+
+        salary_columns = self._detect_salary_columns(df, schema)
+
+        self._salary_columns_cache[signature] = tuple(salary_columns)
+        if len(self._salary_columns_cache) > self.salary_detection_cache_size:
+            self._salary_columns_cache.popitem(last=False)  # Вытесняем самую старую запись
+
+        return salary_columns
+
+    def _detect_salary_columns(self, df, schema: List[tuple]) -> List[str]:
+        """
+        Векторизованное определение колонок с зарплатой.
+        Min/max по всем числовым колонкам-кандидатам считаются одним вызовом.
         """
-        salary_keywords = ['salary', 'зарплата', 'оклад', 'income', 'доход', 'pay', 'wage', 'compensation']
         salary_columns = []
+        range_candidates = []
 
-        for col in df.columns:
+        for col, _, is_numeric in schema:
             col_lower = str(col).lower()
 
             # Проверка по ключевым словам
-            for keyword in salary_keywords:
-                if keyword in col_lower:
-                    salary_columns.append(col)
-                    break
-
-            # Дополнительная проверка: если колонка числовая и имя похоже на зарплату
-            if col not in salary_columns and pd.api.types.is_numeric_dtype(df[col]):
-                # Проверяем диапазон значений (зарплата обычно в разумных пределах)
-                try:
-                    col_min = df[col].min()
-                    col_max = df[col].max()
-
-                    # Зарплата обычно в пределах от 0 до max_threshold
-                    if (0 <= col_min <= self.max_threshold
-                            and 0 <= col_max <= self.max_threshold):
-                        # И имя колонки не похоже на ID или возраст
-                        if not any(x in col_lower for x in ['id', 'age', 'возраст', 'код', 'номер']):
-                            salary_columns.append(col)
-                except:
-                    pass
+            if any(keyword in col_lower for keyword in SALARY_KEYWORDS):
+                salary_columns.append(col)
+            # Числовая колонка, имя которой не похоже на ID или возраст
+            elif is_numeric and not any(x in col_lower for x in NON_SALARY_KEYWORDS):
+                range_candidates.append(col)
 
-        return list(set(salary_columns))  # Убираем дубликаты
+        if range_candidates:
+            try:
+                # Зарплата обычно в пределах от 0 до max_threshold
+                bounds = self.backend.numeric_bounds(df, range_candidates)
+                in_range = ((bounds.loc['min'] >= 0)
+                            & (bounds.loc['max'] <= self.max_threshold))
+                salary_columns.extend(col for col in range_candidates if in_range[col])
+            except Exception as e:
+                self.logger.debug(f"Не удалось проверить диапазон значений: {e}")
+
+        # Сохраняем порядок колонок исходного файла и убираем дубликаты
+        return list(dict.fromkeys(salary_columns))
+
+    @staticmethod
+    def _source_name(original_file: Union[Path, List[Path]]) -> str:
+        """Имя исходного файла или имена файлов микропакета."""
+        if isinstance(original_file, (list, tuple)):
+            return ', '.join(path.name for path in original_file)
+        return original_file.name
+
+    def _csv_header(self, records_remaining: int, original_file: Union[Path, List[Path]], result: Dict) -> str:
+        """
+        Заголовок-комментарий CSV файла с информацией о фильтрации.
+        """
+        return (f"# Файл отфильтрован по зарплате (> {self.filter})\n"
+                f"# Исходный файл: {self._source_name(original_file)}\n"
+                f"# Время обработки: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"# Всего записей: {result.get('records_processed', 0)}\n"
+                f"# Отфильтровано по зарплате: {result.get('filtered_by_salary', 0)}\n"
+                f"# Осталось записей: {records_remaining}\n"
+                f"# Порог фильтрации: > {self.filter}\n"
+                f"#\n")
 
     async def _save_temp_file(self, df: pd.DataFrame, original_file: Path, result: Dict) -> Optional[Path]:
         """
@@ -336,17 +1260,10 @@ class DataPipeline:
             # Сохраняем в CSV с дополнительной информацией
             with open(temp_file, 'w', encoding='utf-8') as f:
                 # Записываем заголовок с информацией о фильтрации
-                f.write(f"# Файл отфильтрован по зарплате (> {self.filter})\n")
-                f.write(f"# Исходный файл: {original_file.name}\n")
-                f.write(f"# Время обработки: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# Всего записей: {total_count}\n")
-                f.write(f"# Отфильтровано по зарплате: {filtered_count}\n")
-                f.write(f"# Осталось записей: {len(df)}\n")
-                f.write(f"# Порог фильтрации: > {self.filter}\n")
-                f.write(f"#\n")
-
-            # Сохраняем данные
-            df.to_csv(temp_file, mode='a', index=False, encoding='utf-8')
+                f.write(self._csv_header(len(df), original_file, result))
+
+            # Сохраняем данные (сериализация - в отдельном потоке)
+            await to_thread(df.to_csv, temp_file, mode='a', index=False, encoding='utf-8')
 
             self.logger.info(f"   📝 Временный файл сохранен: {temp_file.name}")
             self.logger.info(f"   📊 Размер файла: {temp_file.stat().st_size} байт")
@@ -357,38 +1274,194 @@ class DataPipeline:
             self.logger.error(f"Ошибка сохранения временного файла: {e}")
             return None
 
-    async def _move_original_file(self, file_path: Path) -> None:  # ← ВСТАВЬТЕ ЗДЕСЬ
+    def _output_metadata(self, records_remaining: int, original_file: Union[Path, List[Path]], result: Dict) -> Dict[str, Any]:
+        """
+        Метаданные фильтрации для выходного файла.
+        """
+        return {
+            'threshold': self.filter,
+            'source_file': self._source_name(original_file),
+            'processed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'records_total': result.get('records_processed', 0),
+            'records_filtered_by_salary': result.get('filtered_by_salary', 0),
+            'records_remaining': records_remaining,
+            'filter_rules': len(self.filter_rules),
+        }
+
+    async def _upload_parquet(self, df: pd.DataFrame, original_file: Union[Path, List[Path]], result: Dict,
+                              s3_object_name: str) -> bool:
         """
-        Перемещение или архивирование исходного файла.
+        Потоковая запись обработанных данных в Parquet с загрузкой в S3.
+        Группы строк пишутся в pipe, из которого одновременно читает загрузчик.
+        Метаданные фильтрации сохраняются в key-value метаданных файла.
         """
+        metadata = self._output_metadata(len(df), original_file, result)
+
+        def write(sink):
+            return write_parquet(df, sink, metadata,
+                                 compression=self.parquet_compression,
+                                 row_group_size=self.parquet_row_group_size)
+
         try:
-            # Создаем папку для архива по дате
-            archive_date = datetime.now().strftime('%Y-%m-%d')
-            archive_folder = self.processed_folder / "archive" / archive_date
-            archive_folder.mkdir(parents=True, exist_ok=True)
+            success, row_groups = await stream_to_uploader(
+                measured(write), lambda stream: self.s3_client.upload_fileobj(stream, s3_object_name))
+        except Exception as e:
+            # Поток загружен, но запись прервалась - объект в S3 неполный
+            self.logger.error(f"Ошибка записи Parquet: {e}")
+            await self.s3_client.delete_file(s3_object_name)
+            return False
+
+        if success:
+            self.logger.info(f"   📝 Parquet записан: {len(df)} строк, групп строк: {row_groups}, "
+                             f"сжатие: {self.parquet_compression}")
+        return success
+
+    async def _upload_csv_stream(self, df: pd.DataFrame, original_file: Path, result: Dict,
+                                 s3_object_name: str) -> bool:
+        """
+        Потоковая загрузка CSV (с заголовком-комментарием) в S3 без временного файла:
+        сериализация кусками и multipart upload через ограниченную очередь.
+        """
+        chunks = iter_csv_chunks(df, self._csv_header(len(df), original_file, result), self.csv_chunk_rows)
+        next_chunk = measured(next)  # Куски сериализуются в потоках upload_stream
+        written = 0
 
-            # Копируем файл в архив (вместо перемещения)
-            archive_file = archive_folder / file_path.name
+        def counted():
+            nonlocal written
+            while (chunk := next_chunk(chunks, None)) is not None:
+                written += len(chunk)
+                yield chunk
 
-            # Если файл уже существует, добавляем timestamp
-            if archive_file.exists():
-                timestamp = int(time.time())
-                new_name = f"{file_path.stem}_{timestamp}{file_path.suffix}"
-                archive_file = archive_folder / new_name
+        try:
+            return await upload_stream(self.s3_client, s3_object_name, counted(),
+                                       part_size=self.multipart_part_size,
+                                       queue_size=self.stream_upload_queue_size,
+                                       concurrency=self.stream_upload_concurrency)
+        except Exception as e:
+            self.logger.error(f"Ошибка потоковой загрузки CSV: {e}")
+            return False
+        finally:
+            add_bytes('upload', bytes_out=written)
 
-            # Используем shutil для копирования
-            import shutil
-            shutil.copy2(file_path, archive_file)
+    async def _upload_partitioned(self, df: pd.DataFrame, original_file: Union[Path, List[Path]], result: Dict,
+                                  s3_object_name: str) -> Optional[str]:
+        """
+        Запись результата в виде Hive-партиций: <префикс>/<колонка>=<значение>/<файл>.
+        Партиции загружаются параллельно (не более partition_upload_concurrency),
+        после чего обновляется манифест партиций за день.
 
-            # Удаляем исходный файл только после успешного копирования
-            try:
-                file_path.unlink()
-                self.logger.info(
-                    f"   📦 Исходный файл скопирован в архив и удален: {archive_file.relative_to(self.processed_folder)}")
-            except:
-                # Если не удалось удалить, хотя бы заархивировали
-                self.logger.warning(
-                    f"   📦 Исходный файл скопирован в архив, но не удален: {archive_file.relative_to(self.processed_folder)}")
+        Returns:
+            Ключ манифеста в S3 или None при ошибке
+        """
+        s3_prefix, file_name = s3_object_name.rsplit('/', 1)
+
+        # Колонки партиционирования, которых нет в данных, вычисляются или считаются пустыми
+        derived = {}
+        for col in self.partition_by:
+            if col in df.columns:
+                continue
+            salary_columns = result.get('salary_stats', {}).get('salary_columns') or []
+            if col == 'salary_band' and salary_columns:
+                derived[col] = salary_band(df[salary_columns[0]], self.salary_band_width)
+            else:
+                derived[col] = None
+        partitioned_df = df.assign(**derived) if derived else df
+
+        semaphore = asyncio.Semaphore(self.partition_upload_concurrency)
+
+        async def upload_partition(partition: str, part: pd.DataFrame) -> Dict[str, Any]:
+            key = f"{s3_prefix}/{partition}/{file_name}"
+            async with semaphore:
+                if self.output_format == 'parquet':
+                    success = await self._upload_parquet(part, original_file, result, key)
+                else:
+                    content = self._csv_header(len(part), original_file, result) + await to_thread(
+                        part.to_csv, index=False)
+                    success = await self.s3_client.upload_fileobj(io.BytesIO(content.encode('utf-8')), key)
+            return {'partition': partition, 'key': key, 'rows': len(part), 'success': success}
+
+        uploads = await asyncio.gather(*(upload_partition(partition, part)
+                                         for partition, part in partition_frame(partitioned_df,
+                                                                                self.partition_by)))
+        failed = [u['key'] for u in uploads if not u['success']]
+        if failed:
+            self.logger.error(f"   Не удалось загрузить партиции: {failed}")
+            return None
+
+        result['s3_partitions'] = [u['key'] for u in uploads]
+        self.logger.info(f"   📂 Загружено партиций: {len(uploads)}")
+
+        return await self._update_partition_manifest(s3_prefix, original_file, uploads)
+
+    async def _update_partition_manifest(self, s3_prefix: str, original_file: Union[Path, List[Path]],
+                                         uploads: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Обновление манифеста партиций за день: локальная копия + загрузка в S3.
+        Манифест позволяет читателям выбирать нужные партиции без листинга бакета.
+
+        При work_claims манифест дополняют несколько обработчиков: обновление
+        выполняется под блокировкой lock-файла в общей папке захватов, а за
+        основу берется манифест из S3 (локальные папки обработчиков могут различаться).
+        """
+        manifest_folder = self.processed_folder / "manifests"
+        manifest_folder.mkdir(parents=True, exist_ok=True)
+        manifest_name = f"partition_manifest_{s3_prefix.replace('/', '_')}"
+        manifest_file = manifest_folder / f"{manifest_name}.json"
+        manifest_key = f"{s3_prefix}/_manifest.json"
+
+        if self.claims is None:
+            return await self._write_partition_manifest(manifest_file, manifest_key, s3_prefix,
+                                                        original_file, uploads, None)
+        async with async_file_lock(self.claims.lock_path(manifest_name)):
+            current = None
+            if await self.s3_client.head(manifest_key):
+                current = await self.s3_client.read(manifest_key)
+                if current is None:
+                    # Без текущей версии манифест перезаписал бы партиции других обработчиков
+                    self.logger.error(f"   ❌ Не удалось прочитать манифест {manifest_key}")
+                    return None
+            return await self._write_partition_manifest(manifest_file, manifest_key, s3_prefix,
+                                                        original_file, uploads, current)
+
+    async def _write_partition_manifest(self, manifest_file: Path, manifest_key: str, s3_prefix: str,
+                                        original_file: Union[Path, List[Path]], uploads: List[Dict[str, Any]],
+                                        current: Optional[bytes]) -> Optional[str]:
+        """Добавление загруженных партиций в манифест (current из S3 или локальная копия)."""
+        manifest = {'prefix': s3_prefix, 'partition_by': self.partition_by, 'partitions': {}}
+        try:
+            if current is not None:
+                manifest = json.loads(current)
+            elif self.claims is None and manifest_file.exists():
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"   ⚠️ Манифест поврежден и будет создан заново: {e}")
+
+        for upload in uploads:
+            partition = manifest['partitions'].setdefault(upload['partition'], {'rows': 0, 'files': []})
+            partition['rows'] += upload['rows']
+            partition['files'].append({
+                'key': upload['key'],
+                'rows': upload['rows'],
+                'source_file': self._source_name(original_file),
+            })
+        manifest['updated_at'] = datetime.now().isoformat()
+
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        if not await self.s3_client.upload(str(manifest_file), manifest_key):
+            return None
+        return manifest_key
+
+    async def _move_original_file(self, file_path: Path) -> None:  # ← ВСТАВЬТЕ ЗДЕСЬ
+        """
+        Перемещение или архивирование исходного файла (src/archiver.py).
+        """
+        try:
+            archive_file = await self.archiver.archive(file_path)
+            self.logger.info(
+                f"   📦 Исходный файл перемещен в архив: {archive_file.relative_to(self.processed_folder)}")
 
         except Exception as e:
             self.logger.error(f"Ошибка архивации файла {file_path}: {e}")
@@ -396,40 +1469,54 @@ class DataPipeline:
     async def log_pipeline_result(self, result: Dict[str, Any]) -> None:
         """
         Логирование результатов обработки.
+        Запись дописывается в журнал JSON Lines за день (src/run_log.py),
+        в S3 журнал отправляется частями с версионированием манифеста.
         """
+        metrics = StageMetrics()
         try:
-            log_file = self.log_folder / f"pipeline_log_{datetime.now().strftime('%Y-%m-%d')}.json"
-
-            # Читаем существующие логи
-            logs = []
-            if log_file.exists():
-                try:
-                    with open(log_file, 'r', encoding='utf-8') as f:
-                        logs = json.load(f)
-                except:
-                    logs = []
-
-            # Добавляем новый лог
-            logs.append(result)
+            with metrics.stage('log'):
+                self.run_log.write(result)
+                # Ждем записи в файл в отдельном потоке, не блокируя цикл событий
+                await to_thread(self.run_log.flush)
+                self.logger.info(f"   📋 Логи сохранены: {self.run_log.path_for().name}")
 
-            # Сохраняем обновленные логи
-            with open(log_file, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, ensure_ascii=False, indent=2)
+                # Новые записи уходят в S3 частями (src/log_shipper.py)
+                await self.log_shipper.notify()
 
-            # Загружаем логи в S3 с версионированием
-            s3_log_path = (f"logs/"
-                           f"pipeline_log_{datetime.now().strftime('%Y-%m-%d')}.json")
-            await self.s3_client.upload(str(log_file), s3_log_path)
-            await self.s3_client.upload_with_versioning(str(log_file), s3_log_path)
-
-            self.logger.info(f"   📋 Логи сохранены: {log_file.name} -> {s3_log_path}")
+            # Этап log завершается после записи - в журнал не попадает, только в перцентили
+            log_metrics = metrics.as_dict()
+            result.setdefault('stage_metrics', {}).update(log_metrics)
+            self.stage_stats.add(Path(result.get('file_name', '')).suffix.lower(), log_metrics)
 
         except Exception as e:
             self.logger.error(f"Ошибка логирования: {e}")
 
+    async def close(self) -> None:
+        """
+        Завершение работы: запись и отправка в S3 оставшихся записей журнала,
+        закрытие журнала обработки.
+        """
+        await asyncio.to_thread(self.run_log.close)
+        await self.log_shipper.close()
+        if self.ledger is not None:
+            self.ledger.close()
+        if self.claims is not None:
+            await asyncio.to_thread(self.claims.close)
+
+    def claim_file(self, file_path: Path) -> Optional[Path]:
+        """
+        Захват файла для обработки этим обработчиком (при work_claims).
+        Возвращает путь к захваченному файлу или None, если файл взял другой обработчик.
+        """
+        if self.claims is None:
+            return file_path
+        return self.claims.claim(file_path)
+
     async def process_existing_files(self) -> None:
         """
         Обработка существующих файлов в папке incoming.
+        Файлы выдаются очередью self.scheduler (политика, приоритеты источников, старение);
+        одновременно обрабатывается до max_concurrent_files файлов (с допуском по бюджету памяти).
         """
         files = list(self.watch_folder.glob("*.*"))
         if not files:
@@ -437,15 +1524,48 @@ class DataPipeline:
             return
 
         self.logger.info(f"🔍 Найдено файлов для обработки: {len(files)}")
-
-        for file_path in files:
-            if file_path.is_file():
-                # Пропускаем временные файлы и логи
-                if file_path.name.startswith(('.', '~', 'temp_')) or file_path.suffix in ['.log', '.tmp']:
+        # Пропускаем временные файлы и логи
+        self.scheduler.extend(file_path for file_path in files
+                              if file_path.is_file()
+                              and not file_path.name.startswith(('.', '~', 'temp_'))
+                              and file_path.suffix not in ['.log', '.tmp'])
+
+        async def worker() -> None:
+            while (file_path := self.scheduler.pop()) is not None:
+                file_path = self.claim_file(file_path)
+                if file_path is None:
                     continue
-
                 result = await self.process_file(file_path)
-                await self.log_pipeline_result(result)
+                if result.get('micro_batch') != 'pending':
+                    await self.log_pipeline_result(result)
+                for batch_result in await self.flush_micro_batch():
+                    await self.log_pipeline_result(batch_result)
 
                 # Пауза между обработкой файлов
                 await asyncio.sleep(1)
+
+        await asyncio.gather(*(worker() for _ in range(self.max_concurrent_files)))
+
+        for batch_result in await self.flush_micro_batch(force=True):
+            await self.log_pipeline_result(batch_result)
+        self.log_queue_metrics()
+        if self.admission.enabled:
+            self.log_memory_budget()
+
+    def log_queue_metrics(self) -> None:
+        """Глубина очереди и время ожидания по источникам в лог."""
+        metrics = self.scheduler.metrics()
+        self.logger.info(f"📬 Очередь ({metrics['policy']}): в очереди {metrics['depth']}, "
+                         f"дольше всех ждет {metrics['oldest_wait_sec']:.1f} с")
+        for source, wait in metrics['wait_sec'].items():
+            self.logger.info(f"   {source}: файлов {wait['count']}, ожидание p50 {wait['p50']:.1f} с, "
+                             f"p90 {wait['p90']:.1f} с, max {wait['max']:.1f} с")
+
+    def log_memory_budget(self) -> None:
+        """Использование бюджета памяти в лог."""
+        usage = self.admission.utilization()
+        self.logger.info(f"🧠 Бюджет памяти: {usage['reserved_bytes'] / 1024 / 1024:.0f}/"
+                         f"{usage['budget_bytes'] / 1024 / 1024:.0f} МБ "
+                         f"(пик {usage['peak_utilization']:.0%}), в очереди: {usage['waiting']}, "
+                         f"пакетами: {usage['chunked']}, монопольно: {usage['exclusive']}, "
+                         f"ожидали допуска: {usage['waited']} ({usage['wait_sec_total']:.1f} с)")
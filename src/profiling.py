@@ -0,0 +1,188 @@
+"""
+Выборочное профилирование обработки файлов.
+
+Для каждого выбранного файла (один из каждых sample_every или имя по шаблону)
+рядом с логами сохраняются:
+    <файл>_<размер>b_<время>.prof          - статистика cProfile (pstats, snakeviz)
+    <файл>_<размер>b_<время>.profile.txt   - топ функций по cumulative time
+    <файл>_<размер>b_<время>.tracemalloc.txt - топ мест выделения памяти
+    <файл>_<размер>b_<время>.markers.json  - pid, id потока и время начала/конца
+                                              для сопоставления с записью py-spy
+
+cProfile видит только код потока цикла событий (включая другие задачи,
+выполнявшиеся во время await); код в to_thread/run_in_executor не попадает
+в профиль, но его выделения памяти видны в tracemalloc.
+
+tracemalloc общий для процесса: при одновременном профилировании нескольких
+файлов он запускается первым профилем и останавливается последним, а пик
+сбрасывается только при старте профиля без других активных - пик такого
+профиля общий с перекрывающимися (peak_shared в markers.json).
+"""
+import cProfile
+import fnmatch
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class _TracingUsers:
+    """Счетчик активных профилей, использующих tracemalloc."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = 0
+        self._started = False
+        self.acquired = 0  # Всего запусков профилей - по нему видно перекрытие с более поздними
+
+    def acquire(self, frames: int) -> tuple[bool, int]:
+        """
+        Запуск tracemalloc для профиля.
+
+        Returns:
+            (других активных профилей нет и пик сброшен, номер запуска)
+        """
+        with self._lock:
+            self._users += 1
+            self.acquired += 1
+            if self._users > 1:
+                return False, self.acquired
+            self._started = not tracemalloc.is_tracing()
+            if self._started:
+                tracemalloc.start(frames)
+            tracemalloc.reset_peak()
+            return True, self.acquired
+
+    def release(self) -> None:
+        """Остановка tracemalloc после завершения последнего профиля (если его запускали профили)."""
+        with self._lock:
+            self._users -= 1
+            if self._users == 0 and self._started:
+                tracemalloc.stop()
+                self._started = False
+
+
+_tracing = _TracingUsers()
+
+
+class FileProfiler:
+    """
+    Профилирование process_file для выборки файлов.
+    """
+
+    def __init__(self, output_folder: Path, sample_every: int = 0, patterns: Optional[List[str]] = None,
+                 top: int = 30, tracemalloc_frames: int = 10):
+        self.output_folder = Path(output_folder)
+        self.sample_every = sample_every
+        self.patterns = [pattern for pattern in (patterns or []) if pattern]
+        self.top = top
+        self.tracemalloc_frames = tracemalloc_frames
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._seen = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_every > 0 or bool(self.patterns)
+
+    def should_profile(self, file_path: Path) -> bool:
+        """Файл подходит под шаблон или это первый из очередных sample_every файлов."""
+        if not self.enabled:
+            return False
+        self._seen += 1
+        if any(fnmatch.fnmatch(file_path.name, pattern) for pattern in self.patterns):
+            return True
+        return self.sample_every > 0 and (self._seen - 1) % self.sample_every == 0
+
+    @contextmanager
+    def profile(self, file_path: Path) -> Iterator[Dict[str, Any]]:
+        """
+        Профилирование блока. Возвращаемый словарь после выхода из блока
+        содержит пути к сохраненным файлам.
+        """
+        file_size = file_path.stat().st_size if file_path.exists() else 0
+        folder = self.output_folder / datetime.now().strftime('%Y-%m-%d')
+        folder.mkdir(parents=True, exist_ok=True)
+        base = folder / f"{file_path.name}_{file_size}b_{datetime.now().strftime('%H%M%S_%f')}"
+        report: Dict[str, Any] = {}
+
+        exclusive, acquired = _tracing.acquire(self.tracemalloc_frames)
+        try:
+            snapshot_before = tracemalloc.take_snapshot()
+        except BaseException:
+            _tracing.release()
+            raise
+
+        profiler = cProfile.Profile()
+        markers = {
+            'file_name': file_path.name,
+            'file_size': file_size,
+            'pid': os.getpid(),
+            'thread_id': threading.get_native_id(),
+            'start_time': time.time(),
+            'peak_shared': not exclusive,
+        }
+        try:
+            profiler.enable()
+        except ValueError as e:  # Уже работает другой профилировщик
+            self.logger.warning(f"cProfile недоступен: {e}")
+            profiler = None
+
+        try:
+            yield report
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            markers['end_time'] = time.time()
+            markers['duration_sec'] = round(markers['end_time'] - markers['start_time'], 6)
+            try:
+                snapshot_after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                markers['peak_shared'] = markers['peak_shared'] or _tracing.acquired != acquired
+            finally:
+                _tracing.release()
+
+            try:
+                report.update(self._save(base, profiler, snapshot_before, snapshot_after, peak, markers))
+                self.logger.info(f"   🔬 Профиль сохранен: {base.name}.* ({markers['duration_sec']} с)")
+            except Exception as e:
+                self.logger.error(f"Не удалось сохранить профиль {base.name}: {e}")
+
+    def _save(self, base: Path, profiler: Optional[cProfile.Profile],
+              snapshot_before: tracemalloc.Snapshot, snapshot_after: tracemalloc.Snapshot,
+              peak: int, markers: Dict[str, Any]) -> Dict[str, str]:
+        paths = {}
+        if profiler is not None:
+            prof_path = base.with_name(base.name + '.prof')
+            profiler.dump_stats(prof_path)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(self.top)
+            summary_path = base.with_name(base.name + '.profile.txt')
+            summary_path.write_text(text.getvalue(), encoding='utf-8')
+            paths.update(cprofile=str(prof_path), cprofile_summary=str(summary_path))
+
+        memory_path = base.with_name(base.name + '.tracemalloc.txt')
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = snapshot_after.filter_traces(filters).compare_to(
+            snapshot_before.filter_traces(filters), 'traceback')
+        shared = " (общий с одновременно профилируемыми файлами)" if markers['peak_shared'] else ""
+        lines = [f"Пик отслеживаемой памяти: {peak / 1024 / 1024:.2f} МБ{shared}",
+                 f"Топ-{self.top} мест выделения памяти (прирост за обработку файла):", ""]
+        for number, stat in enumerate(diff[:self.top], 1):
+            lines.append(f"#{number}: {stat.size_diff / 1024:+.1f} КБ, блоков {stat.count_diff:+d}")
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+        memory_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        paths['tracemalloc'] = str(memory_path)
+
+        markers['tracemalloc_peak_bytes'] = peak
+        markers_path = base.with_name(base.name + '.markers.json')
+        markers_path.write_text(json.dumps(markers, ensure_ascii=False, indent=2), encoding='utf-8')
+        paths['markers'] = str(markers_path)
+        return paths
@@ -0,0 +1,165 @@
+"""
+Журнал запусков пайплайна в формате JSON Lines (одна запись - одна строка).
+
+Записи только дописываются в конец файла за день: нет чтения и перезаписи
+всего журнала на каждый файл. Запись выполняет фоновый поток, вызывающий
+код только ставит запись в очередь. fsync (если включен) выполняется не
+чаще раза в fsync_interval секунд для всех накопившихся записей.
+
+Чтение и экспорт в прежний формат (JSON массив с отступами):
+    python src/run_log.py export data/logs/pipeline_log_2026-01-08.jsonl pipeline_log_2026-01-08.json
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+_STOP = object()
+
+
+class RunLogWriter:
+    """
+    Буферизованная запись журнала JSON Lines в фоновом потоке.
+    """
+
+    def __init__(self, folder: str, prefix: str = 'pipeline_log',
+                 fsync: bool = False, fsync_interval: float = 1.0):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='run-log-writer', daemon=True)
+        self._thread.start()
+
+    def path_for(self, day: Optional[str] = None) -> Path:
+        """Файл журнала за день (по умолчанию - за сегодня)."""
+        return self.folder / f"{self.prefix}_{day or datetime.now().strftime('%Y-%m-%d')}.jsonl"
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        """Постановка записи в очередь (не блокирует)."""
+        if self._closed:
+            raise RuntimeError("Журнал закрыт")
+        self._queue.put(entry)
+
+    def flush(self) -> None:
+        """Ожидание записи всех поставленных в очередь записей (блокирующий вызов)."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Запись оставшихся записей и остановка фонового потока."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        current_path, handle = None, None
+        last_fsync = time.monotonic()
+        stop = False
+
+        while not stop:
+            batch = [self._queue.get()]
+            # Все, что накопилось в очереди, пишется одним сбросом буфера
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                for entry in batch:
+                    if entry is _STOP:
+                        stop = True
+                        continue
+                    path = self.path_for()
+                    if path != current_path:
+                        if handle is not None:
+                            self._sync(handle)
+                            handle.close()
+                        current_path, handle = path, open(path, 'a', encoding='utf-8')
+                    handle.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+                if handle is not None:
+                    handle.flush()
+                    if self.fsync and (stop or time.monotonic() - last_fsync >= self.fsync_interval):
+                        self._sync(handle)
+                        last_fsync = time.monotonic()
+            except Exception as e:
+                self.logger.error(f"Ошибка записи журнала {current_path}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+        if handle is not None:
+            self._sync(handle)
+            handle.close()
+
+    def _sync(self, handle) -> None:
+        if self.fsync:
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+def read_run_log(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Чтение журнала: JSON Lines или прежний формат (JSON массив).
+    Неполная последняя строка (запись прервана сбоем) пропускается.
+    """
+    path = Path(path)
+    if path.suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logging.getLogger(__name__).warning(f"Пропущена поврежденная строка {number} журнала {path.name}")
+
+
+def export_json_array(source: Path, target: Path) -> int:
+    """
+    Экспорт журнала JSON Lines в прежний формат: JSON массив с отступами.
+
+    Returns:
+        Количество записей
+    """
+    count = 0
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for entry in read_run_log(source):
+            f.write(',\n' if count else '\n')
+            f.write('\n'.join('  ' + line for line in
+                              json.dumps(entry, ensure_ascii=False, indent=2).splitlines()))
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Журнал запусков пайплайна")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help="Экспорт JSON Lines в JSON массив")
+    export.add_argument('source', type=Path)
+    export.add_argument('target', type=Path)
+    args = parser.parse_args()
+
+    exported = export_json_array(args.source, args.target)
+    print(f"Экспортировано записей: {exported} -> {args.target}")
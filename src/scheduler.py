@@ -0,0 +1,190 @@
+"""
+Очередь файлов incoming с приоритетами.
+
+Порядок выдачи файлов определяется тремя уровнями:
+    1. Уровень приоритета: приоритет источника (шаблон имени файла) плюс
+       старение - один уровень за каждые aging_sec ожидания, чтобы большие
+       файлы и файлы низкоприоритетных источников не ждали бесконечно.
+    2. Политика внутри уровня: fifo (по mtime) или sjf (сначала меньшие файлы),
+       либо своя функция ключа.
+    3. Порядок добавления в очередь.
+
+    scheduler = FileScheduler('sjf', sources={'ops_*': 10, 'history_*': -5}, aging_sec=60)
+    scheduler.add(path)
+    path = await scheduler.get()
+"""
+import asyncio
+import fnmatch
+import itertools
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+import numpy as np
+
+DEFAULT_SOURCE = 'default'
+
+# Ключ сортировки файлов одного уровня приоритета (меньше - раньше)
+SCHEDULE_POLICIES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'fifo': lambda entry: entry['mtime'],
+    'sjf': lambda entry: entry['size'],
+}
+
+
+class FileScheduler:
+    """
+    Очередь файлов на обработку с подключаемой политикой, приоритетами
+    источников и старением.
+
+    Args:
+        policy: Имя политики из SCHEDULE_POLICIES или функция entry -> ключ сортировки
+        sources: {шаблон имени файла: приоритет}, первый совпавший шаблон - источник файла;
+                 файлы без совпадений относятся к источнику 'default' с приоритетом 0
+        aging_sec: Время ожидания, за которое файл поднимается на один уровень (0 - без старения)
+        window: Файлов в скользящих перцентилях времени ожидания по источникам
+    """
+
+    def __init__(self, policy: Union[str, Callable[[Dict[str, Any]], Any]] = 'fifo',
+                 sources: Optional[Dict[str, int]] = None, aging_sec: float = 0, window: int = 1000):
+        if callable(policy):
+            self.policy_name, self._policy_key = getattr(policy, '__name__', 'custom'), policy
+        elif policy in SCHEDULE_POLICIES:
+            self.policy_name, self._policy_key = policy, SCHEDULE_POLICIES[policy]
+        else:
+            raise ValueError(f"Неизвестная политика очереди: {policy}, "
+                             f"доступны: {', '.join(SCHEDULE_POLICIES)}")
+        self.sources = dict(sources or {})
+        self.aging_sec = float(aging_sec or 0)
+
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._sequence = itertools.count()
+        self._event: Optional[asyncio.Event] = None
+        self._loop = None
+        self._closed = False
+        self._waits = defaultdict(lambda: deque(maxlen=window))
+        self._dispatched = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def source_of(self, file_path: Path) -> tuple[str, int]:
+        """Источник файла и его приоритет по шаблонам имени."""
+        for pattern, priority in self.sources.items():
+            if fnmatch.fnmatch(file_path.name, pattern):
+                return pattern, int(priority)
+        return DEFAULT_SOURCE, 0
+
+    # --- Очередь ---
+
+    def add(self, file_path: Path) -> bool:
+        """Добавление файла в очередь; False, если файл уже в очереди или исчез."""
+        key = str(file_path.resolve())
+        if key in self._entries:
+            return False
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return False
+        source, priority = self.source_of(file_path)
+        self._entries[key] = {
+            'path': file_path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'source': source,
+            'priority': priority,
+            'enqueued_at': time.monotonic(),
+            'sequence': next(self._sequence),
+        }
+        if self._event is not None:
+            self._event.set()
+        return True
+
+    def extend(self, file_paths: Iterable[Path]) -> int:
+        """Добавление нескольких файлов, возвращает число добавленных."""
+        return sum(self.add(file_path) for file_path in file_paths)
+
+    def discard(self, file_path: Path) -> None:
+        self._entries.pop(str(file_path.resolve()), None)
+
+    def level(self, entry: Dict[str, Any], now: Optional[float] = None) -> int:
+        """Уровень приоритета файла с учетом старения."""
+        if not self.aging_sec:
+            return entry['priority']
+        waited = (now or time.monotonic()) - entry['enqueued_at']
+        return entry['priority'] + int(waited // self.aging_sec)
+
+    def _sort_key(self, entry: Dict[str, Any], now: float) -> tuple:
+        return -self.level(entry, now), self._policy_key(entry), entry['sequence']
+
+    def pop(self) -> Optional[Path]:
+        """
+        Следующий файл по приоритету или None, если очередь пуста.
+        Уровни со старением зависят от времени, поэтому порядок вычисляется
+        при каждой выдаче (очередь incoming - сотни файлов, не миллионы).
+        """
+        if not self._entries:
+            return None
+        now = time.monotonic()
+        key, entry = min(self._entries.items(), key=lambda item: self._sort_key(item[1], now))
+        del self._entries[key]
+        self._waits[entry['source']].append(now - entry['enqueued_at'])
+        self._dispatched[entry['source']] += 1
+        return entry['path']
+
+    def _get_event(self) -> asyncio.Event:
+        """Событие появления файлов, привязанное к текущему циклу событий."""
+        loop = asyncio.get_running_loop()
+        if self._event is None or self._loop is not loop:
+            self._event, self._loop = asyncio.Event(), loop
+        return self._event
+
+    async def get(self) -> Optional[Path]:
+        """Ожидание следующего файла; None после close(), когда очередь пуста."""
+        event = self._get_event()
+        while True:
+            file_path = self.pop()
+            if file_path is not None or self._closed:
+                return file_path
+            event.clear()
+            await event.wait()
+
+    def close(self) -> None:
+        """Завершение get() у ожидающих обработчиков после выдачи оставшихся файлов."""
+        self._closed = True
+        if self._event is not None:
+            self._event.set()
+
+    # --- Метрики ---
+
+    def metrics(self, quantiles: Iterable[int] = (50, 90, 99)) -> Dict[str, Any]:
+        """
+        Глубина очереди и время ожидания.
+
+        Returns:
+            {'policy', 'depth', 'depth_by_source', 'queued_bytes', 'oldest_wait_sec',
+             'dispatched', 'wait_sec': {источник: {'count', 'p50', 'p90', 'p99', 'max'}}}
+        """
+        now = time.monotonic()
+        depth_by_source = defaultdict(int)
+        for entry in self._entries.values():
+            depth_by_source[entry['source']] += 1
+
+        wait_sec = {}
+        for source, values in self._waits.items():
+            if not values:
+                continue
+            points = np.percentile(np.fromiter(values, dtype=float, count=len(values)), list(quantiles))
+            wait_sec[source] = {'count': len(values),
+                                **{f"p{q}": round(float(p), 3) for q, p in zip(quantiles, points)},
+                                'max': round(max(values), 3)}
+        return {
+            'policy': self.policy_name,
+            'depth': len(self._entries),
+            'depth_by_source': dict(depth_by_source),
+            'queued_bytes': sum(entry['size'] for entry in self._entries.values()),
+            'oldest_wait_sec': round(max((now - entry['enqueued_at'] for entry in self._entries.values()),
+                                         default=0.0), 3),
+            'dispatched': dict(self._dispatched),
+            'wait_sec': wait_sec,
+        }
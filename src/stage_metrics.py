@@ -0,0 +1,185 @@
+"""
+Метрики этапов обработки файла: время (wall и CPU), байты на входе и выходе.
+
+Метрики текущего файла хранятся в contextvar, поэтому этапы отмечаются в
+любом методе пайплайна без передачи объекта метрик:
+
+    with stage('read', bytes_in=file_size):
+        df = await self._load_frame(file_path)
+
+Этап может выполняться несколько раз (например, filter) - значения суммируются.
+RollingPercentiles хранит последние значения по типу файла и этапу и
+считает перцентили.
+
+Файлы обрабатываются параллельно, поэтому process_time() и пиковый RSS
+процесса к этапу одного файла не относятся. cpu_ms - время CPU потоков
+(time.thread_time) для работы этапа, выполненной через to_thread() или
+measured() этого модуля: разбор, фильтрация и сериализация идут в потоках,
+и их CPU относится к своему файлу и этапу точно. CPU потока цикла событий
+в cpu_ms не входит. Память процесса учитывается на уровне файлов
+(src/admission.py), по этапам не распределяется.
+"""
+import asyncio
+import functools
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_current: ContextVar[Optional['StageMetrics']] = ContextVar('stage_metrics', default=None)
+# Активные этапы вызывающего кода: ((метрики, этап), ...) - по ним распределяется CPU потоков
+_active: ContextVar[Tuple[tuple, ...]] = ContextVar('stage_metrics_active', default=())
+
+
+def _peak_rss_kb() -> Optional[int]:
+    """Пиковый RSS всего процесса в КБ (None, если недоступно) - для отчетов о процессе, не об этапах."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # На macOS - в байтах
+
+
+class StageMetrics:
+    """
+    Метрики этапов обработки одного файла.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def activate(self):
+        """Метрики становятся текущими для stage(); возвращает токен для deactivate."""
+        return _current.set(self)
+
+    @staticmethod
+    def deactivate(token) -> None:
+        _current.reset(token)
+
+    def _entry(self, name: str) -> Dict[str, Any]:
+        return self.stages.setdefault(name, {
+            'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'bytes_in': 0, 'bytes_out': 0,
+        })
+
+    @contextmanager
+    def stage(self, name: str, bytes_in: int = 0, bytes_out: int = 0) -> Iterator[None]:
+        wall = time.perf_counter()
+        token = _active.set(_active.get() + ((self, name),))
+        try:
+            yield
+        finally:
+            _active.reset(token)
+            with self._lock:
+                entry = self._entry(name)
+                entry['calls'] += 1
+                entry['wall_ms'] += (time.perf_counter() - wall) * 1000
+                entry['bytes_in'] += bytes_in
+                entry['bytes_out'] += bytes_out
+
+    def add_cpu(self, name: str, seconds: float) -> None:
+        """CPU потока, выполнявшего работу этапа."""
+        with self._lock:
+            self._entry(name)['cpu_ms'] += seconds * 1000
+
+    def add_bytes(self, name: str, bytes_in: int = 0, bytes_out: int = 0) -> None:
+        """Байты этапа, известные только после его завершения."""
+        with self._lock:
+            entry = self._entry(name)
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {key: round(value, 3) if isinstance(value, float) else value
+                       for key, value in entry.items()}
+                for name, entry in self.stages.items()}
+
+
+@contextmanager
+def stage(name: str, bytes_in: int = 0, bytes_out: int = 0) -> Iterator[None]:
+    """Замер этапа в текущих метриках (без активных метрик ничего не делает)."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name, bytes_in, bytes_out):
+        yield
+
+
+def add_bytes(name: str, bytes_in: int = 0, bytes_out: int = 0) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_bytes(name, bytes_in, bytes_out)
+
+
+def measured(func: Callable) -> Callable:
+    """
+    Функция для выполнения в другом потоке (executor, pipe загрузки): время
+    CPU этого потока за вызов добавляется к этапам, активным в момент
+    вызова measured(). Без активных этапов функция возвращается как есть.
+    """
+    active = _active.get()
+    if not active:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.thread_time() - started
+            for metrics, name in active:
+                metrics.add_cpu(name, elapsed)
+    return wrapper
+
+
+async def to_thread(func: Callable, *args, **kwargs) -> Any:
+    """asyncio.to_thread с учетом CPU потока в активных этапах."""
+    return await asyncio.to_thread(measured(func), *args, **kwargs)
+
+
+class RollingPercentiles:
+    """
+    Скользящие перцентили метрик этапов по группам (тип файла) за последние window файлов.
+    """
+
+    METRICS = ('wall_ms', 'cpu_ms', 'bytes_in', 'bytes_out')
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._values = defaultdict(lambda: defaultdict(lambda: {
+            metric: deque(maxlen=window) for metric in self.METRICS}))
+
+    def add(self, group: str, stages: Dict[str, Dict[str, Any]]) -> None:
+        for name, entry in stages.items():
+            series = self._values[group][name]
+            for metric in self.METRICS:
+                if entry.get(metric) is not None:
+                    series[metric].append(entry[metric])
+
+    def percentiles(self, quantiles: Sequence[int] = (50, 90, 99)) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Returns:
+            {группа: {этап: {'count': n, метрика: {'p50': ..., 'p90': ..., 'p99': ...}}}}
+        """
+        report = {}
+        for group, stages in self._values.items():
+            report[group] = {}
+            for name, series in stages.items():
+                summary = {'count': len(series['wall_ms'])}
+                for metric, values in series.items():
+                    if values:
+                        points = np.percentile(np.fromiter(values, dtype=float, count=len(values)), quantiles)
+                        summary[metric] = {f"p{q}": round(float(p), 3) for q, p in zip(quantiles, points)}
+                report[group][name] = summary
+        return report
@@ -0,0 +1,250 @@
+"""
+Разделение папки incoming между несколькими процессами (и узлами с общей NFS).
+
+Обработчик захватывает файл атомарным переименованием в свою папку
+<claims_folder>/<worker_id>/: из нескольких обработчиков переименование
+удается только одному, остальные получают FileNotFoundError. Папка
+захватов должна быть на той же файловой системе, что и incoming.
+
+Живость обработчика подтверждается файлом .heartbeat.json в его папке,
+который фоновый поток перезаписывает каждые heartbeat_sec секунд (не
+зависит от занятости цикла событий обработкой). Если heartbeat другого
+обработчика не меняется lease_sec секунд по часам наблюдателя (разница
+часов узлов не важна) или процесс на том же узле завершился, его файлы
+возвращаются в incoming и снова распределяются между обработчиками.
+
+При штатной остановке необработанные (в том числе с ошибкой) файлы
+возвращаются в incoming.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+HEARTBEAT_FILE = '.heartbeat.json'
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _move_no_replace(source: Path, target: Path) -> bool:
+    """
+    Перемещение без перезаписи существующего файла: link + unlink (атомарно
+    и на NFS). False, если target уже существует.
+    """
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        return False
+    except OSError:
+        # Файловая система без жестких ссылок
+        if target.exists():
+            return False
+        os.rename(source, target)
+        return True
+    os.unlink(source)
+    return True
+
+
+class WorkClaims:
+    """
+    Захват файлов incoming с арендой и heartbeat.
+
+    Args:
+        watch_folder: Папка incoming
+        claims_folder: Папка захватов (по умолчанию <watch_folder>/.claims)
+        worker_id: Идентификатор обработчика, уникальный среди всех узлов (по умолчанию host-pid)
+        lease_sec: Через сколько секунд без heartbeat захваты обработчика возвращаются в incoming
+        heartbeat_sec: Интервал heartbeat и проверки чужих захватов
+    """
+
+    def __init__(self, watch_folder: str, claims_folder: Optional[str] = None, worker_id: Optional[str] = None,
+                 lease_sec: float = 60.0, heartbeat_sec: float = 10.0):
+        self.watch_folder = Path(watch_folder)
+        self.claims_folder = Path(claims_folder) if claims_folder else self.watch_folder / ".claims"
+        self.worker_id = worker_id or default_worker_id()
+        self.worker_dir = self.claims_folder / self.worker_id
+        self.lease_sec = lease_sec
+        self.heartbeat_sec = heartbeat_sec
+        self.host = socket.gethostname()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._beat = 0
+        self._observed: Dict[str, tuple] = {}  # worker_id -> (отметка heartbeat, когда изменилась)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'claimed': 0, 'lost': 0, 'released': 0, 'recovered': 0}
+
+    # --- Запуск и остановка ---
+
+    def start(self) -> None:
+        """Регистрация обработчика, возврат файлов прошлого запуска с тем же worker_id, запуск heartbeat."""
+        self.worker_dir.mkdir(parents=True, exist_ok=True)
+        previous = self._read_heartbeat(self.worker_dir)
+        if (previous and previous.get('host') == self.host and previous.get('pid') != os.getpid()
+                and _pid_alive(previous.get('pid', 0))):
+            raise ValueError(f"worker_id {self.worker_id} уже используется процессом {previous['pid']}")
+        self._write_heartbeat()
+        leftovers = self.release_all()
+        if leftovers:
+            self.logger.info(f"♻️ Возвращено в incoming после прошлого запуска: {len(leftovers)}")
+
+        self._thread = threading.Thread(target=self._heartbeat_loop, name=f"claims-{self.worker_id}", daemon=True)
+        self._thread.start()
+        self.logger.info(f"🔐 Обработчик {self.worker_id}: захваты в {self.worker_dir}, "
+                         f"аренда {self.lease_sec:.0f} с")
+
+    def close(self, release: bool = True) -> None:
+        """Остановка heartbeat; необработанные файлы возвращаются в incoming, папка обработчика удаляется."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if release:
+            self.release_all()
+            (self.worker_dir / HEARTBEAT_FILE).unlink(missing_ok=True)
+            try:
+                self.worker_dir.rmdir()
+            except OSError:
+                pass
+
+    # --- Захват ---
+
+    def claim(self, file_path: Path) -> Optional[Path]:
+        """
+        Захват файла из incoming. Возвращает путь к файлу в папке обработчика
+        или None, если файл уже захвачен другим обработчиком.
+        """
+        target = self.worker_dir / file_path.name
+        with self._lock:
+            if target.exists():
+                self.logger.warning(f"   ⚠️ {file_path.name} уже есть среди захваченных файлов, пропускаем")
+                return None
+            try:
+                os.rename(file_path, target)
+            except FileNotFoundError:
+                # На NFS повтор успешного RENAME после потери ответа возвращает ENOENT
+                if not target.exists():
+                    self.stats['lost'] += 1
+                    return None
+        self.stats['claimed'] += 1
+        return target
+
+    def release(self, claimed_path: Path) -> Optional[Path]:
+        """Возврат захваченного файла в incoming (при совпадении имени - с суффиксом worker_id)."""
+        target = self.watch_folder / claimed_path.name
+        if not _move_no_replace(claimed_path, target):
+            target = self.watch_folder / f"{claimed_path.stem}.{self.worker_id}{claimed_path.suffix}"
+            if not _move_no_replace(claimed_path, target):
+                self.logger.warning(f"   ⚠️ Не удалось вернуть {claimed_path.name} в incoming")
+                return None
+        self.stats['released'] += 1
+        return target
+
+    def lock_path(self, name: str) -> Path:
+        """
+        Lock-файл в общей для всех обработчиков папке захватов (для хранилищ,
+        которые обработчики обновляют по очереди). Файл, а не папка, - не
+        принимается за папку обработчика при восстановлении.
+        """
+        return self.claims_folder / f".{name}.lock"
+
+    def claimed(self) -> List[Path]:
+        """Файлы, захваченные этим обработчиком."""
+        return sorted(path for path in self.worker_dir.glob('*')
+                      if path.is_file() and not path.name.startswith('.'))
+
+    def release_all(self) -> List[Path]:
+        with self._lock:
+            return [target for path in self.claimed() if (target := self.release(path)) is not None]
+
+    # --- Heartbeat и восстановление ---
+
+    def _write_heartbeat(self) -> None:
+        self._beat += 1
+        state = {'worker_id': self.worker_id, 'host': self.host, 'pid': os.getpid(), 'beat': self._beat,
+                 'updated_at': datetime.now().isoformat(timespec='seconds')}
+        temp = self.worker_dir / f"{HEARTBEAT_FILE}.tmp"
+        temp.write_text(json.dumps(state), encoding='utf-8')
+        os.replace(temp, self.worker_dir / HEARTBEAT_FILE)
+
+    @staticmethod
+    def _read_heartbeat(worker_dir: Path) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((worker_dir / HEARTBEAT_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_sec):
+            try:
+                self._write_heartbeat()
+                self.recover_expired()
+            except Exception as e:
+                self.logger.error(f"Ошибка heartbeat обработчика {self.worker_id}: {e}")
+
+    def is_expired(self, worker_dir: Path, now: Optional[float] = None) -> bool:
+        """Аренда обработчика истекла: heartbeat не менялся lease_sec или процесс на этом узле завершен."""
+        now = now if now is not None else time.monotonic()
+        heartbeat = self._read_heartbeat(worker_dir)
+        if heartbeat and heartbeat.get('host') == self.host and not _pid_alive(heartbeat.get('pid', 0)):
+            return True
+
+        stamp = (heartbeat.get('pid'), heartbeat.get('beat')) if heartbeat else None
+        observed = self._observed.get(worker_dir.name)
+        if observed is None or observed[0] != stamp:
+            self._observed[worker_dir.name] = (stamp, now)
+            return False
+        return now - observed[1] >= self.lease_sec
+
+    def recover_expired(self, now: Optional[float] = None) -> List[Path]:
+        """Возврат в incoming файлов обработчиков с истекшей арендой."""
+        recovered = []
+        for worker_dir in self.claims_folder.iterdir():
+            if not worker_dir.is_dir() or worker_dir == self.worker_dir:
+                continue
+            if not self.is_expired(worker_dir, now):
+                continue
+
+            dead_worker, returned = worker_dir.name, 0
+            for path in sorted(worker_dir.glob('*')):
+                if not path.is_file() or path.name.startswith('.'):
+                    continue
+                # Сначала файл забирается к себе: из нескольких восстанавливающих успеет один
+                claimed = self.claim(path)
+                if claimed is None:
+                    continue
+                self.stats['claimed'] -= 1
+                with self._lock:
+                    target = self.release(claimed)
+                if target is not None:
+                    self.stats['recovered'] += 1
+                    recovered.append(target)
+                    returned += 1
+
+            (worker_dir / HEARTBEAT_FILE).unlink(missing_ok=True)
+            try:
+                worker_dir.rmdir()
+            except OSError:
+                pass
+            self._observed.pop(dead_worker, None)
+            self.logger.warning(f"♻️ Аренда обработчика {dead_worker} истекла, "
+                                f"возвращено в incoming: {returned}")
+        return recovered
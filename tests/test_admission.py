@@ -0,0 +1,129 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pandas as pd
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from admission import MemoryAdmissionController
+
+
+def write_file(path, size):
+    path.write_bytes(b'x' * (size - 1) + b'\n')
+    return path
+
+
+def test_plan_modes(tmp_path):
+    controller = MemoryAdmissionController(budget_bytes=1000, processing_factor=1.0, batch_rows=10,
+                                           expansion={'.csv': 1.0, '.xlsx': 1.0})
+    small = write_file(tmp_path / "small.csv", 500)
+    large_csv = tmp_path / "large.csv"
+    large_csv.write_bytes(b'abcdefghi\n' * 300)
+    large_xlsx = write_file(tmp_path / "large.xlsx", 3000)
+
+    assert controller._plan(small)['mode'] == 'full'
+    ticket = controller._plan(large_csv)
+    assert ticket['mode'] == 'chunked'
+    assert ticket['reserved_bytes'] == 100  # 10 строк по 10 байт
+    ticket = controller._plan(large_xlsx)
+    assert (ticket['mode'], ticket['reserved_bytes']) == ('exclusive', 1000)
+
+
+def test_admission_waits_in_arrival_order(tmp_path):
+    controller = MemoryAdmissionController(budget_bytes=1000, processing_factor=1.0,
+                                           expansion={'.csv': 1.0})
+    files = {name: write_file(tmp_path / f"{name}.csv", size)
+             for name, size in (('a', 600), ('b', 600), ('c', 300))}
+    order = []
+
+    async def process(name, delay):
+        async with controller.admit(files[name]) as ticket:
+            order.append(name)
+            await asyncio.sleep(delay)
+            return ticket
+
+    async def run():
+        return await asyncio.gather(process('a', 0.05), process('b', 0.01), process('c', 0.01))
+
+    tickets = asyncio.run(run())
+
+    # c помещается в бюджет рядом с a, но не обгоняет ожидающий b
+    assert order == ['a', 'b', 'c']
+    assert tickets[1]['waited_sec'] > 0
+    usage = controller.utilization()
+    assert usage['reserved_bytes'] == 0 and usage['waiting'] == 0
+    assert usage['admitted'] == 3 and usage['peak_utilization'] == 0.9
+
+
+def test_observe_refines_expansion(tmp_path):
+    controller = MemoryAdmissionController(budget_bytes=1000, expansion={'.csv': 2.0}, smoothing=0.5)
+    controller.observe(tmp_path / "a.csv", 100, 400)
+    assert controller.expansion['.csv'] == 3.0
+    controller.observe(tmp_path / "b.csv", 100, None)
+    assert controller.expansion['.csv'] == 3.0
+
+
+def test_disabled_controller_does_not_wait(tmp_path):
+    controller = MemoryAdmissionController()
+    source = write_file(tmp_path / "a.csv", 10 ** 6)
+
+    async def run():
+        async with controller.admit(source) as first, controller.admit(source) as second:
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert first['mode'] == second['mode'] == 'full'
+    assert controller.utilization()['utilization'] is None
+
+
+def test_plan_runs_off_event_loop(tmp_path, monkeypatch):
+    controller = MemoryAdmissionController(budget_bytes=1000)
+    plan = controller._plan
+    threads = []
+
+    def recording_plan(file_path):
+        threads.append(threading.current_thread())
+        return plan(file_path)
+
+    monkeypatch.setattr(controller, '_plan', recording_plan)
+
+    async def run():
+        async with controller.admit(write_file(tmp_path / "a.csv", 100)):
+            pass
+    asyncio.run(run())
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_buffered_results_count_against_budget(tmp_path):
+    controller = MemoryAdmissionController(budget_bytes=1000, processing_factor=1.0,
+                                           expansion={'.csv': 1.0})
+    files = {name: write_file(tmp_path / f"{name}.csv", 400) for name in ('a', 'b', 'c')}
+    order = []
+
+    async def process(name, delay):
+        async with controller.admit(files[name]):
+            order.append(name)
+            await asyncio.sleep(delay)
+
+    async def run():
+        await controller.set_buffered(300)
+        first = asyncio.create_task(process('a', 0.05))
+        await asyncio.sleep(0.01)
+        # b не помещается рядом с a и накопленными результатами - ждет a
+        second = asyncio.create_task(process('b', 0))
+        await asyncio.sleep(0.01)
+        assert controller.utilization()['waiting'] == 1
+        await first
+        await second
+        # Без обрабатываемых файлов накопленные результаты не блокируют допуск
+        await controller.set_buffered(900)
+        await process('c', 0)
+
+    asyncio.run(run())
+    assert order == ['a', 'b', 'c']
+    usage = controller.utilization()
+    assert usage['buffered_bytes'] == 900 and usage['peak_utilization'] == 1.3
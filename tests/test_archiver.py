@@ -0,0 +1,101 @@
+import asyncio
+import errno
+import os
+import sys
+import tarfile
+
+import pyarrow as pa
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from archiver import FileArchiver
+
+
+def make_source(tmp_path, name="employees.csv", content=b"id,salary\n1,80000\n"):
+    source = tmp_path / "incoming" / name
+    source.parent.mkdir(exist_ok=True)
+    source.write_bytes(content)
+    return source
+
+
+def test_archive_moves_without_copy(tmp_path):
+    archiver = FileArchiver(tmp_path / "archive")
+    source = make_source(tmp_path)
+    inode = source.stat().st_ino
+
+    first = asyncio.run(archiver.archive(source))
+    assert not source.exists()
+    assert first.stat().st_ino == inode  # Данные не копировались
+
+    # Повторное имя за день не перезаписывает прежний архив
+    second = asyncio.run(archiver.archive(make_source(tmp_path, content=b"id,salary\n2,90000\n")))
+    assert second != first
+    assert first.read_bytes() == b"id,salary\n1,80000\n"
+
+
+def test_archive_without_hardlinks_does_not_overwrite(tmp_path, monkeypatch):
+    def link_unsupported(source, target):
+        # Файл с тем же именем появляется после выбора имени, а жесткие ссылки не поддерживаются
+        if os.path.basename(target) == "employees.csv":
+            with open(target, 'wb') as f:
+                f.write(b"other worker")
+        raise OSError(errno.EPERM, "Operation not permitted")
+
+    monkeypatch.setattr(os, 'link', link_unsupported)
+    archive_file = asyncio.run(FileArchiver(tmp_path / "archive").archive(make_source(tmp_path)))
+
+    assert archive_file.read_bytes() == b"id,salary\n1,80000\n" and archive_file.name != "employees.csv"
+    assert (archive_file.parent / "employees.csv").read_bytes() == b"other worker"
+
+
+@pytest.mark.parametrize('compression', ['zstd', 'gzip'])
+def test_archive_compressed_per_file(tmp_path, compression):
+    content = b"id,salary\n" + b"1,80000\n" * 1000
+    archive_file = asyncio.run(FileArchiver(tmp_path / "archive", compression=compression)
+                               .archive(make_source(tmp_path, content=content)))
+
+    assert archive_file.name.startswith("employees.csv.")
+    assert archive_file.stat().st_size < len(content)
+    with pa.CompressedInputStream(str(archive_file), compression) as stream:
+        assert stream.read() == content
+
+
+def test_archive_daily_tar(tmp_path):
+    archiver = FileArchiver(tmp_path / "archive", compression='zstd', layout='daily_tar')
+    for name in ("a.csv", "b.csv", "a.csv"):
+        archive_file = asyncio.run(archiver.archive(make_source(tmp_path, name)))
+
+    with tarfile.open(archive_file) as tar:
+        names = tar.getnames()
+    assert len(names) == 3 and names[:2] == ["a.csv.zst", "b.csv.zst"]
+    assert not list((tmp_path / "incoming").iterdir())
+    assert not [path for path in archive_file.parent.iterdir() if path.name.startswith('.')]
+
+
+def test_archive_daily_tar_reads_archive_once(tmp_path, monkeypatch):
+    opened = []
+    tar_open = tarfile.open
+
+    def counting_open(*args, mode='r', **kwargs):
+        opened.append(mode)
+        return tar_open(*args, mode=mode, **kwargs)
+
+    monkeypatch.setattr(tarfile, 'open', counting_open)
+    archiver = FileArchiver(tmp_path / "archive", layout='daily_tar')
+    for i in range(5):
+        archive_file = asyncio.run(archiver.archive(make_source(tmp_path, f"f{i}.csv")))
+    assert 'r' not in opened and 'a' not in opened
+
+    # Новый процесс читает архив за день один раз, дальше дозаписывает без чтения
+    archiver = FileArchiver(tmp_path / "archive", layout='daily_tar')
+    for name in ("f0.csv", "g.csv"):
+        asyncio.run(archiver.archive(make_source(tmp_path, name)))
+    assert opened.count('r') == 1
+
+    with tar_open(archive_file) as tar:
+        names = tar.getnames()
+    assert names[:5] == [f"f{i}.csv" for i in range(5)] and names[-1] == "g.csv"
+    assert len(set(names)) == 7
@@ -0,0 +1,140 @@
+import asyncio
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from backends import PandasBackend, get_backend
+from filter_rules import FilterRuleSet
+
+pytest.importorskip('polars')
+
+
+def dataset(name):
+    rng = np.random.default_rng(42)
+    if name == 'employees':
+        return pd.DataFrame({
+            'id': [1, 2, 3, 4, 2, 5],
+            'name': ['Иван', 'Петр', 'Мария', 'Анна', 'Петр', 'Елена'],
+            'department': ['IT', 'HR', 'IT', 'Финансы', 'HR', None],
+            'salary': [50000, 80000, 60000, 45000, 80000, 120000],
+        })
+    if name == 'text_salary':
+        return pd.DataFrame({
+            'name': ['a', 'b', 'c', 'd', 'e'],
+            'зарплата': ['60000', 'нет данных', None, '70000.5', '100'],
+        })
+    if name == 'two_columns':
+        return pd.DataFrame({
+            'base_salary': [60000.0, 70000.0, np.nan, 90000.0],
+            'income': [56000, 40000, 80000, 100000],
+        })
+    if name == 'random':
+        n = 5000
+        df = pd.DataFrame({
+            'id': np.arange(n),
+            'department': rng.choice(['IT', 'HR', 'Продажи'], n),
+            'salary': rng.integers(0, 200000, n),
+        })
+        return pd.concat([df, df.sample(500, random_state=1)], ignore_index=True)
+    if name == 'empty':
+        return pd.DataFrame({'name': pd.Series(dtype=str), 'salary': pd.Series(dtype=float)})
+    raise ValueError(name)
+
+
+DATASETS = ['employees', 'text_salary', 'two_columns', 'random', 'empty']
+RULES = [{'column': 'department', 'op': 'in', 'values': ['IT', 'HR']}]
+
+
+def run(backend, frame, salary_columns, rules=None):
+    return backend.filter(frame, salary_columns, 55000, FilterRuleSet(rules))
+
+
+def assert_parity(expected, actual):
+    expected_df, expected_stats = expected
+    actual_df, actual_stats = actual
+
+    pd.testing.assert_frame_equal(expected_df.reset_index(drop=True), actual_df.reset_index(drop=True),
+                                  check_dtype=False)
+    for key in ('original_count', 'duplicates', 'filtered_count', 'filtered_by_rules'):
+        assert expected_stats.get(key) == actual_stats.get(key), key
+    for col, stages in expected_stats.get('column_stats', {}).items():
+        for stage, values in stages.items():
+            for stat, value in values.items():
+                other = actual_stats['column_stats'][col][stage][stat]
+                assert (math.isnan(value) and math.isnan(other)) or value == pytest.approx(other), \
+                    (col, stage, stat)
+
+
+@pytest.mark.parametrize('name', DATASETS)
+def test_filter_parity(name):
+    df = dataset(name)
+    salary_columns = [col for col in df.columns if col in ('salary', 'зарплата', 'base_salary', 'income')]
+    polars_backend = get_backend('polars')
+
+    assert_parity(run(PandasBackend(), df, salary_columns),
+                  run(polars_backend, polars_backend.from_pandas(df), salary_columns))
+
+
+@pytest.mark.parametrize('name', ['employees', 'random'])
+def test_filter_parity_with_rules(name):
+    df = dataset(name)
+    polars_backend = get_backend('polars')
+
+    assert_parity(run(PandasBackend(), df, ['salary'], RULES),
+                  run(polars_backend, polars_backend.from_pandas(df), ['salary'], RULES))
+
+
+@pytest.mark.parametrize('name', ['employees', 'random'])
+def test_lazy_scan_parity(tmp_path, name):
+    source = tmp_path / f"{name}.csv"
+    dataset(name).to_csv(source, index=False)
+    polars_backend = get_backend('polars')
+    frame = polars_backend.read(source)
+
+    assert frame is not None
+    assert_parity(run(PandasBackend(), pd.read_csv(source), ['salary']),
+                  run(polars_backend, frame, ['salary']))
+
+
+def test_polars_filter_deduplicates_once(monkeypatch):
+    import polars as pl
+
+    calls = []
+    unique = pl.LazyFrame.unique
+
+    def counting_unique(self, *args, **kwargs):
+        calls.append(1)
+        return unique(self, *args, **kwargs)
+
+    monkeypatch.setattr(pl.LazyFrame, 'unique', counting_unique)
+    polars_backend = get_backend('polars')
+    processed_df, stats = run(polars_backend, polars_backend.from_pandas(dataset('employees')), ['salary'])
+
+    assert len(calls) == 1
+    assert stats['duplicates'] == 1 and len(processed_df) == 3 and '__keep' not in processed_df.columns
+    assert stats['collected_bytes'] > 0
+
+
+def test_schema_and_bounds_parity():
+    df = dataset('random')
+    polars_backend = get_backend('polars')
+    frame = polars_backend.from_pandas(df)
+
+    assert [(col, numeric) for col, _, numeric in PandasBackend().schema(df)] == \
+        [(col, numeric) for col, _, numeric in polars_backend.schema(frame)]
+    pd.testing.assert_frame_equal(PandasBackend().numeric_bounds(df, ['id', 'salary']),
+                                  polars_backend.numeric_bounds(frame, ['id', 'salary']),
+                                  check_dtype=False)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend('spark')
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pandas as pd
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(root_dir, 'src'), os.path.join(root_dir, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bench_s3 import OPERATIONS, bench_size
+from dataset import generate_employees, write_dataset
+from local_s3 import make_local_storage
+from pipeline import DataPipeline
+
+
+def test_generate_employees_reproducible():
+    df = generate_employees(1000, extra_columns=2, duplicate_ratio=0.1, null_ratio=0.05, seed=7)
+
+    assert len(df) == 1000
+    assert df.duplicated().sum() == 100
+    assert df['salary'].isna().any()
+    pd.testing.assert_frame_equal(df, generate_employees(1000, extra_columns=2, duplicate_ratio=0.1,
+                                                         null_ratio=0.05, seed=7))
+
+
+def test_local_s3_versions_and_multipart(tmp_path):
+    storage = make_local_storage()
+    source = tmp_path / "data.txt"
+
+    async def scenario():
+        source.write_bytes(b"v1")
+        first = await storage.upload_with_versioning(str(source), "data.txt")
+        source.write_bytes(b"v2")
+        await storage.upload_with_versioning(str(source), "data.txt")
+        restored = tmp_path / "restored.txt"
+        assert await storage.download_version("data.txt", str(restored), first)
+        assert restored.read_bytes() == b"v1"
+        assert len(await storage.list_versions("data.txt")) == 2
+
+        upload_id = await storage.create_multipart_upload("big.bin")
+        etags = [await storage.upload_part("big.bin", upload_id, number, body)
+                 for number, body in ((1, b"a" * 5 * 1024 * 1024), (2, b"b"))]
+        await storage.complete_multipart_upload(
+            "big.bin", upload_id, [{'PartNumber': n, 'ETag': e} for n, e in zip((1, 2), etags)])
+        assert (await storage.head("big.bin"))['Size'] == 5 * 1024 * 1024 + 1
+
+        assert await storage.delete_file("data.txt")
+        assert not await storage.file_exists("data.txt")
+        assert await storage.list_files() == ["big.bin"]
+
+    asyncio.run(scenario())
+
+
+def test_pipeline_with_local_s3(tmp_path):
+    df = generate_employees(500, duplicate_ratio=0.02)
+    config = {
+        'watch_folder': str(tmp_path / "incoming"),
+        'processed_folder': str(tmp_path / "processed"),
+        'temp_folder': str(tmp_path / "temp"),
+        'log_folder': str(tmp_path / "logs"),
+        'filter_threshold': 55000,
+        'max_threshold': 1000000,
+    }
+    storage = make_local_storage()
+    pipeline = DataPipeline(storage, config)
+    source = write_dataset(df, pipeline.watch_folder / "employees.csv", encoding='cp1251')
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success'] and result['version_id'] not in (None, 'null')
+    assert 0 < result['records_filtered'] < len(df)
+    assert list(storage.local.objects()) == [result['s3_path']]
+
+
+def test_bench_s3_operations(tmp_path):
+    storage = make_local_storage()
+    args = SimpleNamespace(prefix='benchmark', keys=4, ops=8, operations=list(OPERATIONS))
+    (tmp_path / "downloads").mkdir()
+
+    report = asyncio.run(bench_size(storage, 2048, 4, args, tmp_path))
+
+    assert list(report) == list(OPERATIONS)
+    assert all(summary['errors'] == 0 for summary in report.values())
+    assert report['upload']['mb_per_s'] > 0 and report['file_exists']['mb_per_s'] is None
+    assert report['delete_file']['ops'] == 4
+    assert storage.local.objects() == {}
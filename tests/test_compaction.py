@@ -0,0 +1,144 @@
+import asyncio
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from compaction import PrefixCompactor
+from output_writers import read_parquet_metadata
+
+
+class FakeBucket:
+    """Бакет в памяти с методами AsyncObjectStorage, которые использует компакция."""
+
+    def __init__(self):
+        self.objects = {}
+        self.range_bytes = 0
+
+    async def list_objects(self, prefix=""):
+        return [{'Key': key, 'Size': len(data), 'LastModified': None, 'ETag': None}
+                for key, data in sorted(self.objects.items()) if key.startswith(prefix)]
+
+    async def read(self, object_name):
+        return self.objects.get(object_name)
+
+    async def head(self, object_name):
+        if object_name not in self.objects:
+            return None
+        return {'Size': len(self.objects[object_name]), 'ETag': None, 'VersionId': 'v1'}
+
+    async def read_range(self, object_name, start, end=None):
+        if object_name not in self.objects:
+            return None
+        data = self.objects[object_name][start:None if end is None else end + 1]
+        self.range_bytes += len(data)
+        return data
+
+    async def upload_fileobj(self, fileobj, object_name):
+        self.objects[object_name] = fileobj.read()
+        return True
+
+    async def delete_files(self, object_names):
+        for key in object_names:
+            self.objects.pop(key, None)
+        return []
+
+
+def csv_result(df):
+    return ("# Файл отфильтрован по зарплате (> 55000)\n#\n" + df.to_csv(index=False)).encode('utf-8')
+
+
+def test_compaction_merges_small_objects():
+    bucket = FakeBucket()
+    prefix = "processed/2026-01-08/"
+    for i in range(5):
+        df = pd.DataFrame({'id': [i * 2, i * 2 + 1], 'name': ['Петр', 'Мария #2'], 'salary': [80000, 60000]})
+        bucket.objects[f"{prefix}salary_filtered_part{i}_1767891380.csv"] = csv_result(df)
+    bucket.objects[f"{prefix}department=IT/salary_filtered_x_1.csv"] = b"partition"
+    size = len(bucket.objects[f"{prefix}salary_filtered_part0_1767891380.csv"])
+
+    compactor = PrefixCompactor(bucket, {'compaction_target_bytes': size * 3})
+    result = asyncio.run(compactor.compact('2026-01-08'))
+
+    assert result['objects_compacted'] == result['deleted'] == 5
+    assert [len(output['sources']) for output in result['outputs']] == [3, 2]
+    merged = pd.concat(pd.read_parquet(io.BytesIO(bucket.objects[output['key']])) for output in result['outputs'])
+    assert merged['id'].tolist() == list(range(10))
+    assert merged['name'].tolist() == ['Петр', 'Мария #2'] * 5
+    assert read_parquet_metadata(io.BytesIO(bucket.objects[result['outputs'][0]['key']]))['compacted_sources'] == '3'
+
+    manifest = json.loads(bucket.objects[f"{prefix}compacted/_manifest.json"])
+    assert sum(output['rows'] for output in manifest['outputs']) == 10
+    assert f"{prefix}department=IT/salary_filtered_x_1.csv" in bucket.objects
+
+    # Повторный запуск: объединять нечего
+    assert asyncio.run(compactor.compact('2026-01-08'))['objects_found'] == 0
+
+
+def test_compaction_lifecycle_mode_keeps_originals():
+    bucket = FakeBucket()
+    prefix = "processed/2026-01-08/"
+    for i in range(2):
+        bucket.objects[f"{prefix}salary_filtered_part{i}_1.csv"] = csv_result(pd.DataFrame({'salary': [80000]}))
+
+    compactor = PrefixCompactor(bucket, {'compaction_delete_originals': 'lifecycle'})
+    result = asyncio.run(compactor.compact('2026-01-08'))
+
+    assert result['objects_compacted'] == 2 and result['deleted'] == 0
+    # Исходные объекты остаются до lifecycle policy, но повторно не объединяются
+    assert asyncio.run(compactor.compact('2026-01-08'))['objects_found'] == 0
+
+
+def test_compaction_unifies_types_and_keeps_originals_on_failed_check():
+    bucket = FakeBucket()
+    prefix = "processed/2026-01-09/"
+    frames = [pd.DataFrame({'id': [1, 2], 'code': [10, 20], 'salary': [80000, 60000]}),
+              pd.DataFrame({'id': [3], 'code': ['A-7'], 'salary': [70500.5]})]
+    for i, df in enumerate(frames):
+        bucket.objects[f"{prefix}salary_filtered_part{i}_1767891380.csv"] = csv_result(df)
+    originals = dict(bucket.objects)
+
+    # Загруженный объект обрезан: проверка числа строк не проходит, исходные объекты остаются
+    upload = bucket.upload_fileobj
+
+    async def truncated_upload(fileobj, object_name):
+        await upload(fileobj, object_name)
+        bucket.objects[object_name] = bucket.objects[object_name][:-100]
+        return True
+
+    bucket.upload_fileobj = truncated_upload
+    compactor = PrefixCompactor(bucket, {'compaction_target_bytes': 10 ** 6})
+    result = asyncio.run(compactor.compact('2026-01-09'))
+    assert result['deleted'] == 0 and result['failed']
+    assert bucket.objects == originals
+
+    bucket.upload_fileobj = upload
+    result = asyncio.run(compactor.compact('2026-01-09'))
+    assert result['deleted'] == 2 and not result['failed']
+    merged = pd.read_parquet(io.BytesIO(bucket.objects[result['outputs'][0]['key']]))
+    assert merged['code'].tolist() == ['10', '20', 'A-7']
+    assert merged['salary'].tolist() == [80000.0, 60000.0, 70500.5]
+    assert result['outputs'][0]['rows'] == 3
+
+
+def test_compaction_verifies_footer_without_download(monkeypatch):
+    import compaction
+
+    bucket = FakeBucket()
+    prefix = "processed/2026-01-10/"
+    for i in range(3):
+        df = pd.DataFrame({'id': range(i * 100, i * 100 + 100), 'salary': [80000] * 100})
+        bucket.objects[f"{prefix}salary_filtered_part{i}_1767891380.csv"] = csv_result(df)
+    # Футер больше первого ranged GET: дочитывается вторым запросом
+    monkeypatch.setattr(compaction, 'PARQUET_TAIL_BYTES', 16)
+
+    result = asyncio.run(PrefixCompactor(bucket, {'compaction_target_bytes': 10 ** 6}).compact('2026-01-10'))
+
+    assert result['deleted'] == 3 and result['outputs'][0]['rows'] == 300
+    assert bucket.range_bytes < result['outputs'][0]['bytes']
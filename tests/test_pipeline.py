@@ -0,0 +1,943 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from pipeline import DataPipeline
+from output_writers import read_parquet_metadata
+from stage_metrics import StageMetrics, stage, to_thread as stage_to_thread
+
+
+class FakeS3Client:
+    """Хранилище в памяти вместо AsyncObjectStorage."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.uploaded_parts = []
+        self.fail_part = None
+
+    async def upload(self, file_path, object_name):
+        with open(file_path, 'rb') as f:
+            self.objects[object_name] = f.read()
+        return True
+
+    async def upload_with_versioning(self, file_path, object_name):
+        await self.upload(file_path, object_name)
+        return 'v1'
+
+    async def upload_fileobj(self, fileobj, object_name):
+        self.objects[object_name] = fileobj.read()
+        return True
+
+    async def get_version_id(self, object_name):
+        return 'v1'
+
+    async def copy(self, source_object, object_name):
+        if source_object not in self.objects:
+            return None
+        self.objects[object_name] = self.objects[source_object]
+        return 'v2'
+
+    async def create_multipart_upload(self, object_name):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    async def upload_part(self, object_name, upload_id, part_number, body):
+        if part_number == self.fail_part:
+            raise ConnectionError("обрыв соединения")
+        self.uploads[upload_id][part_number] = body
+        self.uploaded_parts.append(part_number)
+        return f"etag-{part_number}"
+
+    async def complete_multipart_upload(self, object_name, upload_id, parts):
+        chunks = self.uploads.pop(upload_id)
+        self.objects[object_name] = b''.join(chunks[part['PartNumber']] for part in parts)
+        return 'v1'
+
+    async def abort_multipart_upload(self, object_name, upload_id):
+        self.uploads.pop(upload_id, None)
+        return True
+
+    async def delete_file(self, object_name):
+        self.objects.pop(object_name, None)
+        return True
+
+    async def read(self, object_name):
+        return self.objects.get(object_name)
+
+    async def head(self, object_name):
+        if object_name not in self.objects:
+            return None
+        return {'Size': len(self.objects[object_name]), 'ETag': None, 'VersionId': 'v1'}
+
+
+def make_config(tmp_path, **overrides):
+    config = {
+        'watch_folder': str(tmp_path / "incoming"),
+        'processed_folder': str(tmp_path / "processed"),
+        'temp_folder': str(tmp_path / "temp"),
+        'log_folder': str(tmp_path / "logs"),
+        'filter_threshold': 55000,
+        'max_threshold': 1000000,
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def employees():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4],
+        'name': ['Иван', 'Петр', 'Мария', 'Анна'],
+        'age': [25, 30, 35, 40],
+        'salary': [50000, 80000, 60000, 45000],
+        'bonus': [1000, 2000, 3000, 4000],
+    })
+
+
+def test_find_salary_columns(tmp_path, employees):
+    pipeline = DataPipeline(None, make_config(tmp_path))
+
+    assert pipeline._find_salary_columns(employees) == ['salary', 'bonus']
+
+
+def test_find_salary_columns_cache_and_eviction(tmp_path, employees):
+    pipeline = DataPipeline(None, make_config(tmp_path, salary_detection_cache_size=1))
+
+    pipeline._find_salary_columns(employees)
+    # Тот же заголовок - результат берется из кэша, даже если значения вне диапазона
+    out_of_range = employees.assign(bonus=[-1, -2, -3, -4])
+    assert pipeline._find_salary_columns(out_of_range) == ['salary', 'bonus']
+
+    pipeline._find_salary_columns(employees.rename(columns={'bonus': 'premium'}))
+    assert len(pipeline._salary_columns_cache) == 1
+    assert pipeline._find_salary_columns(out_of_range) == ['salary']
+
+
+def test_find_salary_columns_override(tmp_path, employees):
+    pipeline = DataPipeline(None, make_config(tmp_path, salary_columns=['bonus']))
+
+    assert pipeline._find_salary_columns(employees) == ['bonus']
+    assert not pipeline._salary_columns_cache
+
+
+def test_process_data_with_salary_filter(tmp_path, employees):
+    pipeline = DataPipeline(None, make_config(tmp_path))
+    df = employees.drop(columns='bonus')
+    df = pd.concat([df, df.iloc[[1]]], ignore_index=True)
+    df.loc[len(df)] = [5, 'Елена', 28, None]
+
+    processed_df, stats = asyncio.run(pipeline._process_data_with_salary_filter(df))
+
+    assert processed_df['name'].tolist() == ['Петр', 'Мария']
+    assert stats['filtered_count'] == 3
+    assert stats['column_stats']['salary']['after']['min'] == 60000
+
+
+def test_filter_rules(tmp_path, employees):
+    rules = [
+        {'name': 'names', 'any': [
+            {'column': 'name', 'op': 'regex', 'pattern': '^П'},
+            {'column': 'name', 'op': 'in', 'values': ['Анна']},
+        ]},
+        {'column': 'age', 'op': 'range', 'min': 30, 'max': 40},
+        {'column': 'department', 'op': 'notnull'},
+    ]
+    pipeline = DataPipeline(None, make_config(tmp_path, filter_rules=rules, filter_threshold=0))
+
+    processed_df, stats = asyncio.run(pipeline._process_data_with_salary_filter(employees))
+
+    assert processed_df['name'].tolist() == ['Петр', 'Анна']
+    assert stats['filtered_by_rules'] == 2
+    timings = {t['rule']: t for t in stats['rule_timings']}
+    assert list(timings) == ['names', 'names.1', 'names.2', 'rule_2', 'rule_3']
+    assert timings['rule_3']['calls'] == 0  # Колонки department нет в файле
+
+    # Статистика правил - по каждому файлу, суммарная за процесс - отдельно
+    _, stats = asyncio.run(pipeline._process_data_with_salary_filter(employees))
+    second = {t['rule']: t for t in stats['rule_timings']}
+    assert [second['rule_2'][key] for key in ('calls', 'rows', 'rejected')] == [
+        timings['rule_2'][key] for key in ('calls', 'rows', 'rejected')] == [1, 4, 1]
+    assert {t['rule']: t['calls'] for t in pipeline.filter_rules.timings()}['rule_2'] == 2
+
+
+def test_filter_rules_invalid_config(tmp_path):
+    with pytest.raises(ValueError):
+        DataPipeline(None, make_config(tmp_path, filter_rules=[{'column': 'salary', 'op': 'between'}]))
+    with pytest.raises(ValueError):
+        DataPipeline(None, make_config(tmp_path, filter_rules=[{'op': 'expr', 'expr': 'salary >'}]))
+
+
+def test_expr_rule_columns_and_failed_filter(tmp_path, employees):
+    rules = [{'name': 'ratio', 'op': 'expr', 'expr': 'bonus < salary * 0.06 and `name` != "Петр"'},
+             {'name': 'missing', 'op': 'expr', 'expr': 'abs(premium) > 0'}]
+    pipeline = DataPipeline(None, make_config(tmp_path, filter_rules=rules, filter_threshold=0))
+    assert [rule.columns for rule in pipeline.filter_rules.rules] == [['bonus', 'name', 'salary'], ['premium']]
+
+    processed_df, stats = asyncio.run(pipeline._process_data_with_salary_filter(employees))
+    assert processed_df['name'].tolist() == ['Иван', 'Мария']
+    assert stats['rule_timings'][1]['calls'] == 0  # Колонки premium нет в файле
+
+    # Ошибка фильтрации завершает файл с ошибкой, нефильтрованные строки не выгружаются
+    s3_client = FakeS3Client()
+    rules = [{'op': 'expr', 'expr': 'name > 1'}]
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, filter_rules=rules))
+    source = pipeline.watch_folder / "employees.csv"
+    employees.to_csv(source, index=False)
+    result = asyncio.run(pipeline.process_file(source))
+    assert not result['success'] and result['error']
+    assert not s3_client.objects
+    assert source.exists()
+
+
+def test_process_file_parquet_output(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, output_format='parquet',
+                                                   parquet_row_group_size=1))
+    source = pipeline.watch_folder / "employees.csv"
+    employees.drop(columns='bonus').to_csv(source, index=False)
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success'] and result['s3_path'].endswith('.parquet')
+    data = io.BytesIO(s3_client.objects[result['s3_path']])
+    assert pd.read_parquet(data)['name'].tolist() == ['Петр', 'Мария']
+    metadata = read_parquet_metadata(data)
+    assert metadata['source_file'] == 'employees.csv'
+    assert metadata['records_remaining'] == '2'
+    assert not list(pipeline.temp_folder.iterdir())
+
+
+def test_process_file_partitioned_output(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, partition_by=['age', 'salary_band'],
+                                                   filter_threshold=45000, salary_band_width=50000))
+    source = pipeline.watch_folder / "employees.csv"
+    employees.drop(columns='bonus').to_csv(source, index=False)
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success'] and result['s3_path'].endswith('/_manifest.json')
+    prefix = result['s3_path'].rsplit('/', 1)[0]
+    assert sorted(p[len(prefix) + 1:].rsplit('/', 1)[0] for p in result['s3_partitions']) == [
+        'age=25/salary_band=50000-99999',
+        'age=30/salary_band=50000-99999',
+        'age=35/salary_band=50000-99999',
+    ]
+    manifest = json.loads(s3_client.objects[result['s3_path']])
+    assert sum(p['rows'] for p in manifest['partitions'].values()) == 3
+    content = s3_client.objects[result['s3_partitions'][0]].decode('utf-8')
+    assert content.startswith('# Файл отфильтрован') and content.splitlines()[8] == 'id,name,salary'
+
+
+@pytest.mark.parametrize('compute_backend', ['pandas', 'polars'])
+def test_process_file_arrow_ipc(tmp_path, employees, compute_backend):
+    if compute_backend == 'polars':
+        pytest.importorskip('polars')
+    from pyarrow import feather
+
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, compute_backend=compute_backend))
+    source = pipeline.watch_folder / "employees.arrow"
+    df = employees.drop(columns='bonus')
+    df.loc[len(df)] = [5, 'Елена', 28, None]
+    feather.write_feather(df, source, compression='uncompressed')
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success']
+    assert (result['records_processed'], result['records_filtered']) == (5, 2)
+    assert 'Петр' in s3_client.objects[result['s3_path']].decode('utf-8')
+
+
+def test_read_excel_all_sheets_with_cache(tmp_path, employees, caplog):
+    pytest.importorskip('openpyxl')
+    pipeline = DataPipeline(None, make_config(tmp_path, excel_sheets='all',
+                                              excel_cache_folder=str(tmp_path / "cache")))
+    source = pipeline.watch_folder / "employees.xlsx"
+    with pd.ExcelWriter(source) as writer:
+        employees.iloc[:2].to_excel(writer, sheet_name='Москва', index=False)
+        employees.iloc[2:].to_excel(writer, sheet_name='Казань', index=False)
+
+    df = asyncio.run(pipeline._read_data_file(source))
+    cached = list((tmp_path / "cache").glob("*.parquet"))
+    # Повторное чтение той же книги берется из кэша
+    with caplog.at_level(logging.INFO):
+        df_again = asyncio.run(pipeline._read_data_file(source))
+
+    assert 'из кэша конвертации' in caplog.text
+    assert df['sheet'].tolist() == ['Москва', 'Москва', 'Казань', 'Казань']
+    assert len(cached) == 1
+    pd.testing.assert_frame_equal(df, df_again)
+
+    # Недописанный файл кэша удаляется, книга разбирается заново
+    cached[0].write_bytes(cached[0].read_bytes()[:100])
+    pd.testing.assert_frame_equal(asyncio.run(pipeline._read_data_file(source)), df)
+    pd.testing.assert_frame_equal(pd.read_parquet(cached[0]), df)
+    assert sorted(path.name for path in (tmp_path / "cache").iterdir()) == [cached[0].name]
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_process_file_jsonl_stream(tmp_path, employees, output_format):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, jsonl_batch_lines=2, output_format=output_format))
+    source = pipeline.watch_folder / "employees.jsonl"
+    df = employees.drop(columns='bonus')
+    # Дубликат строки из первого пакета попадает в последний пакет
+    pd.concat([df, df.iloc[[1]]]).to_json(source, orient='records', lines=True, force_ascii=False)
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success']
+    stats = result['salary_stats']
+    assert (stats['batches'], stats['duplicates'], stats['filtered_count']) == (3, 1, 2)
+    assert stats['column_stats']['salary']['before']['mean'] == pytest.approx(58750)
+    data = io.BytesIO(s3_client.objects[result['s3_path']])
+    if output_format == 'parquet':
+        assert read_parquet_metadata(data)['records_remaining'] == '2'
+        output = pd.read_parquet(data)
+    else:
+        output = pd.read_csv(data, comment='#')
+    assert output['name'].tolist() == ['Петр', 'Мария']
+    assert not list(pipeline.temp_folder.iterdir())
+
+
+def test_jsonl_stream_resumes_from_checkpoint(tmp_path, employees):
+    s3_client = FakeS3Client()
+    config = make_config(tmp_path, jsonl_batch_lines=2, stream_checkpoints=True,
+                         checkpoint_folder=str(tmp_path / "checkpoints"), multipart_part_size=1)
+    source = tmp_path / "incoming" / "employees.jsonl"
+    df = pd.concat([employees.drop(columns='bonus')] * 3, ignore_index=True)
+    df['id'] = range(len(df))
+    source.parent.mkdir(parents=True)
+    df.to_json(source, orient='records', lines=True, force_ascii=False)
+
+    # Сбой на загрузке третьей части: две части и контрольная точка сохранены
+    s3_client.fail_part = 3
+    result = asyncio.run(DataPipeline(s3_client, config).process_file(source))
+    assert not result['success']
+    assert s3_client.uploaded_parts == [1, 2]
+
+    # Новый экземпляр пайплайна продолжает с третьей части
+    s3_client.fail_part = None
+    pipeline = DataPipeline(s3_client, config)
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success']
+    assert s3_client.uploaded_parts == [1, 2, 3, 4, 5, 6, 7]  # 6 пакетов + итоговый комментарий
+    assert result['records_processed'] == 12
+    data = s3_client.objects[result['s3_path']]
+    assert pd.read_csv(io.BytesIO(data), comment='#')['id'].tolist() == [1, 2, 5, 6, 9, 10]
+    assert data.decode('utf-8').endswith("# Осталось записей: 6\n# Порог фильтрации: > 55000\n")
+    assert [path.name for path in (tmp_path / "checkpoints").iterdir()] == ["uploads"]
+    assert not list((tmp_path / "checkpoints" / "uploads").iterdir())
+
+
+def test_checkpoint_follows_file_between_workers(tmp_path, employees):
+    s3_client = FakeS3Client()
+    config = make_config(tmp_path, jsonl_batch_lines=2, stream_checkpoints=True, work_claims=True,
+                         checkpoint_folder=str(tmp_path / "checkpoints"), multipart_part_size=1,
+                         claim_heartbeat_sec=3600)
+    source = tmp_path / "incoming" / "employees.jsonl"
+    df = pd.concat([employees.drop(columns='bonus')] * 3, ignore_index=True)
+    df['id'] = range(len(df))
+    source.parent.mkdir(parents=True)
+    df.to_json(source, orient='records', lines=True, force_ascii=False)
+
+    # Первый обработчик загружает две части и возвращает файл в incoming
+    s3_client.fail_part = 3
+    first = DataPipeline(s3_client, {**config, 'worker_id': 'worker-1'})
+    assert not asyncio.run(first.process_file(first.claim_file(source)))['success']
+    asyncio.run(first.close())
+    assert source.exists()
+
+    # Второй обработчик продолжает с контрольной точки, хотя путь файла другой
+    s3_client.fail_part = None
+    second = DataPipeline(s3_client, {**config, 'worker_id': 'worker-2'})
+    result = asyncio.run(second.process_file(second.claim_file(source)))
+    assert result['success']
+    assert s3_client.uploaded_parts == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_jsonl_stream_aborts_upload_of_lost_checkpoint(tmp_path, employees):
+    s3_client = FakeS3Client()
+    checkpoint_folder = tmp_path / "checkpoints"
+    config = make_config(tmp_path, jsonl_batch_lines=2, stream_checkpoints=True,
+                         checkpoint_folder=str(checkpoint_folder), multipart_part_size=1)
+    source = tmp_path / "incoming" / "employees.jsonl"
+    source.parent.mkdir(parents=True)
+    employees.drop(columns=['bonus', 'salary']).to_json(source, orient='records', lines=True, force_ascii=False)
+
+    s3_client.fail_part = 2
+    assert not asyncio.run(DataPipeline(s3_client, config).process_file(source))['success']
+    assert len(s3_client.uploads) == 1
+    # Контрольная точка потеряна, реестр загрузок сохранился
+    for folder in checkpoint_folder.iterdir():
+        if folder.name != "uploads":
+            shutil.rmtree(folder)
+
+    s3_client.fail_part = None
+    pipeline = DataPipeline(s3_client, config)
+    detections = []
+    # Колонки зарплаты не найдены: пустой результат не определяется заново на каждом пакете
+    pipeline._find_salary_columns = lambda batch: detections.append(len(batch)) or []
+    s3_client.get_version_id = None  # Версия берется из complete_multipart_upload
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success'] and result['version_id'] == 'v1'
+    assert len(detections) == 1
+    assert not s3_client.uploads
+    assert not list((checkpoint_folder / "uploads").iterdir())
+
+
+def test_micro_batch_single_object(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, micro_batch=True, micro_batch_window_sec=3600))
+    df = employees.drop(columns='bonus')
+    sources = []
+    for i in range(3):
+        source = pipeline.watch_folder / f"small_{i}.csv"
+        df.to_csv(source, index=False)
+        sources.append(source)
+        assert asyncio.run(pipeline.process_file(source))['micro_batch'] == 'pending'
+
+    assert asyncio.run(pipeline.flush_micro_batch()) == []  # Пакет еще не набран
+    assert not s3_client.objects and all(source.exists() for source in sources)
+
+    results = asyncio.run(pipeline.flush_micro_batch(force=True))
+
+    assert len(s3_client.objects) == 1
+    assert all(r['success'] and r['s3_path'] == results[0]['s3_path'] for r in results)
+    output = pd.read_csv(io.BytesIO(s3_client.objects[results[0]['s3_path']]), comment='#')
+    assert output['source_file'].value_counts().to_dict() == {f"small_{i}.csv": 2 for i in range(3)}
+    assert not any(source.exists() for source in sources)
+
+
+@pytest.mark.parametrize('compute_backend', ['pandas', 'polars'])
+def test_memory_budget_counts_micro_batch_and_polars_frames(tmp_path, employees, compute_backend):
+    if compute_backend == 'polars':
+        pytest.importorskip('polars')
+    pipeline = DataPipeline(FakeS3Client(), make_config(tmp_path, micro_batch=True, micro_batch_window_sec=3600,
+                                                        memory_budget_mb=64, compute_backend=compute_backend,
+                                                        memory_expansion={'.csv': 1000.0}))
+    source = pipeline.watch_folder / "small.csv"
+    employees.drop(columns='bonus').to_csv(source, index=False)
+
+    assert asyncio.run(pipeline.process_file(source))['micro_batch'] == 'pending'
+    # Коэффициент расширения уточнен и для ленивого фрейма Polars
+    assert pipeline.admission.expansion['.csv'] < 1000.0
+    assert pipeline.admission.utilization()['buffered_bytes'] == pipeline._micro_batch_bytes > 0
+
+    asyncio.run(pipeline.flush_micro_batch(force=True))
+    assert pipeline.admission.utilization()['buffered_bytes'] == 0
+
+
+def test_micro_batch_failed_upload_keeps_sources(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, micro_batch=True))
+    source = pipeline.watch_folder / "small.csv"
+    employees.drop(columns='bonus').to_csv(source, index=False)
+    asyncio.run(pipeline.process_file(source))
+
+    async def fail_upload(fileobj, object_name):
+        return False
+    s3_client.upload_fileobj = fail_upload
+    [result] = asyncio.run(pipeline.flush_micro_batch(force=True))
+
+    assert not result['success'] and result['error']
+    assert source.exists()
+
+
+def test_log_shipping_uploads_new_segments(tmp_path):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, log_ship_interval_sec=3600))
+
+    async def run():
+        for i in range(5):
+            await pipeline.log_pipeline_result({'file_name': f"file_{i}.csv", 'success': True})
+        await pipeline.close()
+    asyncio.run(run())
+
+    # Первая запись отправлена сразу, остальные накоплены и отправлены при остановке
+    day = pipeline.run_log.path_for().stem
+    parts = sorted(key for key in s3_client.objects if key.startswith(f"logs/{day}/part-"))
+    assert parts == [f"logs/{day}/part-00001.jsonl", f"logs/{day}/part-00002.jsonl"]
+    assert [s3_client.objects[key].count(b'\n') for key in parts] == [1, 4]
+    manifest = json.loads(s3_client.objects[f"logs/{day}/_manifest.json"])
+    assert manifest['records'] == 5 and len(manifest['parts']) == 2
+
+    # После перезапуска отправляются только новые строки
+    pipeline = DataPipeline(s3_client, make_config(tmp_path))
+    async def run_again():
+        await pipeline.log_pipeline_result({'file_name': 'file_5.csv', 'success': True})
+        await pipeline.close()
+    asyncio.run(run_again())
+    assert s3_client.objects[f"logs/{day}/part-00003.jsonl"].count(b'\n') == 1
+
+
+def test_process_file_csv_stream_upload(tmp_path, employees):
+    s3_client = FakeS3Client()
+    df = pd.concat([employees.drop(columns='bonus')] * 50, ignore_index=True)
+    df['id'] = range(len(df))
+    config = make_config(tmp_path, csv_chunk_rows=7, multipart_part_size=256, stream_upload_concurrency=2)
+    pipeline = DataPipeline(s3_client, config)
+    source = pipeline.watch_folder / "employees.csv"
+    df.to_csv(source, index=False)
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success']
+    assert len(s3_client.uploaded_parts) > 2 and not s3_client.uploads
+    data = s3_client.objects[result['s3_path']]
+    assert "# Осталось записей: 100\n".encode('utf-8') in data
+    assert pd.read_csv(io.BytesIO(data), comment='#')['id'].tolist() == df.loc[df['salary'] > 55000, 'id'].tolist()
+    assert not list(pipeline.temp_folder.iterdir())
+
+
+def test_stage_metrics_and_percentiles(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path))
+
+    async def run():
+        for i in range(3):
+            source = pipeline.watch_folder / f"employees_{i}.csv"
+            employees.to_csv(source, index=False)
+            result = await pipeline.process_file(source)
+            await pipeline.log_pipeline_result(result)
+        return result
+    result = asyncio.run(run())
+
+    metrics = result['stage_metrics']
+    assert set(metrics) == {'read', 'detect', 'filter', 'upload', 'archive', 'log'}
+    assert metrics['read']['bytes_in'] == metrics['archive']['bytes_in'] > 0
+    assert metrics['upload']['bytes_out'] == len(s3_client.objects[result['s3_path']])
+    assert all(m['wall_ms'] >= 0 and m['cpu_ms'] >= 0 for m in metrics.values())
+    # CPU - время потоков, выполнявших работу этапа; RSS процесса по этапам не распределяется
+    assert metrics['read']['cpu_ms'] > 0 and metrics['filter']['cpu_ms'] > 0
+    assert all('rss_peak_delta_kb' not in m for m in metrics.values())
+
+    # В журнал попадают метрики этапов до log
+    logged = json.loads(pipeline.run_log.path_for().read_text(encoding='utf-8').splitlines()[-1])
+    assert set(logged['stage_metrics']) == set(metrics) - {'log'}
+
+    percentiles = pipeline.stage_percentiles()['.csv']
+    assert percentiles['read']['count'] == percentiles['log']['count'] == 3
+    assert set(percentiles['upload']['wall_ms']) == {'p50', 'p90', 'p99'}
+
+
+def test_stage_cpu_is_attributed_per_file():
+    def burn():
+        deadline = time.thread_time() + 0.05
+        while time.thread_time() < deadline:
+            pass
+
+    async def busy(metrics):
+        token = metrics.activate()
+        try:
+            with stage('filter'):
+                await stage_to_thread(burn)
+        finally:
+            metrics.deactivate(token)
+
+    async def idle(metrics):
+        token = metrics.activate()
+        try:
+            with stage('upload'):
+                await asyncio.sleep(0.1)
+        finally:
+            metrics.deactivate(token)
+
+    async def run():
+        busy_metrics, idle_metrics = StageMetrics(), StageMetrics()
+        await asyncio.gather(busy(busy_metrics), idle(idle_metrics))
+        return busy_metrics.as_dict(), idle_metrics.as_dict()
+    busy_stages, idle_stages = asyncio.run(run())
+
+    # CPU соседнего файла не попадает в этап, который в это время ждал
+    assert busy_stages['filter']['cpu_ms'] >= 45
+    assert idle_stages['upload']['cpu_ms'] == 0
+
+
+def test_profiling_samples_files(tmp_path, employees):
+    pipeline = DataPipeline(FakeS3Client(), make_config(tmp_path, profile_sample_every=3,
+                                                        profile_patterns=['slow_*.csv']))
+    profiled = []
+    for name in ('a.csv', 'b.csv', 'slow_export.csv', 'c.csv'):
+        source = pipeline.watch_folder / name
+        employees.to_csv(source, index=False)
+        result = asyncio.run(pipeline.process_file(source))
+        if 'profile' in result:
+            profiled.append(name)
+
+    assert profiled == ['a.csv', 'slow_export.csv', 'c.csv']
+    profile = result['profile']
+    assert set(profile) == {'cprofile', 'cprofile_summary', 'tracemalloc', 'markers'}
+    assert 'c.csv_' in os.path.basename(profile['cprofile'])
+    assert '_process_file' in open(profile['cprofile_summary'], encoding='utf-8').read()
+    markers = json.load(open(profile['markers'], encoding='utf-8'))
+    assert markers['file_size'] == len(employees.to_csv(index=False).encode('utf-8'))
+
+
+def test_blocking_work_runs_off_event_loop(tmp_path, employees):
+    pipeline = DataPipeline(FakeS3Client(), make_config(tmp_path))
+    threads = {}
+    for name in ('_read_by_format', '_find_salary_columns'):
+        method = getattr(pipeline, name)
+
+        def wrapped(*args, _name=name, _method=method):
+            threads[_name] = threading.get_ident()
+            return _method(*args)
+        setattr(pipeline, name, wrapped)
+    backend_filter = pipeline.backend.filter
+
+    def wrapped_filter(*args):
+        threads['filter'] = threading.get_ident()
+        return backend_filter(*args)
+    pipeline.backend.filter = wrapped_filter
+
+    source = pipeline.watch_folder / "employees.csv"
+    employees.to_csv(source, index=False)
+    assert asyncio.run(pipeline.process_file(source))['success']
+    assert set(threads) == {'_read_by_format', '_find_salary_columns', 'filter'}
+    assert threading.get_ident() not in threads.values()
+
+
+def test_concurrent_profiles_share_tracemalloc(tmp_path, employees):
+    pipeline = DataPipeline(FakeS3Client(), make_config(tmp_path, profile_sample_every=1, max_concurrent_files=3))
+    for i in range(3):
+        employees.to_csv(pipeline.watch_folder / f"employees_{i}.csv", index=False)
+
+    asyncio.run(pipeline.process_existing_files())
+
+    markers = [json.loads(path.read_text(encoding='utf-8'))
+               for path in pipeline.profiler.output_folder.rglob('*.markers.json')]
+    assert len(markers) == 3 and all(m['tracemalloc_peak_bytes'] > 0 for m in markers)
+    assert not tracemalloc.is_tracing()
+
+    # Первый завершившийся профиль не останавливает tracemalloc и не сбрасывает пик второго
+    profiler = pipeline.profiler
+    source = pipeline.watch_folder / "employees_0.csv"
+    with profiler.profile(source) as first:
+        data = bytearray(4 * 1024 * 1024)
+        with profiler.profile(source) as second:
+            pass
+        del data
+    assert not tracemalloc.is_tracing()
+    first_markers = json.loads(open(first['markers'], encoding='utf-8').read())
+    second_markers = json.loads(open(second['markers'], encoding='utf-8').read())
+    assert first_markers['peak_shared'] and second_markers['peak_shared']
+    assert first_markers['tracemalloc_peak_bytes'] >= 4 * 1024 * 1024
+
+
+def test_cross_file_dedup(tmp_path, employees):
+    s3_client = FakeS3Client()
+    config = make_config(tmp_path, cross_file_dedup=True, cross_file_dedup_columns=['id'],
+                         dedup_index_folder=str(tmp_path / "dedup"))
+    pipeline = DataPipeline(s3_client, config)
+    df = employees.drop(columns='bonus')
+    first = pipeline.watch_folder / "export_1.csv"
+    df.iloc[:2].to_csv(first, index=False)
+    asyncio.run(pipeline.process_file(first))
+
+    # Новый процесс читает индекс с диска
+    pipeline = DataPipeline(s3_client, config)
+    second = pipeline.watch_folder / "export_2.csv"
+    df.to_csv(second, index=False)
+    result = asyncio.run(pipeline.process_file(second))
+
+    assert result['salary_stats']['cross_file_duplicates'] == 1
+    assert result['records_filtered'] == 1
+    assert len(pipeline.dedup_index) == 2
+
+
+@pytest.mark.parametrize('ext', ['.csv', '.jsonl'])
+def test_cross_file_dedup_key_repeated_in_file(tmp_path, employees, ext):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, cross_file_dedup=True, cross_file_dedup_columns=['id'],
+                                                   filter_threshold=0, jsonl_batch_lines=2))
+    df = employees.drop(columns='bonus')
+    # Та же запись с другой зарплатой - в том же пакете и в последнем пакете
+    df = pd.concat([df.iloc[:2], df.iloc[[0]].assign(salary=1), df.iloc[2:], df.iloc[[1]].assign(salary=2)])
+    source = pipeline.watch_folder / f"export{ext}"
+    if ext == '.csv':
+        df.to_csv(source, index=False)
+    else:
+        df.to_json(source, orient='records', lines=True, force_ascii=False)
+
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success'] and result['salary_stats']['key_duplicates'] == 2
+    assert result['records_filtered'] == len(employees)
+    assert len(pipeline.dedup_index) == len(employees)
+
+
+def test_ledger_reuses_result_for_same_content(tmp_path, employees):
+    s3_client = FakeS3Client()
+    config = make_config(tmp_path, ledger_path=str(tmp_path / "ledger.sqlite"), ledger_on_match='copy')
+    source = tmp_path / "incoming" / "employees.csv"
+
+    first = None
+    for attempt in range(2):
+        if attempt:
+            time.sleep(1)  # Имя объекта в S3 содержит время в секундах
+        # Новый экземпляр пайплайна - как после перезапуска
+        pipeline = DataPipeline(s3_client, config)
+        employees.drop(columns='bonus').to_csv(source, index=False)
+        result = asyncio.run(pipeline.process_file(source))
+        first = first or result
+
+    assert result['success'] and result['ledger_hit']
+    assert result['copied_from'] == first['s3_path']
+    assert s3_client.objects[result['s3_path']] == s3_client.objects[first['s3_path']]
+    assert result['records_filtered'] == first['records_filtered'] == 2
+
+    # Другие настройки фильтрации - файл обрабатывается заново
+    pipeline = DataPipeline(s3_client, {**config, 'filter_threshold': 40000})
+    employees.drop(columns='bonus').to_csv(source, index=False)
+    assert 'ledger_hit' not in asyncio.run(pipeline.process_file(source))
+
+
+def test_process_file_over_memory_budget_is_chunked(tmp_path, employees):
+    s3_client = FakeS3Client()
+    df = pd.concat([employees.drop(columns='bonus')] * 50, ignore_index=True)
+    df['id'] = range(len(df))
+    outputs, results = {}, {}
+    for budget_mb in (0, 1):
+        config = make_config(tmp_path, memory_budget_mb=budget_mb, jsonl_batch_lines=40,
+                             memory_expansion={'.csv': 10000.0})
+        pipeline = DataPipeline(s3_client, config)
+        source = pipeline.watch_folder / "employees.csv"
+        df.to_csv(source, index=False)
+        result = asyncio.run(pipeline.process_file(source))
+        assert result['success']
+        results[budget_mb] = result
+        outputs[budget_mb] = pd.read_csv(io.BytesIO(s3_client.objects[result['s3_path']]), comment='#')
+
+    assert 'memory' not in results[0]
+    assert results[1]['memory']['mode'] == 'chunked'
+    assert results[1]['salary_stats']['batches'] == 5
+    pd.testing.assert_frame_equal(outputs[0], outputs[1])
+    assert pipeline.admission.utilization()['chunked'] == 1
+
+
+def test_process_existing_files_with_work_claims(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipeline = DataPipeline(s3_client, make_config(tmp_path, work_claims=True, worker_id='worker-1',
+                                                   claim_heartbeat_sec=3600))
+    for name in ('a.csv', 'b.csv'):
+        employees.drop(columns='bonus').to_csv(pipeline.watch_folder / name, index=False)
+
+    asyncio.run(pipeline.process_existing_files())
+    asyncio.run(pipeline.close())
+
+    assert pipeline.claims.stats['claimed'] == 2
+    assert len([key for key in s3_client.objects if key.startswith('processed/')]) == 2
+    assert not list(pipeline.watch_folder.glob('*.csv'))
+    assert not (pipeline.watch_folder / ".claims" / "worker-1").exists()
+
+
+def test_log_shipping_with_two_workers(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipelines = [DataPipeline(s3_client, make_config(tmp_path, work_claims=True, worker_id=worker_id,
+                                                     claim_heartbeat_sec=3600))
+                 for worker_id in ('worker-1', 'worker-2')]
+
+    async def run():
+        for number, pipeline in enumerate(pipelines):
+            for name in (f"a{number}.csv", f"b{number}.csv"):
+                source = pipeline.watch_folder / name
+                employees.to_csv(source, index=False)
+                result = await pipeline.process_file(pipeline.claim_file(source))
+                await pipeline.log_pipeline_result(result)
+                await pipeline.log_shipper.flush()
+        for pipeline in pipelines:
+            await pipeline.close()
+    asyncio.run(run())
+
+    # Части и манифесты обработчиков не перезаписывают друг друга
+    day_folder = f"logs/{pipelines[0].run_log.path_for().stem}"
+    for pipeline in pipelines:
+        worker_id = pipeline.claims.worker_id
+        manifest = json.loads(s3_client.objects[f"{day_folder}/{worker_id}/_manifest.json"])
+        assert manifest['worker_id'] == worker_id and manifest['records'] == 2
+        records = [json.loads(line) for part in manifest['parts']
+                   for line in s3_client.objects[part['key']].decode('utf-8').splitlines()]
+        assert sorted(record['file_name'] for record in records) == sorted(
+            f"{prefix}{pipelines.index(pipeline)}.csv" for prefix in 'ab')
+    assert len({path.name for path in (tmp_path / "logs").rglob('.log_shipper_state*.json')}) == 2
+
+
+def test_shared_stores_with_two_workers(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipelines = [DataPipeline(s3_client, make_config(tmp_path, work_claims=True, worker_id=worker_id,
+                                                     claim_heartbeat_sec=3600, cross_file_dedup=True,
+                                                     archive_layout='daily_tar'))
+                 for worker_id in ('worker-1', 'worker-2')]
+
+    async def run():
+        results = []
+        for number, pipeline in enumerate(pipelines):
+            source = pipeline.watch_folder / f"employees{number}.csv"
+            employees.drop(columns='bonus').to_csv(source, index=False)
+            results.append(await pipeline.process_file(pipeline.claim_file(source)))
+        for pipeline in pipelines:
+            await pipeline.close()
+        return results
+    first, second = asyncio.run(run())
+
+    # Индекс дубликатов общий: второй обработчик видит строки, выгруженные первым
+    assert first['salary_stats']['cross_file_duplicates'] == 0
+    assert second['salary_stats']['cross_file_duplicates'] == first['records_filtered'] > 0
+    # Архив дня у каждого обработчика свой
+    assert sorted(path.name.split('.')[1] for path in (tmp_path / "processed" / "archive").glob('*.tar')) == [
+        'worker-1', 'worker-2']
+
+
+def test_partition_manifest_merges_workers(tmp_path, employees):
+    s3_client = FakeS3Client()
+    pipelines = [DataPipeline(s3_client, make_config(tmp_path, work_claims=True, worker_id=worker_id,
+                                                     claim_heartbeat_sec=3600, partition_by=['age'],
+                                                     filter_threshold=45000,
+                                                     processed_folder=str(tmp_path / worker_id)))
+                 for worker_id in ('worker-1', 'worker-2')]
+
+    async def run():
+        results = []
+        for number, pipeline in enumerate(pipelines):
+            source = pipeline.watch_folder / f"employees{number}.csv"
+            employees.drop(columns='bonus').to_csv(source, index=False)
+            results.append(await pipeline.process_file(pipeline.claim_file(source)))
+        for pipeline in pipelines:
+            await pipeline.close()
+        return results
+    first, second = asyncio.run(run())
+
+    # Второй обработчик (на другом узле) дополняет манифест первого, а не перезаписывает его
+    assert first['s3_path'] == second['s3_path']
+    manifest = json.loads(s3_client.objects[second['s3_path']])
+    assert sum(p['rows'] for p in manifest['partitions'].values()) == 6
+    assert {f['source_file'] for p in manifest['partitions'].values() for f in p['files']} == {
+        'employees0.csv', 'employees1.csv'}
+
+
+def test_dedup_index_shared_between_workers(tmp_path):
+    from dedup_index import RowHashIndex
+
+    folder = tmp_path / "dedup"
+    first, second = [RowHashIndex(str(folder), retention_days=100000, shared=True) for _ in range(2)]
+    first.commit(np.arange(10, dtype=np.uint64))
+    assert second.contains(np.array([5, 10], dtype=np.uint64)).tolist() == [True, False]
+
+    # Слияние сегментов другим обработчиком не теряет хешей
+    second.commit(np.arange(10, 20, dtype=np.uint64))
+    for number, segment in enumerate(sorted(folder.glob("row_hashes_*.npy"))):
+        segment.rename(folder / f"row_hashes_2000-01-01_{number}.npy")
+    RowHashIndex(str(folder), retention_days=100000, shared=True)
+    assert len(list(folder.glob("row_hashes_*.npy"))) == 1
+    assert first.contains(np.array([0, 19, 20], dtype=np.uint64)).tolist() == [True, True, False]
+
+
+def test_dedup_index_expires_days_while_running(tmp_path, monkeypatch):
+    import dedup_index
+    from dedup_index import RowHashIndex
+
+    class FakeDatetime(datetime):
+        current = datetime(2026, 1, 1, 12)
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current
+
+    monkeypatch.setattr(dedup_index, 'datetime', FakeDatetime)
+    folder = tmp_path / "dedup"
+    index = RowHashIndex(str(folder), retention_days=2)
+    index.commit(np.arange(10, dtype=np.uint64))
+
+    FakeDatetime.current = datetime(2026, 1, 2, 12)
+    index.commit(np.arange(10, 20, dtype=np.uint64))
+    assert index.contains(np.array([0, 15], dtype=np.uint64)).tolist() == [True, True]
+
+    # Через срок хранения хеши первого дня больше не считаются дубликатами
+    FakeDatetime.current = datetime(2026, 1, 4, 12)
+    assert index.contains(np.array([0, 15], dtype=np.uint64)).tolist() == [False, True]
+    assert list(index._days) == ['2026-01-02']
+    assert [path.name[len("row_hashes_"):][:10] for path in folder.glob("row_hashes_*.npy")] == ['2026-01-02']
+
+
+def test_dedup_index_appends_segments(tmp_path):
+    from dedup_index import RowHashIndex
+
+    folder = tmp_path / "dedup"
+    index = RowHashIndex(str(folder))
+    for start in range(0, 40, 10):
+        index.commit(np.arange(start, start + 10, dtype=np.uint64))
+    assert len(list(folder.glob("row_hashes_*.npy"))) == 4
+    assert len(index._days[next(iter(index._days))]) < 4  # Сегменты в памяти слиты
+    assert index.contains(np.array([0, 25, 39, 40], dtype=np.uint64)).tolist() == [True, True, True, False]
+
+    # Сегменты прошедшего дня сливаются при загрузке
+    for number, segment in enumerate(sorted(folder.glob("row_hashes_*.npy"))):
+        segment.rename(folder / f"row_hashes_2000-01-01_{number}.npy")
+    reloaded = RowHashIndex(str(folder), retention_days=100000)
+    assert len(list(folder.glob("row_hashes_*.npy"))) == 1
+    assert len(reloaded) == 40
+
+
+@pytest.mark.parametrize('on_match', ['skip', 'copy'])
+def test_ledger_reprocesses_when_result_is_gone(tmp_path, employees, on_match):
+    s3_client = FakeS3Client()
+    config = make_config(tmp_path, ledger_path=str(tmp_path / "ledger.sqlite"), ledger_on_match=on_match)
+    source = tmp_path / "incoming" / "employees.csv"
+
+    pipeline = DataPipeline(s3_client, config)
+    employees.drop(columns='bonus').to_csv(source, index=False)
+    first = asyncio.run(pipeline.process_file(source))
+    # Результат удален из S3 (например, компактизацией)
+    s3_client.objects.pop(first['s3_path'])
+
+    time.sleep(1)
+    employees.drop(columns='bonus').to_csv(source, index=False)
+    result = asyncio.run(pipeline.process_file(source))
+
+    assert result['success'] and 'ledger_hit' not in result
+    assert result['s3_path'] in s3_client.objects
+    rows = pipeline.ledger._conn.execute("SELECT s3_path FROM processed_files").fetchall()
+    assert [row['s3_path'] for row in rows] == [result['s3_path']]
+
+
+def test_ledger_copy_mode_skips_micro_batch_results(tmp_path, employees):
+    s3_client = FakeS3Client()
+    config = make_config(tmp_path, micro_batch=True, micro_batch_window_sec=3600,
+                         ledger_path=str(tmp_path / "ledger.sqlite"), ledger_on_match='copy')
+    pipeline = DataPipeline(s3_client, config)
+    df = employees.drop(columns='bonus')
+    for i in range(2):
+        df.iloc[[i + 1]].to_csv(pipeline.watch_folder / f"small_{i}.csv", index=False)
+        asyncio.run(pipeline.process_file(pipeline.watch_folder / f"small_{i}.csv"))
+    batch_path = asyncio.run(pipeline.flush_micro_batch(force=True))[0]['s3_path']
+
+    source = pipeline.watch_folder / "small_0.csv"
+    df.iloc[[1]].to_csv(source, index=False)
+    result = asyncio.run(pipeline.process_file(source))
+
+    # Копия пакета содержала бы строки small_1.csv
+    assert result['ledger_hit'] and 'copied_from' not in result
+    assert result['s3_path'] == batch_path
+    assert list(s3_client.objects) == [batch_path]
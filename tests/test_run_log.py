@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from run_log import RunLogWriter, export_json_array, read_run_log
+
+
+def test_run_log_appends_and_exports(tmp_path):
+    writer = RunLogWriter(tmp_path, fsync=True, fsync_interval=0)
+    entries = [{'file_name': f"file_{i}.csv", 'success': True, 'records_filtered': i} for i in range(3)]
+    for entry in entries:
+        writer.write(entry)
+    writer.flush()
+    path = writer.path_for()
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 3
+
+    writer.write({'file_name': 'Зарплаты.csv', 'success': False})
+    writer.close()
+    # Неполная строка после сбоя пропускается при чтении
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"file_name": "обрыв')
+
+    entries.append({'file_name': 'Зарплаты.csv', 'success': False})
+    assert list(read_run_log(path)) == entries
+
+    # Экспорт совпадает с прежним форматом журнала (json.dump с indent=2)
+    exported = tmp_path / "pipeline_log.json"
+    assert export_json_array(path, exported) == 4
+    assert exported.read_text(encoding='utf-8') == json.dumps(entries, ensure_ascii=False, indent=2)
+    assert list(read_run_log(exported)) == entries
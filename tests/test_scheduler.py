@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from scheduler import FileScheduler
+
+
+def make_files(folder, sizes):
+    """Файлы с заданными размерами и возрастающим mtime в порядке перечисления."""
+    paths = []
+    for number, (name, size) in enumerate(sizes.items()):
+        path = folder / name
+        path.write_bytes(b'x' * size)
+        os.utime(path, (1000 + number, 1000 + number))
+        paths.append(path)
+    return paths
+
+
+def drain(scheduler):
+    names = []
+    while (path := scheduler.pop()) is not None:
+        names.append(path.name)
+    return names
+
+
+def test_policies(tmp_path):
+    paths = make_files(tmp_path, {'bulk.csv': 5000, 'small.csv': 10, 'medium.csv': 500})
+
+    fifo = FileScheduler('fifo')
+    fifo.extend(reversed(paths))
+    assert drain(fifo) == ['bulk.csv', 'small.csv', 'medium.csv']
+
+    sjf = FileScheduler('sjf')
+    sjf.extend(paths)
+    assert drain(sjf) == ['small.csv', 'medium.csv', 'bulk.csv']
+
+    custom = FileScheduler(lambda entry: entry['path'].name)
+    custom.extend(paths)
+    assert drain(custom) == ['bulk.csv', 'medium.csv', 'small.csv']
+
+    with pytest.raises(ValueError):
+        FileScheduler('lifo')
+
+
+def test_source_priority_and_duplicates(tmp_path):
+    paths = make_files(tmp_path, {'history_2019.csv': 10, 'ops_1.csv': 5000, 'export.csv': 100})
+    scheduler = FileScheduler('sjf', sources={'ops_*': 10, 'history_*': -5})
+
+    assert scheduler.extend(paths) == 3
+    assert not scheduler.add(paths[0])
+    assert scheduler.metrics()['depth_by_source'] == {'history_*': 1, 'ops_*': 1, 'default': 1}
+    assert drain(scheduler) == ['ops_1.csv', 'export.csv', 'history_2019.csv']
+
+
+def test_aging_prevents_starvation(tmp_path):
+    bulk, small = make_files(tmp_path, {'bulk.csv': 5000, 'small.csv': 10})
+    scheduler = FileScheduler('sjf', aging_sec=60)
+    scheduler.add(bulk)
+    # Большой файл ждет дольше одного периода старения
+    scheduler._entries[str(bulk.resolve())]['enqueued_at'] -= 90
+    scheduler.add(small)
+
+    assert drain(scheduler) == ['bulk.csv', 'small.csv']
+    metrics = scheduler.metrics()
+    assert metrics['depth'] == 0 and metrics['dispatched'] == {'default': 2}
+    assert metrics['wait_sec']['default']['max'] >= 90
+
+
+def test_get_waits_for_files_and_close(tmp_path):
+    path, = make_files(tmp_path, {'late.csv': 10})
+    scheduler = FileScheduler()
+
+    async def run():
+        consumer = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not consumer.done()
+        scheduler.add(path)
+        first = await consumer
+        scheduler.close()
+        return first, await scheduler.get()
+
+    started = time.monotonic()
+    assert asyncio.run(run()) == (path, None)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import sys
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from work_claims import WorkClaims
+
+
+def make_worker(incoming, worker_id, **kwargs):
+    claims = WorkClaims(incoming, worker_id=worker_id, lease_sec=30, heartbeat_sec=3600, **kwargs)
+    claims.start()
+    return claims
+
+
+def claim_all(incoming, worker_id, names, results):
+    claims = WorkClaims(incoming, worker_id=worker_id, heartbeat_sec=3600)
+    claims.start()
+    results.extend([(worker_id, name) for name in names if claims.claim(incoming / name) is not None])
+    claims.close(release=False)
+
+
+def test_claim_is_exclusive(tmp_path):
+    source = tmp_path / "employees.csv"
+    source.write_text("id,salary\n1,60000\n")
+    first, second = make_worker(tmp_path, 'a'), make_worker(tmp_path, 'b')
+
+    claimed = first.claim(source)
+    assert claimed == tmp_path / ".claims" / "a" / "employees.csv"
+    assert second.claim(source) is None
+    assert (first.stats['claimed'], second.stats['lost']) == (1, 1)
+
+    # Необработанный файл при остановке возвращается в incoming
+    first.close()
+    second.close()
+    assert source.exists() and not (tmp_path / ".claims" / "a").exists()
+
+
+def test_processes_split_files_without_duplicates(tmp_path):
+    names = [f"file_{i:03d}.csv" for i in range(60)]
+    for name in names:
+        (tmp_path / name).write_text("id\n1\n")
+
+    with multiprocessing.Manager() as manager:
+        results = manager.list()
+        workers = [multiprocessing.Process(target=claim_all, args=(tmp_path, f"w{i}", names, results))
+                   for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results = list(results)
+
+    assert sorted(name for _, name in results) == names
+    assert sum(len(list((tmp_path / ".claims" / f"w{i}").glob('*.csv'))) for i in range(4)) == 60
+
+
+def test_expired_claims_are_recovered(tmp_path):
+    crashed = make_worker(tmp_path, 'crashed')
+    (tmp_path / "a.csv").write_text("id\n1\n")
+    (tmp_path / "b.csv").write_text("id\n2\n")
+    crashed.claim(tmp_path / "a.csv")
+    crashed.claim(tmp_path / "b.csv")
+    # Тот же файл снова появился в incoming: возвращенный получает суффикс
+    (tmp_path / "b.csv").write_text("id\n3\n")
+    crashed.close(release=False)
+
+    survivor = make_worker(tmp_path, 'survivor')
+    assert survivor.recover_expired(now=100.0) == []  # Первое наблюдение heartbeat
+    assert survivor.recover_expired(now=120.0) == []  # Аренда еще не истекла
+
+    recovered = survivor.recover_expired(now=131.0)
+    assert sorted(path.name for path in recovered) == ['a.csv', 'b.survivor.csv']
+    assert (tmp_path / "b.csv").read_text() == "id\n3\n"
+    assert not (tmp_path / ".claims" / "crashed").exists()
+    assert survivor.stats['recovered'] == 2
+    survivor.close()
+
+
+def test_heartbeat_renews_lease(tmp_path):
+    worker = make_worker(tmp_path, 'alive')
+    observer = make_worker(tmp_path, 'observer')
+
+    observer.recover_expired(now=0.0)
+    worker._write_heartbeat()
+    assert not observer.is_expired(worker.worker_dir, now=40.0)
+    assert not observer.is_expired(worker.worker_dir, now=60.0)
+    assert observer.is_expired(worker.worker_dir, now=70.0)
+    worker.close()
+    observer.close()
+
+
+def test_restart_with_same_worker_id_returns_leftovers(tmp_path):
+    source = tmp_path / "employees.csv"
+    source.write_text("id\n1\n")
+    worker = make_worker(tmp_path, 'node-1')
+    worker.claim(source)
+    worker.close(release=False)
+
+    restarted = make_worker(tmp_path, 'node-1')
+    assert source.exists()
+    assert restarted.claimed() == []
+    restarted.close()